@@ -0,0 +1,135 @@
+# Benchmark of the built-in Smith-Waterman engine (sw_engine.py)                                      #
+# Usage: python benchmarks/sw_engine_benchmark.py [<queries_num> <subjects_num> [<FASTA file>]]       #
+# Measures the cell updates per second (GCUPS) of the batched kernel (compute_scores) and of a scalar #
+# kernel (one pair at a time, the same recurrences), and checks that their scores are identical and   #
+# match Biopython's aligner on a sample of the pairs. The sequences are random (with the background   #
+# frequencies of the residues, 50-500 residues) unless a FASTA file is given.                         #
+# The results are in sw_engine_benchmark.txt.                                                         #
+#######################################################################################################
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import numba
+from Bio import Align
+from Bio.Align import substitution_matrices
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import clans.similarity_search.engines.sw_engine as sw
+import clans.similarity_search.engines.search_engine as se
+
+matrix_name = 'BLOSUM62'
+residue_frequencies = {'A': 0.074, 'R': 0.052, 'N': 0.045, 'D': 0.054, 'C': 0.025, 'Q': 0.034, 'E': 0.054,
+                       'G': 0.074, 'H': 0.026, 'I': 0.068, 'L': 0.099, 'K': 0.058, 'M': 0.025, 'F': 0.047,
+                       'P': 0.039, 'S': 0.057, 'T': 0.051, 'W': 0.013, 'Y': 0.032, 'V': 0.073}
+checked_pairs_num = 20
+
+
+# The score of the best local alignment of two sequences (by their profile and residues), one cell at a time
+@numba.njit(nogil=True)
+def align_pair(profile, subject, gap_open, gap_extend):
+    gap_first = gap_open + gap_extend
+    h_row = np.zeros(profile.shape[0] + 1, dtype=np.int32)
+    e_row = np.zeros(profile.shape[0] + 1, dtype=np.int32)
+    best_score = 0
+    for j in range(subject.shape[0]):
+        h_diagonal = 0
+        f = 0
+        for i in range(1, profile.shape[0] + 1):
+            e = max(e_row[i] - gap_extend, h_row[i] - gap_first)
+            f = max(f - gap_extend, h_row[i - 1] - gap_first)
+            h = max(max(h_diagonal + profile[i - 1, subject[j]], 0), max(e, f))
+            h_diagonal = h_row[i]
+            h_row[i] = h
+            e_row[i] = e
+            best_score = max(best_score, h)
+    return best_score
+
+
+@numba.njit(parallel=True)
+def compute_scalar_scores(profiles, query_starts, query_ends, residues, subject_starts, subject_ends, gap_open,
+                          gap_extend, scores):
+    subjects_num = subject_starts.shape[0]
+    for pair in numba.prange(scores.shape[0] * subjects_num):
+        query = pair // subjects_num
+        subject = pair % subjects_num
+        scores[query, subject] = align_pair(profiles[query_starts[query]:query_ends[query]],
+                                            residues[subject_starts[subject]:subject_ends[subject]], gap_open,
+                                            gap_extend)
+
+
+def write_random_fasta(file_path, sequences_num):
+    rng = np.random.default_rng(0)
+    letters = np.array(list(residue_frequencies.keys()))
+    frequencies = np.array(list(residue_frequencies.values()))
+    with open(file_path, 'w') as output:
+        for index in range(sequences_num):
+            sequence = rng.choice(letters, size=rng.integers(50, 501), p=frequencies / frequencies.sum())
+            output.write('>' + str(index) + '\n' + ''.join(sequence) + '\n')
+
+
+def main():
+    queries_num = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    subjects_num = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    matrix = substitution_matrices.load(matrix_name)
+    gap_open, gap_extend = se.get_gap_penalties(matrix_name)
+    if len(sys.argv) > 3:
+        names, residues, starts, ends = sw.read_sequences([sys.argv[3]], matrix.alphabet)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fasta_path = os.path.join(temp_dir, 'random.fasta')
+            write_random_fasta(fasta_path, subjects_num)
+            names, residues, starts, ends = sw.read_sequences([fasta_path], matrix.alphabet)
+    starts = starts[:subjects_num]
+    ends = ends[:subjects_num]
+    queries_num = min(queries_num, starts.shape[0])
+
+    matrix_scores = np.full((len(matrix.alphabet) + 1, len(matrix.alphabet) + 1), sw.padding_score, dtype=np.int32)
+    matrix_scores[:-1, :-1] = np.asarray(matrix, dtype=np.int32)
+    profiles = matrix_scores[residues]
+    batches, batch_starts, order = sw.make_batches(residues, starts, ends, len(matrix.alphabet))
+    cells_num = float(np.sum(ends[:queries_num] - starts[:queries_num])) * float(np.sum(ends - starts))
+    print("{} queries x {} subjects ({:.3g} cells), {} lanes, {} threads".format(
+        queries_num, starts.shape[0], cells_num, sw.lanes_num, numba.get_num_threads()))
+
+    # Compile both kernels first (on one query)
+    batched_scores = np.empty((queries_num, (batch_starts.shape[0] - 1) * sw.lanes_num), dtype=np.int32)
+    sw.compute_scores(profiles, starts, ends, 0, batches, batch_starts, np.int32(gap_open), np.int32(gap_extend),
+                      batched_scores[:1])
+    scalar_scores = np.empty((queries_num, starts.shape[0]), dtype=np.int32)
+    compute_scalar_scores(profiles, starts, ends, residues, starts, ends, np.int32(gap_open), np.int32(gap_extend),
+                          scalar_scores[:1])
+
+    before = time.process_time()
+    sw.compute_scores(profiles, starts, ends, 0, batches, batch_starts, np.int32(gap_open), np.int32(gap_extend),
+                      batched_scores)
+    batched_time = time.process_time() - before
+    print("Batched kernel: {:.2f} seconds (CPU), {:.3f} GCUPS per core".format(
+        batched_time, cells_num / batched_time / 1e9))
+
+    before = time.process_time()
+    compute_scalar_scores(profiles, starts, ends, residues, starts, ends, np.int32(gap_open), np.int32(gap_extend),
+                          scalar_scores)
+    scalar_time = time.process_time() - before
+    print("Scalar kernel: {:.2f} seconds (CPU), {:.3f} GCUPS per core (the batched kernel is {:.1f}x faster)".format(
+        scalar_time, cells_num / scalar_time / 1e9, scalar_time / batched_time))
+
+    # The scores of the two kernels, and a sample of them with Biopython's aligner
+    scores = np.empty((queries_num, starts.shape[0]), dtype=np.int32)
+    scores[:, order] = batched_scores[:, :starts.shape[0]]
+    assert np.array_equal(scores, scalar_scores), "The kernels' scores differ"
+    aligner = Align.PairwiseAligner(mode='local', substitution_matrix=matrix, open_gap_score=-(gap_open + gap_extend),
+                                    extend_gap_score=-gap_extend)
+    sequences = [''.join(matrix.alphabet[code] for code in residues[start:end]) for start, end in zip(starts, ends)]
+    rng = np.random.default_rng(1)
+    for i in range(checked_pairs_num):
+        query = rng.integers(queries_num)
+        subject = rng.integers(starts.shape[0])
+        assert scores[query, subject] == aligner.score(sequences[query], sequences[subject]), \
+            "The score of the pair " + str((query, subject)) + " differs from Biopython's"
+    print("The scores of the kernels are identical, and " + str(checked_pairs_num) + " of them match Biopython's")
+
+
+if __name__ == '__main__':
+    main()
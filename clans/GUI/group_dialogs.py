@@ -2,6 +2,7 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 import clans.config as cfg
 import clans.data.groups as gr
+import clans.data.sequences as seq
 
 
 class AddToGroupDialog(QDialog):
@@ -509,7 +510,7 @@ class EditGroupDialog(QDialog):
         self.sorted_seq_list = sorted(cfg.groups_dict[group_ID]['seqIDs'])
 
         for i in range(len(self.sorted_seq_list)):
-            name_str = str(self.sorted_seq_list[i]) + "  " + cfg.sequences_array['seq_title'][self.sorted_seq_list[i]][1:]
+            name_str = str(self.sorted_seq_list[i]) + "  " + seq.get_title(self.sorted_seq_list[i])[1:]
             item = QListWidgetItem(name_str)
             self.members_list.insertItem(i, item)
 
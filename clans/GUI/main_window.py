@@ -101,12 +101,24 @@ class MainWindow(QMainWindow):
         self.load_mini_clans_file_action = QAction("Minimal CLANS (without sequences)", self)
         self.load_mini_clans_file_action.triggered.connect(self.load_mini_clans_file)
 
+        self.load_binary_clans_file_action = QAction("Binary CLANS (fast)", self)
+        self.load_binary_clans_file_action.triggered.connect(self.load_binary_clans_file)
+
+        self.load_clans_project_action = QAction("CLANS project (directory, for very large maps)", self)
+        self.load_clans_project_action.triggered.connect(self.load_clans_project)
+
         self.load_delimited_file_action = QAction("Tab-delimited format", self)
         self.load_delimited_file_action.triggered.connect(self.load_delimited_file)
 
+        self.load_m8_file_action = QAction("Tabular search results (BLAST/MMseqs2/DIAMOND m8)", self)
+        self.load_m8_file_action.triggered.connect(self.load_m8_file)
+
         self.load_clans_file_sumenu.addAction(self.load_clans_file_action)
         self.load_clans_file_sumenu.addAction(self.load_mini_clans_file_action)
+        self.load_clans_file_sumenu.addAction(self.load_binary_clans_file_action)
+        self.load_clans_file_sumenu.addAction(self.load_clans_project_action)
         self.load_file_submenu.addAction(self.load_delimited_file_action)
+        self.load_file_submenu.addAction(self.load_m8_file_action)
 
         self.save_file_submenu = self.file_menu.addMenu("Save to file")
         self.save_clans_submenu = self.save_file_submenu.addMenu("CLANS format")
@@ -117,11 +129,19 @@ class MainWindow(QMainWindow):
         self.save_mini_clans_file_action = QAction("Minimal CLANS (without sequences)", self)
         self.save_mini_clans_file_action.triggered.connect(self.save_mini_clans_file)
 
+        self.save_binary_clans_file_action = QAction("Binary CLANS (fast)", self)
+        self.save_binary_clans_file_action.triggered.connect(self.save_binary_clans_file)
+
+        self.save_clans_project_action = QAction("CLANS project (directory, for very large maps)", self)
+        self.save_clans_project_action.triggered.connect(self.save_clans_project)
+
         self.save_delimited_file_action = QAction("Tab-delimited format", self)
         self.save_delimited_file_action.triggered.connect(self.save_delimited_file)
 
         self.save_clans_submenu.addAction(self.save_clans_file_action)
         self.save_clans_submenu.addAction(self.save_mini_clans_file_action)
+        self.save_clans_submenu.addAction(self.save_binary_clans_file_action)
+        self.save_clans_submenu.addAction(self.save_clans_project_action)
         self.save_file_submenu.addAction(self.save_delimited_file_action)
 
         self.save_image_action = QAction("Save as image", self)
@@ -491,10 +511,11 @@ class MainWindow(QMainWindow):
 
         # Reset global variables
         cfg.groups_dict = {}
-        cfg.similarity_values_list = []
-        cfg.similarity_values_mtx = []
-        cfg.attraction_values_mtx = []
-        cfg.connected_sequences_mtx = []
+        cfg.pairs_source = None
+        cfg.edges_indices = np.empty((0, 2), dtype=np.int32)
+        cfg.edges_minus_log_evalues = np.empty(0, dtype=np.float32)
+        cfg.edges_att_values = np.empty(0, dtype=np.uint16)
+        cfg.edges_connected = np.empty(0, dtype=bool)
         cfg.connected_sequences_list = []
         cfg.att_values_for_connected_list = []
         cfg.connected_sequences_list_subset = []
@@ -667,6 +688,52 @@ class MainWindow(QMainWindow):
             self.load_file_worker = io.ReadInputWorker(cfg.run_params['input_file_format'])
             self.load_input_file()
 
+    def load_binary_clans_file(self):
+
+        opened_file, _ = QFileDialog.getOpenFileName(self, "Open file", "", "Binary Clans files (*.clansb)")
+
+        if opened_file:
+            print("Loading " + opened_file)
+            cfg.run_params['input_file'] = opened_file
+            cfg.run_params['input_file_format'] = 'clans_binary'
+            self.setWindowTitle("CLANS " + str(self.view_in_dimensions_num) + "D-View")
+
+            # Bring the controls to their initial state
+            self.reset_window()
+
+            # Clear the canvas
+            self.network_plot.reset_data(self.view)
+
+            # Initialize all the global data-structures
+            self.reset_variables()
+
+            # Define a runner for loading the file that will be executed in a different thread
+            self.load_file_worker = io.ReadInputWorker(cfg.run_params['input_file_format'])
+            self.load_input_file()
+
+    def load_clans_project(self):
+
+        opened_dir = QFileDialog.getExistingDirectory(self, "Open project")
+
+        if opened_dir:
+            print("Loading " + opened_dir)
+            cfg.run_params['input_file'] = opened_dir
+            cfg.run_params['input_file_format'] = 'clans_project'
+            self.setWindowTitle("CLANS " + str(self.view_in_dimensions_num) + "D-View")
+
+            # Bring the controls to their initial state
+            self.reset_window()
+
+            # Clear the canvas
+            self.network_plot.reset_data(self.view)
+
+            # Initialize all the global data-structures
+            self.reset_variables()
+
+            # Define a runner for loading the file that will be executed in a different thread
+            self.load_file_worker = io.ReadInputWorker(cfg.run_params['input_file_format'])
+            self.load_input_file()
+
     def load_delimited_file(self):
 
         #opened_file, _ = QFileDialog.getOpenFileName(self, "Open file", "", "Text files (*.txt);;" "All files (*.*)",)
@@ -691,6 +758,29 @@ class MainWindow(QMainWindow):
             self.load_file_worker = io.ReadInputWorker(cfg.run_params['input_file_format'])
             self.load_input_file()
 
+    def load_m8_file(self):
+
+        opened_file, _ = QFileDialog.getOpenFileName(self, "Open file", "", "All files (*.*)")
+
+        if opened_file:
+            print("Loading " + opened_file)
+            cfg.run_params['input_file'] = opened_file
+            cfg.run_params['input_file_format'] = 'm8'
+            self.setWindowTitle("CLANS " + str(self.view_in_dimensions_num) + "D-View")
+
+            # Bring the controls to their initial state
+            self.reset_window()
+
+            # Clear the canvas
+            self.network_plot.reset_data(self.view)
+
+            # Initialize all the global data-structures
+            self.reset_variables()
+
+            # Define a runner for loading the file that will be executed in a different thread
+            self.load_file_worker = io.ReadInputWorker(cfg.run_params['input_file_format'])
+            self.load_input_file()
+
     def run_calc(self):
 
         # Full data mode
@@ -1001,6 +1091,22 @@ class MainWindow(QMainWindow):
             file_object = io.FileHandler('mini_clans')
             file_object.write_file(saved_file, True)
 
+    # Save a binary clans file (fast saving and loading of large maps)
+    def save_binary_clans_file(self):
+        saved_file, _ = QFileDialog.getSaveFileName()
+
+        if saved_file:
+            file_object = io.FileHandler('clans_binary')
+            file_object.write_file(saved_file, True)
+
+    # Save a CLANS project directory (saving to the loaded project updates its coordinates and groups in place)
+    def save_clans_project(self):
+        saved_dir = QFileDialog.getExistingDirectory(self, "Save project")
+
+        if saved_dir:
+            file_object = io.FileHandler('clans_project')
+            file_object.write_file(saved_dir, True)
+
     def save_delimited_file(self):
 
         saved_file, _ = QFileDialog.getSaveFileName()
@@ -1,6 +1,7 @@
 from PyQt5.QtWidgets import *
 import re
 import clans.config as cfg
+import clans.data.sequences as seq
 
 
 class SelectedSeqWindow(QWidget):
@@ -94,7 +95,7 @@ class SelectedSeqWindow(QWidget):
         if len(self.sorted_seq_indices) > 0:
             for i in range(len(self.sorted_seq_indices)):
                 seq_index = self.sorted_seq_indices[i]
-                seq_title = cfg.sequences_array[seq_index]['seq_title'][0:]
+                seq_title = seq.get_title(seq_index)
 
                 # The sequence header is the same as the index -> display only once
                 if str(seq_index) == seq_title:
@@ -237,7 +238,7 @@ class SelectedSeqWindow(QWidget):
 
                 i = 0
                 for seq_index in self.sorted_seq_indices:
-                    seq_title = cfg.sequences_array[seq_index]['seq_title']
+                    seq_title = seq.get_title(seq_index)
 
                     if is_case_sensitive:
                         m = re.search(text, seq_title)
@@ -388,8 +389,9 @@ class SearchResultsWindow(QWidget):
     def find_in_data(self, text, is_case_sensitive):
 
         i = 0
+        titles = seq.get_titles(range(cfg.run_params['total_sequences_num']))
         for seq_index in range(cfg.run_params['total_sequences_num']):
-            seq_title = cfg.sequences_array[seq_index]['seq_title']
+            seq_title = titles[seq_index]
 
             if is_case_sensitive:
                 m = re.search(text, seq_title)
@@ -7,8 +7,33 @@ input_format = 'clans'
 output_format = 'clans'
 
 # Blast-related default parameters
+# The similarity-search engine: 'blast' (BLAST+), 'mmseqs' (MMseqs2), 'diamond' (DIAMOND) or 'sw' (the built-in
+# Smith-Waterman search)
+search_engine = 'blast'
 BLAST_Evalue_cutoff = 1.0
 BLAST_scoring_matrix = 'BLOSUM62'
+# The all-against-all search is split into query chunks which run as concurrent blastp processes: the total number of
+# cores for all the processes (0 = the number of CPUs) and the number of threads of each process
+BLAST_cores = 0
+BLAST_job_threads = 4
+# Triangular search: each query chunk is searched only against its own and the following chunks (each pair once), with
+# an optional reciprocal search of the borderline pairs (in the other direction)
+BLAST_triangular = False
+BLAST_reciprocal = False
+# A directory for the persistent cache of the search results (None = no cache): the sequences which were already
+# searched (with the same parameters) are not searched again
+BLAST_cache_dir = None
+# The k-mer prefilter: only the candidate pairs (sequences with similar MinHash sketches of their k-mers) are searched.
+# The k-mers are taken by a spaced-seed pattern ('1' = a used position) and the sketches are compared in bands of rows
+# (see prefilter.py, and the help of --prefilter for the recall of homologs and the number of candidates).
+prefilter = False
+prefilter_pattern = '11011011'
+prefilter_bands = 1024
+prefilter_rows = 1
+# Collapse the identical and nearly identical sequences (with at least this identity) into representatives, which are
+# searched and laid out, and expand them back before writing the output (see redundancy.py)
+collapse_redundant = False
+collapse_identity = 0.95
 
 # Clustering parameters defaults
 similarity_cutoff = 1e-4
@@ -27,6 +52,30 @@ layouts = {'FR':
                      'dampening': 0.2,
                      'gravity': 1.0}}}
 
+# The internal order of the sequences in the layout calculation (for better memory locality):
+# 'none' = file order, 'rcm' = reverse Cuthill-McKee on the connections graph, 'morton' = Z-order curve on the coordinates
+node_ordering = 'none'
+node_ordering_interval = 100  # Number of rounds between recalculations of the 'morton' order
+
+# Landmark layout (for quick previews of large datasets): the number of landmark sequences to lay out with FR
+# before interpolating the rest (0 = off), and the number of global FR rounds to refine the result with
+landmarks_num = 0
+landmark_refine_rounds = 0
+
+# Sharded layout: the number of worker processes (0 = off), the coordinator's address ('host:port', port 0 = any free
+# port) and the number of grid cells per dimension used to summarize the other shards in the far-field repulsion
+shards_num = 0
+shard_address = 'localhost:0'
+shard_cells_per_dim = 8
+
+# Out-of-core layout: stream the connected edges from the memory-mapped input (clans-binary / clans-project) through
+# the attraction calculation (for edge sets which don't fit in memory), in chunks of this number of edges
+stream_edges = False
+edge_chunk_size = 1 << 22
+
+# Number of threads for parsing large input files in parallel (0 = the number of CPUs)
+parse_threads = 0
+
 ## Running parameters
 run_params = {  # a dict to hold all the running parameters (given by the user / defaults) - filled by parser.py
     'is_problem': False,
@@ -46,22 +95,54 @@ run_params = {  # a dict to hold all the running parameters (given by the user /
     'rep_val': layouts['FR']['params']['rep_val'],
     'rep_exp': layouts['FR']['params']['rep_exp'],
     'dampening': layouts['FR']['params']['dampening'],
-    'gravity': layouts['FR']['params']['gravity']
+    'gravity': layouts['FR']['params']['gravity'],
+    'node_ordering': node_ordering,
+    'node_ordering_interval': node_ordering_interval,
+    'landmarks_num': landmarks_num,
+    'landmark_refine_rounds': landmark_refine_rounds,
+    'shards_num': shards_num,
+    'shard_address': shard_address,
+    'is_shard_remote': False,
+    'shard_cells_per_dim': shard_cells_per_dim,
+    'stream_edges': stream_edges,
+    'edge_chunk_size': edge_chunk_size,
+    'parse_threads': parse_threads,
+    'search_engine': search_engine,
+    'blast_cores': BLAST_cores,
+    'blast_job_threads': BLAST_job_threads,
+    'blast_triangular': BLAST_triangular,
+    'blast_reciprocal': BLAST_reciprocal,
+    'blast_cache': BLAST_cache_dir,
+    'prefilter': prefilter,
+    'prefilter_pattern': prefilter_pattern,
+    'prefilter_bands': prefilter_bands,
+    'prefilter_rows': prefilter_rows,
+    'prefilter_recall': False,
+    'collapse_redundant': collapse_redundant,
+    'collapse_identity': collapse_identity,
+    'sequences_file': None
 }
 
 ## Data-related variables
 
-# a NumPy 1D structured array with the following fields:
-# 'seq_title', 'sequence', 'x_coordinate', 'y_coordinate', 'z_coordinate', 'in_group', 'in_subset'
+# a NumPy 1D structured array (a compact numeric table) with the following fields:
+# 'x_coordinate', 'y_coordinate', 'z_coordinate', 'in_group', 'in_subset'
 # 'in_group' = group index. In case there is no group assignment, 'in_group' = -1
 # 'in_subset' is a boolean flag, stating whether the index is found in the selected subset or not (False by default)
 # the subset coordinates are used to save the subset new coordinates in case it was clustered separately.
 # They are initialized with the whole dataset coordinates at the beginning and whenever the view returns to full dataset.
-seq_dt = np.dtype([('seq_title', 'U300'), ('sequence', 'U3000'), ('x_coor', 'float32'), ('y_coor', 'float32'),
-                   ('z_coor', 'float32'), ('in_group', 'int16'), ('in_subset', 'bool'),
-                   ('x_coor_subset', 'float32'), ('y_coor_subset', 'float32'), ('z_coor_subset', 'float32')])
+seq_dt = np.dtype([('x_coor', 'float32'), ('y_coor', 'float32'), ('z_coor', 'float32'), ('in_group', 'int16'),
+                   ('in_subset', 'bool'), ('x_coor_subset', 'float32'), ('y_coor_subset', 'float32'),
+                   ('z_coor_subset', 'float32')])
 sequences_array = np.empty(run_params['total_sequences_num'], dtype=seq_dt)
 
+# The titles and the sequences (residues), each in a string_pool.StringPool (one UTF-8 buffer with the offsets of
+# the strings), in the order of sequences_array. The strings are decoded only when needed (the layout never looks at
+# them) and are not truncated. Filled by sequences.create_sequences_array_from_columns() and read through the
+# sequences.get_title(s) / get_sequence(s) helpers.
+titles_pool = None
+sequences_pool = None
+
 # a list of dictionaries (the keys are unique 'Group_ID') holding the following info for each group:
 # 'name', 'size', 'name_size', 'seqIDs', 'order', 'color', 'color_rgb', 'color_array', 'is_bold', 'is_italic'
 # 'seqIDs' is a dictionary holding the indices of the sequences belonging to each group
@@ -71,17 +152,22 @@ sequences_array = np.empty(run_params['total_sequences_num'], dtype=seq_dt)
 # 'color_array' is an array of size 4 to be used by Vispy
 groups_dict = dict()
 
-similarity_values_list = []  # a list of the non-redundant significant HSPs ('seq1_index', 'seq2_index', 'Evalue')
-similarity_values_mtx = []  # a 2D matrix filled with Evalues for all pairs (redundant). The diagonal and non-significant pairs = 1
-attraction_values_mtx = []  # a 2D matrix filled with attraction values for all pairs (redundant). The diagonal and non-significant pairs = 0
-connected_sequences_mtx = []  # a boolean matrix (redundant). 1 for connected sequences (according to current Pvalue cutoff)
-connected_sequences_list = []  # a 2D matrix listing the pairs of connected sequences according to the current P-value (non-redundant).
-att_values_for_connected_list = []  # a 2D matrix listing the attraction values of connected sequences according to the current P-value (non-redundant).
-connected_sequences_list_subset = []  # a 2D matrix listing the pairs of connected sequences according to the current P-value (non-redundant).
-att_values_for_connected_list_subset = []  # a 2D matrix listing the attraction values of connected sequences according to the current P-value (non-redundant).
-
-
-
-
+# The text file the pairs were loaded from (CLANS, minimal CLANS or delimited), or None. The pairs are not kept in
+# memory in their input form: they are read again from the file when they are written, so the original value tokens
+# are written back as they were. A dict of the path of the file, the format it was loaded as, its size and modification
+# time (stamp) and the function which reads its pairs. Filled by sequence_pairs.set_pairs_source().
+pairs_source = None
 
+# The compact non-redundant representation of all the pairs which have a similarity value (edges), filled by
+# sequence_pairs.set_edges(). Each edge is stored once as (index1, index2), with index1 <= index2.
+# The attraction values are quantized to uint16 (value * att_quantization_scale).
+att_quantization_scale = 65535
+edges_indices = np.empty((0, 2), dtype=np.int32)  # a 2D (edges_num, 2) array of the pairs indices
+edges_minus_log_evalues = np.empty(0, dtype=np.float32)  # -log10(E-value) of each pair (only for HSPs)
+edges_att_values = np.empty(0, dtype=np.uint16)  # the quantized attraction value of each pair
+edges_connected = np.empty(0, dtype=bool)  # True for connected pairs (according to the current P-value cutoff)
 
+connected_sequences_list = []  # a 2D matrix listing the pairs of connected sequences according to the current P-value (non-redundant).
+att_values_for_connected_list = []  # a 1D array of the (quantized) attraction values of the connected pairs, in the same order.
+connected_sequences_list_subset = []  # a 2D matrix listing the pairs of connected sequences according to the current P-value (non-redundant).
+att_values_for_connected_list_subset = []  # a 1D array of the (quantized) attraction values of the connected pairs in the subset.
@@ -0,0 +1,219 @@
+import numpy as np
+import numba
+import clans.config as cfg
+import clans.data.sequences as seq
+import clans.data.sequence_pairs as sp
+import clans.data.string_pool as string_pool
+import clans.io.file_formats.clans_format as clans
+import clans.similarity_search.prefilter as prefilter
+import clans.similarity_search.pairs_cache as pairs_cache
+
+# Redundancy reduction: the identical and nearly identical sequences of the input are collapsed into representatives
+# before the search, and only the representatives are searched and laid out.
+# The exact duplicates are found by the hash of their residues. Then, the nearly identical sequences (with at least the
+# given identity) are clustered greedily, from the longest to the shortest: each sequence joins the first
+# representative (a longer sequence) which is nearly identical to it, or becomes a representative itself. The
+# identity of two sequences is 1 - their edit distance / the length of the longer one, and it's calculated only for
+# the candidate pairs of a k-mer prefilter (see prefilter.py) which is tuned for very similar sequences.
+# Before the output is written, the members are expanded back: each member is placed at the coordinates of its
+# representative (with a small jitter), and is connected to it by an HSP with an E-value of 0 (the members don't get
+# the other HSPs of their representative). The members of each representative (with the representative) are kept as
+# a group.
+
+# The prefilter parameters for finding the nearly identical sequences (5-mers, 32 bands of 4 rows: sequences with
+# 95% identity are candidates with a probability of over 0.99)
+near_duplicates_pattern = '11111'
+near_duplicates_bands = 32
+near_duplicates_rows = 4
+
+# The jitter of the expanded members, relative to the extent of the layout
+jitter_ratio = 0.005
+
+group_size = '6'
+group_color = '128;128;128;255'
+
+# The state of the collapsed data: the representative of each input sequence (its index in the input), and the
+# titles and the sequences of all the input sequences
+representatives = None
+full_titles = None
+full_sequences = None
+
+
+# Returns the edit distance of the sequences (residues[start1:end1] and residues[start2:end2]), or max_distance + 1 if
+# it's larger than max_distance. Only the diagonals within max_distance of the main one are calculated.
+@numba.njit(nogil=True)
+def get_banded_edit_distance(residues, start1, end1, start2, end2, max_distance):
+    len1 = end1 - start1
+    len2 = end2 - start2
+    if abs(len1 - len2) > max_distance:
+        return max_distance + 1
+
+    too_far = max_distance + 1
+    previous = np.full(len2 + 1, too_far, dtype=np.int64)
+    current = np.full(len2 + 1, too_far, dtype=np.int64)
+    for j in range(min(len2, max_distance) + 1):
+        previous[j] = j
+
+    for i in range(1, len1 + 1):
+        first = max(1, i - max_distance)
+        last = min(len2, i + max_distance)
+        current[first - 1] = i if first == 1 else too_far
+        row_min = current[first - 1]
+        for j in range(first, last + 1):
+            cost = 0 if residues[start1 + i - 1] == residues[start2 + j - 1] else 1
+            distance = min(previous[j - 1] + cost, previous[j] + 1, current[j - 1] + 1)
+            current[j] = min(distance, too_far)
+            row_min = min(row_min, current[j])
+        if last < len2:
+            current[last + 1] = too_far
+        if row_min > max_distance:
+            return too_far
+        previous, current = current, previous
+
+    return min(previous[len2], too_far)
+
+
+# Fill the representative of each sequence (an index in the sequences), clustering the sequences greedily in the given
+# order (the longest first). The candidates of sequence i are neighbors[neighbor_starts[i]:neighbor_starts[i + 1]].
+@numba.njit(nogil=True)
+def assign_representatives(residues, starts, ends, order, neighbor_starts, neighbors, min_identity, representative):
+    representative[:] = -1
+    for seq_index in order:
+        seq_len = ends[seq_index] - starts[seq_index]
+        for neighbor in neighbors[neighbor_starts[seq_index]:neighbor_starts[seq_index + 1]]:
+            if representative[neighbor] != neighbor:
+                continue
+            max_len = max(seq_len, ends[neighbor] - starts[neighbor])
+            max_distance = int((1.0 - min_identity) * max_len)
+            if get_banded_edit_distance(residues, starts[seq_index], ends[seq_index], starts[neighbor],
+                                        ends[neighbor], max_distance) <= max_distance:
+                representative[seq_index] = neighbor
+                break
+        if representative[seq_index] == -1:
+            representative[seq_index] = seq_index
+
+
+# Returns the representative of each sequence (an index in the sequences, a representative is its own
+# representative), and the number of sequences which are exact duplicates
+def find_representatives(sequences, min_identity):
+    sequences = [sequence.upper() for sequence in sequences]
+    unique_hashes, first_indices, unique_inverse = np.unique(pairs_cache.get_sequences_hashes(sequences),
+                                                             return_index=True, return_inverse=True)
+    unique_inverse = unique_inverse.reshape(-1)
+    duplicates_num = len(sequences) - first_indices.shape[0]
+
+    # np.unique orders the unique sequences by their hashes - put them back in the order of their first occurrence,
+    # so the sequences of the same length are clustered in their input order
+    input_order = np.argsort(first_indices, kind='stable')
+    first_indices = first_indices[input_order]
+    unique_inverse = np.argsort(input_order)[unique_inverse]
+
+    # Cluster the unique sequences (by their first occurrence)
+    unique_representative = np.arange(first_indices.shape[0])
+    if min_identity < 1.0 and first_indices.shape[0] > 1:
+        unique_sequences = [sequences[i] for i in first_indices]
+        pool = string_pool.from_strings(unique_sequences)
+        index1, index2, band_keys = prefilter.find_candidates(unique_sequences, near_duplicates_pattern,
+                                                              near_duplicates_bands, near_duplicates_rows)
+
+        # The candidates of each sequence (both directions of the pairs), grouped by the sequence
+        all_index1 = np.concatenate((index1, index2))
+        all_index2 = np.concatenate((index2, index1))
+        neighbors_order = np.argsort(all_index1, kind='stable')
+        neighbor_starts = np.zeros(first_indices.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_index1, minlength=first_indices.shape[0]), out=neighbor_starts[1:])
+
+        lengths = pool.ends - pool.starts
+        order = np.lexsort((np.arange(lengths.shape[0]), -lengths))
+        assign_representatives(np.frombuffer(pool.buffer, dtype=np.uint8), pool.starts, pool.ends, order,
+                               neighbor_starts, all_index2[neighbors_order], min_identity, unique_representative)
+
+    return first_indices[unique_representative[unique_inverse]], duplicates_num
+
+
+# Collapse the loaded sequences into their representatives: the sequences array keeps only the representatives (in
+# their input order), and the input sequences are kept for expand()
+def collapse(min_identity):
+    global representatives, full_titles, full_sequences
+
+    input_num = cfg.run_params['total_sequences_num']
+    representatives, duplicates_num = find_representatives(seq.get_sequences(), min_identity)
+    representative_indices = np.flatnonzero(representatives == np.arange(input_num))
+    print("Collapsed the " + str(input_num) + " sequences into " + str(representative_indices.shape[0]) +
+          " representatives (" + str(duplicates_num) + " exact duplicates, " +
+          str(input_num - representative_indices.shape[0] - duplicates_num) + " near-duplicates with identity >= " +
+          str(min_identity) + ")")
+
+    full_titles = cfg.titles_pool
+    full_sequences = cfg.sequences_pool
+    sequences = cfg.sequences_array[representative_indices]
+    seq.create_sequences_array_from_columns(
+        string_pool.from_strings(full_titles.get_list(representative_indices)),
+        string_pool.from_strings(full_sequences.get_list(representative_indices)),
+        np.column_stack((sequences['x_coor'], sequences['y_coor'], sequences['z_coor'])))
+    cfg.run_params['total_sequences_num'] = representative_indices.shape[0]
+
+
+def is_collapsed():
+    return representatives is not None
+
+
+# Expand the representatives back to all the input sequences: the coordinates, the pairs (and the edges) and a group
+# of the members of each representative with members
+def expand():
+    global representatives, full_titles, full_sequences
+
+    input_num = representatives.shape[0]
+    representative_indices = np.flatnonzero(representatives == np.arange(input_num))
+    reduced_index = np.full(input_num, -1, dtype=np.int64)
+    reduced_index[representative_indices] = np.arange(representative_indices.shape[0])
+
+    # The members are placed at the coordinates of their representative, with a jitter (in the dimensions of the
+    # layout)
+    sequences = cfg.sequences_array[:representative_indices.shape[0]]
+    coordinates = np.column_stack((sequences['x_coor'], sequences['y_coor'], sequences['z_coor'])).astype(np.float32)
+    coordinates = coordinates[reduced_index[representatives]]
+    members = np.flatnonzero(representatives != np.arange(input_num))
+    jitter = np.random.uniform(-1, 1, (members.shape[0], 3)) * np.ptp(coordinates, axis=0) * jitter_ratio
+    if cfg.run_params['dimensions_num_for_clustering'] == 2:
+        jitter[:, 2] = 0
+    coordinates[members] += jitter.astype(np.float32)
+
+    # The edges of the representatives (in the input indices) and an HSP of each member with its representative (the
+    # lower index first)
+    edges_num = cfg.edges_indices.shape[0]
+    index1 = np.concatenate((representative_indices[cfg.edges_indices[:, 0]],
+                             np.minimum(members, representatives[members])))
+    index2 = np.concatenate((representative_indices[cfg.edges_indices[:, 1]],
+                             np.maximum(members, representatives[members])))
+    values = np.concatenate((sp.get_edges_values(0, edges_num, cfg.run_params['type_of_values']),
+                             np.zeros(members.shape[0])))
+
+    seq.create_sequences_array_from_columns(full_titles, full_sequences, coordinates)
+    cfg.run_params['total_sequences_num'] = input_num
+    sp.set_edges(index1, index2, values, cfg.run_params['type_of_values'])
+    if cfg.run_params['type_of_values'] == 'hsp':
+        sp.calculate_attraction_values()
+    sp.define_connected_sequences(cfg.run_params['type_of_values'])
+
+    # A group of each representative with its members (the largest groups first, as many as the group indices allow),
+    # numbered after the existing groups as the readers number them (ID = order + 1)
+    members = members[np.argsort(representatives[members], kind='stable')]
+    group_representatives, group_starts, group_sizes = np.unique(representatives[members], return_index=True,
+                                                                 return_counts=True)
+    groups_num = min(group_representatives.shape[0], np.iinfo(np.int16).max - len(cfg.groups_dict))
+    for group in np.argsort(-group_sizes, kind='stable')[:groups_num]:
+        representative = group_representatives[group]
+        group_members = np.append(representative, members[group_starts[group]:group_starts[group] + group_sizes[group]])
+        title_words = full_titles.get(representative).split()
+        name = "Redundant " + (title_words[0] if len(title_words) > 0 else str(representative))
+        order = len(cfg.groups_dict)
+        group_ID = order + 1
+        cfg.groups_dict[group_ID] = clans.get_group_dict(name, group_size, group_color, order, group_members.tolist())
+        cfg.sequences_array['in_group'][group_members] = group_ID
+    print("Expanded " + str(members.shape[0]) + " redundant sequences (" + str(groups_num) + " groups of a "
+          "representative and its members)")
+
+    representatives = None
+    full_titles = None
+    full_sequences = None
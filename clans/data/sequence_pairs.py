@@ -1,51 +1,203 @@
+import os
 import numpy as np
-import numba
 import clans.config as cfg
 
 
+# Quantize attraction values between 0 and 1 to uint16
+def quantize_att_values(att_values):
+    att_values = np.clip(np.asarray(att_values, dtype=float), 0.0, 1.0)
+    return np.rint(att_values * cfg.att_quantization_scale).astype(np.uint16)
+
+
+def dequantize_att_values(quantized_att_values):
+    return quantized_att_values.astype(np.float32) / cfg.att_quantization_scale
+
+
+pairs_chunk_size = 1 << 20  # The number of pairs which are read from the source file / the edges at once
+
+# The precision of the values which are not written from the source file: the E-values are rounded as BLAST reports
+# them and the attraction values to the precision of their quantization
+evalue_digits = 3
+att_digits = 4
+zero_minus_log_evalue = 180  # E-values of 0 are stored as 10^-180
+
+
+def get_file_stamp(file_path):
+    file_stat = os.stat(file_path)
+    return file_stat.st_size, file_stat.st_mtime_ns
+
+
+# Save the text file the pairs were loaded from (called after set_edges()). read_pairs(file_path) yields the pairs of
+# the file (in their input order) in chunks of (index1, index2, value tokens).
+def set_pairs_source(file_path, file_format, read_pairs):
+    cfg.pairs_source = {'path': os.path.realpath(file_path), 'format': file_format,
+                        'stamp': get_file_stamp(file_path), 'read_pairs': read_pairs}
+
+
+def is_pairs_source(file_path):
+    return cfg.pairs_source is not None and cfg.pairs_source['path'] == os.path.realpath(file_path)
+
+
+# The source file was rewritten with the same pairs (saved over or compacted)
+def refresh_pairs_source(file_path):
+    if is_pairs_source(file_path):
+        cfg.pairs_source['stamp'] = get_file_stamp(file_path)
+
+
+# Round the values to the given number of significant digits (as %g formats them)
+def round_values(values, digits):
+    if values.shape[0] == 0:
+        return values.astype(np.float64)
+    return np.char.mod('%.' + str(digits) + 'g', values).astype(np.float64)
+
+
+# Returns the values of the edges between start and end (E-values / attraction values, as they are written)
+def get_edges_values(start, end, mode):
+    if mode == 'hsp':
+        minus_log_evalues = cfg.edges_minus_log_evalues[start:end].astype(np.float64)
+        evalues = round_values(10 ** -minus_log_evalues, evalue_digits)
+        return np.where(minus_log_evalues == zero_minus_log_evalue, 0.0, evalues)
+    return round_values(dequantize_att_values(cfg.edges_att_values[start:end]), att_digits)
+
+
+# Returns True if the pairs are written from their source file (it hasn't changed since it was loaded)
+def is_pairs_source_current():
+    source = cfg.pairs_source
+    return source is not None and os.path.isfile(source['path']) and \
+        get_file_stamp(source['path']) == source['stamp']
+
+
+# Yield the pairs to write, in chunks of (index1, index2, values): the pairs of the source file with their original
+# value tokens (strings) if it hasn't changed since it was loaded, or else the edges with their (rounded) values
+def get_pairs_chunks():
+    source = cfg.pairs_source
+    if source is not None:
+        if is_pairs_source_current():
+            yield from source['read_pairs'](source['path'])
+            return
+        print("The file " + os.path.basename(source['path']) + " was changed since it was loaded - writing the "
+              "values of the pairs as they are stored")
+
+    mode = cfg.run_params['type_of_values']
+    for start in range(0, cfg.edges_indices.shape[0], pairs_chunk_size):
+        end = min(start + pairs_chunk_size, cfg.edges_indices.shape[0])
+        yield cfg.edges_indices[start:end, 0], cfg.edges_indices[start:end, 1], get_edges_values(start, end, mode)
+
+
+# Encode the pairs of the source file (get_pairs_chunks()) for the binary formats, so they can be written back as
+# they were read: returns their indices (int32, (P, 2)), and their value tokens as a blob of ASCII tokens (each one
+# followed by a newline) with their int64 offsets (P + 1)
+def encode_source_pairs():
+    indices = [np.empty((0, 2), dtype='<i4')]
+    offsets = [np.zeros(1, dtype='<i8')]
+    tokens = []
+    tokens_len = 0
+    for index1, index2, values in get_pairs_chunks():
+        indices.append(np.column_stack((index1, index2)).astype('<i4'))
+        chunk_tokens = [str(value) for value in values.tolist()]
+        chunk_offsets = np.cumsum([len(token) + 1 for token in chunk_tokens], dtype=np.int64)
+        offsets.append((chunk_offsets + tokens_len).astype('<i8'))
+        tokens.append(''.join([token + '\n' for token in chunk_tokens]).encode())
+        tokens_len += len(tokens[-1])
+    return np.concatenate(indices), np.concatenate(offsets), np.frombuffer(b''.join(tokens), dtype=np.uint8)
+
+
+# Yield the pairs encoded by encode_source_pairs() (e.g. mapped from a binary file), in chunks of (index1, index2,
+# value tokens)
+def read_encoded_pairs(indices, offsets, tokens):
+    for start in range(0, indices.shape[0], pairs_chunk_size):
+        end = min(start + pairs_chunk_size, indices.shape[0])
+        chunk_tokens = np.array(tokens[offsets[start]:offsets[end]].tobytes().decode().split('\n')[:-1],
+                                dtype=object)
+        yield indices[start:end, 0], indices[start:end, 1], chunk_tokens
+
+
+# Use the given edges arrays (as saved from the global edges arrays, e.g. mapped from a project) as they are
+def load_edges(indices, minus_log_evalues, att_values):
+    cfg.pairs_source = None
+    cfg.edges_indices = indices
+    cfg.edges_minus_log_evalues = minus_log_evalues
+    cfg.edges_att_values = att_values
+    cfg.edges_connected = np.zeros(indices.shape[0], dtype=bool)
+
+
+# Fill the global edges arrays with the given pairs and their values (E-values for 'hsp', attraction values for 'att')
+def set_edges(index1, index2, values, mode):
+    # The pairs are written from the edges unless a source file is set again (see set_pairs_source())
+    cfg.pairs_source = None
+    total_seq_num = cfg.run_params['total_sequences_num']
+
+    # Ignore pairs with indices that don't match any sequence
+    valid = (index1 >= 0) & (index1 < total_seq_num) & (index2 >= 0) & (index2 < total_seq_num)
+    if not np.all(valid):
+        print("Ignoring " + str(np.count_nonzero(~valid)) + " pairs with invalid sequence indices")
+        index1 = index1[valid]
+        index2 = index2[valid]
+        values = values[valid]
+
+    # Store each pair once as (lower index, higher index)
+    low = np.minimum(index1, index2)
+    high = np.maximum(index1, index2)
+
+    # When a pair appears more than once, keep the last value (as was done when filling the redundant matrix)
+    keys = low.astype(np.int64) * total_seq_num + high
+    unique_keys, last_from_end = np.unique(keys[::-1], return_index=True)
+    last = keys.shape[0] - 1 - last_from_end
+
+    cfg.edges_indices = np.column_stack((low[last], high[last])).astype(np.int32)
+    values = values[last]
+
+    if mode == 'hsp':
+        # E-values of 0 are replaced with 10^-180
+        values = np.where(values == 0.0, 10 ** -180, values)
+        cfg.edges_minus_log_evalues = (-np.log10(values)).astype(np.float32)
+        cfg.edges_att_values = np.zeros(values.shape[0], dtype=np.uint16)
+    else:
+        cfg.edges_minus_log_evalues = np.empty(0, dtype=np.float32)
+        cfg.edges_att_values = quantize_att_values(values)
+
+    cfg.edges_connected = np.zeros(values.shape[0], dtype=bool)
+
+
 def calculate_attraction_values():
-    # Pairs, which have the init value of 100 (no HSP), automatically get the value of 0
-    minus_log_similarity_values = np.where(cfg.similarity_values_mtx > 1, 0, -np.log10(cfg.similarity_values_mtx))
-    max_value = np.amax(minus_log_similarity_values)
-    cfg.attraction_values_mtx = np.true_divide(minus_log_similarity_values, max_value)
+    # Pairs with E-value > 1 automatically get the attraction value of 0
+    minus_log_similarity_values = np.where(cfg.edges_minus_log_evalues < 0, 0, cfg.edges_minus_log_evalues)
+    if minus_log_similarity_values.shape[0] > 0:
+        max_value = np.amax(minus_log_similarity_values)
+    else:
+        max_value = 0
+    if max_value > 0:
+        cfg.edges_att_values = quantize_att_values(minus_log_similarity_values / max_value)
+    else:
+        cfg.edges_att_values = np.zeros(minus_log_similarity_values.shape[0], dtype=np.uint16)
 
-    #print("Attraction values:\n" + str(cfg.attraction_values_mtx))
+    #print("Attraction values:\n" + str(cfg.edges_att_values))
 
 
 def define_connected_sequences(mode):
-    # Create the 2D redundant boolean matrix of connections
+    # Mark the connected pairs according to the current cutoff
     if mode == 'hsp':
-        cfg.connected_sequences_mtx = np.where(cfg.similarity_values_mtx <= cfg.run_params['similarity_cutoff'], 1, 0)
+        with np.errstate(divide='ignore'):
+            minus_log_cutoff = np.float32(-np.log10(cfg.run_params['similarity_cutoff']))
+        cfg.edges_connected = cfg.edges_minus_log_evalues >= minus_log_cutoff
     elif mode == 'att':
-        cfg.connected_sequences_mtx = np.where(cfg.attraction_values_mtx >= cfg.run_params['similarity_cutoff'], 1, 0)
-    #print("Connected_sequences:\n" + str(cfg.connected_sequences))
+        cfg.edges_connected = dequantize_att_values(cfg.edges_att_values) >= np.float32(cfg.run_params['similarity_cutoff'])
 
+    # A sequence is never connected to itself
+    cfg.edges_connected &= cfg.edges_indices[:, 0] != cfg.edges_indices[:, 1]
+    #print("Connected_sequences:\n" + str(cfg.edges_connected))
 
-# Create a list of connected pairs (non-redundant, [indexi][indexj]) for the line plot graphics
-@numba.njit
-def create_lists(connected_sequences_mtx, attraction_values_mtx):
-    total_seq_num = connected_sequences_mtx.shape[0]
-    hsp_num = 0
-    connections_list = []
-    att_values_list = []
-
-    for i in range(total_seq_num - 1):
-        for j in range(i + 1, total_seq_num):
-            if i < j and connected_sequences_mtx[i][j] == 1:
-                connected_pair_tuple = (i, j)
-                connections_list.append(connected_pair_tuple)
-                att_values_list.append(attraction_values_mtx[i][j])
-                hsp_num += 1
 
-    return hsp_num, connections_list, att_values_list
+# Returns the connected pairs (according to the current cutoff) and their quantized attraction values
+def get_connected_edges():
+    return cfg.edges_indices[cfg.edges_connected], cfg.edges_att_values[cfg.edges_connected]
 
 
+# Create a list of connected pairs (non-redundant, [indexi][indexj]) for the line plot graphics
 def define_connected_sequences_list():
 
-    hsp_num, connections_list, att_values_list = create_lists(cfg.connected_sequences_mtx, cfg.attraction_values_mtx)
-
-    cfg.connected_sequences_list = np.array(connections_list, dtype=int)
-    cfg.att_values_for_connected_list = np.array(att_values_list, dtype=float)
+    cfg.connected_sequences_list, cfg.att_values_for_connected_list = get_connected_edges()
+    hsp_num = cfg.connected_sequences_list.shape[0]
     cfg.run_params['connections_num'] = hsp_num
 
     if cfg.run_params['type_of_values'] == 'hsp':
@@ -55,43 +207,19 @@ def define_connected_sequences_list():
         print("Number of connections (above the threshold of " + str(cfg.run_params['similarity_cutoff']) + "): "
               + str(hsp_num))
 
-# Create a list of connected pairs (non-redundant, [indexi][indexj]) for the line plot graphics
-@numba.njit
-def create_lists_subset(connected_sequences_mtx, attraction_values_mtx, in_subset_array):
-    total_seq_num = connected_sequences_mtx.shape[0]
-    hsp_num = 0
-    connections_list = []
-    att_values_list = []
-
-    i_in_subset = 0
-    for i in range(total_seq_num - 1):
-        # sequence i is in the subset
-        if in_subset_array[i]:
-            j_in_subset = i_in_subset + 1
-            for j in range(i + 1, total_seq_num):
-                # sequence j is in the subset
-                if in_subset_array[j]:
-                    # If the sequences are connected and j is also in the subset, add the connection to the list
-                    if connected_sequences_mtx[i][j] == 1:
-                        # Adding the sequences indices in the subset to the list of connected pairs
-                        connected_pair_tuple = (i_in_subset, j_in_subset)
-                        connections_list.append(connected_pair_tuple)
-                        att_values_list.append(attraction_values_mtx[i][j])
-                        hsp_num += 1
-                    j_in_subset += 1
-            i_in_subset += 1
-
-    return hsp_num, connections_list, att_values_list
-
 
+# Create a list of connected pairs in the subset, using the indices of the sequences within the subset
 def define_connected_sequences_list_subset():
 
-    hsp_num, connections_list, att_values_list = create_lists_subset(cfg.connected_sequences_mtx,
-                                                                     cfg.attraction_values_mtx,
-                                                                     cfg.sequences_array['in_subset'])
+    in_subset_array = cfg.sequences_array['in_subset']
+    subset_indices = np.cumsum(in_subset_array) - 1
 
-    cfg.connected_sequences_list_subset = np.array(connections_list, dtype=int)
-    cfg.att_values_for_connected_list_subset = np.array(att_values_list, dtype=float)
+    connections, att_values = get_connected_edges()
+    in_subset_connections = in_subset_array[connections[:, 0]] & in_subset_array[connections[:, 1]]
+
+    cfg.connected_sequences_list_subset = subset_indices[connections[in_subset_connections]]
+    cfg.att_values_for_connected_list_subset = att_values[in_subset_connections]
+    hsp_num = cfg.connected_sequences_list_subset.shape[0]
 
     if cfg.run_params['type_of_values'] == 'hsp':
         print("Number of connections in the subset (under the P-value of " + str(cfg.run_params['similarity_cutoff'])
@@ -99,4 +227,3 @@ def define_connected_sequences_list_subset():
     else:
         print("Number of connections in the subset (above the threshold of " + str(cfg.run_params['similarity_cutoff'])
               + "): " + str(hsp_num))
-
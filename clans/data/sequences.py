@@ -1,19 +1,50 @@
 import numpy as np
 import numba
 import clans.config as cfg
+import clans.data.string_pool as string_pool
 import random
 
 
-#@profile
-def create_sequences_array(sequences_list):
-    # Resize the sequences array according to the input number of sequences
-    np.resize(cfg.sequences_array, cfg.run_params['total_sequences_num'])
+# Returns a StringPool of the given strings: a StringPool, a list of strings, or "" for empty strings
+def get_string_pool(strings, strings_num):
+    if isinstance(strings, string_pool.StringPool):
+        return strings
+    elif len(strings) == 0:
+        return string_pool.empty_strings(strings_num)
+    return string_pool.from_strings(strings)
+
+
+# Create the sequences array from separate columns: the titles, the sequences and a 2D (seq_num, 3) coordinates array.
+# The titles and the sequences are given as a StringPool, a list of strings, or "" when there are none.
+def create_sequences_array_from_columns(titles, sequences, coordinates):
+    cfg.sequences_array = np.zeros(coordinates.shape[0], dtype=cfg.seq_dt)
+    cfg.titles_pool = get_string_pool(titles, coordinates.shape[0])
+    cfg.sequences_pool = get_string_pool(sequences, coordinates.shape[0])
+    cfg.sequences_array['x_coor'] = coordinates[:, 0]
+    cfg.sequences_array['y_coor'] = coordinates[:, 1]
+    cfg.sequences_array['z_coor'] = coordinates[:, 2]
+    cfg.sequences_array['in_group'] = -1
+    cfg.sequences_array['x_coor_subset'] = coordinates[:, 0]
+    cfg.sequences_array['y_coor_subset'] = coordinates[:, 1]
+    cfg.sequences_array['z_coor_subset'] = coordinates[:, 2]
+
+
+def get_title(seq_index):
+    return cfg.titles_pool.get(seq_index)
+
+
+# Returns a list of the titles of the given sequences (all of them by default)
+def get_titles(indices=None):
+    return cfg.titles_pool.get_list(indices)
+
+
+def get_sequence(seq_index):
+    return cfg.sequences_pool.get(seq_index)
 
-    # Insert the sequences to a NumPy structured array with the following fields:
-    # seq_title, sequence, x_coordinate, y_coordinate, z_cordinate, in_group(initialized with -1)
-    cfg.sequences_array = np.array(sequences_list, dtype=cfg.seq_dt)
 
-    #print("create_sequences_array: Sequences_array=\n" + str(cfg.sequences_array))
+# Returns a list of the sequences (residues) of the given sequences (all of them by default)
+def get_sequences(indices=None):
+    return cfg.sequences_pool.get_list(indices)
 
 
 def add_in_group_column(in_group_array):
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+# A pool of strings, stored as one UTF-8 buffer with the start and end offsets of each string in it.
+# The strings are decoded only when they are accessed, instead of being kept in fixed-width NumPy fields
+# (4 bytes per character of the longest allowed string).
+class StringPool:
+
+    def __init__(self, buffer=b'', starts=None, ends=None):
+        self.buffer = buffer
+        self.starts = np.zeros(0, dtype=np.int64) if starts is None else starts
+        self.ends = np.zeros(0, dtype=np.int64) if ends is None else ends
+
+    def __len__(self):
+        return self.starts.shape[0]
+
+    def get(self, index):
+        return self.buffer[self.starts[index]:self.ends[index]].decode()
+
+    # Returns a list of the strings with the given indices (all of them by default)
+    def get_list(self, indices=None):
+        if indices is None:
+            indices = range(len(self))
+        return [self.buffer[self.starts[i]:self.ends[i]].decode() for i in indices]
+
+
+def from_strings(strings):
+    encoded = [string.encode() for string in strings]
+    lengths = np.array([len(string) for string in encoded], dtype=np.int64)
+    ends = np.cumsum(lengths)
+    return StringPool(b''.join(encoded), ends - lengths, ends)
+
+
+# A pool of the given number of empty strings
+def empty_strings(strings_num):
+    return StringPool(b'', np.zeros(strings_num, dtype=np.int64), np.zeros(strings_num, dtype=np.int64))
+
+
+def concatenate(pools):
+    if len(pools) == 0:
+        return StringPool()
+
+    buffer_starts = np.cumsum([0] + [len(pool.buffer) for pool in pools])
+    starts = np.concatenate([pool.starts + buffer_start for pool, buffer_start in zip(pools, buffer_starts)])
+    ends = np.concatenate([pool.ends + buffer_start for pool, buffer_start in zip(pools, buffer_starts)])
+    return StringPool(b''.join(pool.buffer for pool in pools), starts, ends)
@@ -777,7 +777,9 @@ class Network3D:
 
         # (Divide the data to 5 color-bins, according to the attraction values.
         # lower att-values -> higher == lighter gray -> darker gray)
-        edges_bins_array = np.digitize(cfg.att_values_for_connected_list, self.att_values_bins, right=True)
+        # The attraction values of the connections are quantized -> scale the bins accordingly
+        edges_bins_array = np.digitize(cfg.att_values_for_connected_list,
+                                       self.att_values_bins * cfg.att_quantization_scale, right=True)
 
         # For each bin, build an array consisting only the connections that belong to the same bin
         for i in range(5):
@@ -789,7 +791,9 @@ class Network3D:
 
         # (Divide the data to 5 color-bins, according to the attraction values.
         # lower att-values -> higher == lighter gray -> darker gray)
-        edges_bins_array = np.digitize(cfg.att_values_for_connected_list_subset, self.att_values_bins, right=True)
+        # The attraction values of the connections are quantized -> scale the bins accordingly
+        edges_bins_array = np.digitize(cfg.att_values_for_connected_list_subset,
+                                       self.att_values_bins * cfg.att_quantization_scale, right=True)
 
         # For each bin, build an array consisting only the connections that belong to the same bin
         for i in range(5):
@@ -937,7 +941,7 @@ class Network3D:
                 pos_array[:, 2] = 0
 
             for key in self.selected_points:
-                text_list.append('  ' + cfg.sequences_array['seq_title'][key])
+                text_list.append('  ' + seq.get_title(key))
                 pos_list.append(tuple(pos_array[key]))
 
         # Subset mode
@@ -950,7 +954,7 @@ class Network3D:
 
             i = 0
             for seq_index in sorted(self.selected_points):
-                text_list.append('  ' + cfg.sequences_array['seq_title'][seq_index])
+                text_list.append('  ' + seq.get_title(seq_index))
                 pos_list.append(tuple(pos_array[i]))
                 i += 1
 
@@ -0,0 +1,33 @@
+import numpy as np
+
+# Batched writing of large blocks of rows (sequences, coordinates, pairs): instead of formatting and writing each row
+# separately, the rows are formatted in chunks by applying a repeated row format to all the values of the chunk at once,
+# and each chunk is written with a single call.
+# The values are formatted as str() formats them, so the output is identical to the per-row output.
+
+chunk_rows = 1 << 16  # The number of rows to format and write at once
+
+
+# Format the float32 values as str() formats a numpy float32 (the shortest representation of the float32 value,
+# which is not the same as the representation of the value converted to a Python float)
+def float32_to_str(values):
+    return np.asarray(values, dtype=np.float32).astype(str)
+
+
+# Write the rows to the (open) output file. 'row_format' is a %-format of one row (including the line end),
+# 'columns' is a list of arrays, one per field of the format (use %d for integers, %r for float64 values and %s for
+# strings).
+def write_rows(output, row_format, columns):
+    rows_num = len(columns[0])
+    columns_num = len(columns)
+
+    for start in range(0, rows_num, chunk_rows):
+        chunk = [column[start:start + chunk_rows] for column in columns]
+        chunk_len = len(chunk[0])
+
+        # Interleave the values of the columns in row order (as Python objects)
+        values = [None] * (chunk_len * columns_num)
+        for i, column in enumerate(chunk):
+            values[i::columns_num] = column.tolist() if isinstance(column, np.ndarray) else list(column)
+
+        output.write((row_format * chunk_len) % tuple(values))
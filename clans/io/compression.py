@@ -0,0 +1,109 @@
+import io
+import os
+import shutil
+import tempfile
+import gzip
+import bz2
+import lzma
+
+# zstd is supported only if the zstandard module is installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Transparent reading and writing of compressed files.
+# Input files are recognized as compressed by their first bytes (whatever their extension is) and are decompressed
+# while they are read. Output files are compressed according to their extension.
+# A compressed file which is to be mapped to memory is decompressed (in chunks) to an anonymous temporary file, which
+# is mapped instead, so the decompressed content is not held in memory.
+
+magic_numbers = {'gzip': b'\x1f\x8b', 'bz2': b'BZh', 'xz': b'\xfd7zXZ\x00', 'zstd': b'\x28\xb5\x2f\xfd'}
+extensions = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+gzip_compression_level = 6  # The default of the gzip command (much faster than the maximal level, 9)
+decompress_chunk_size = 1 << 24  # Compressed files are decompressed to temporary files in chunks of 16 MB
+
+
+# Returns the compression type of the file ('gzip', 'bz2', 'xz', 'zstd') or None if it's not compressed
+def detect_compression(file_path):
+    with open(file_path, 'rb') as infile:
+        first_bytes = infile.read(max(len(magic) for magic in magic_numbers.values()))
+    for compression_type, magic in magic_numbers.items():
+        if first_bytes.startswith(magic):
+            # The bz2 magic is followed by the block size (1-9)
+            if compression_type == 'bz2' and first_bytes[3:4] not in [b'%d' % i for i in range(1, 10)]:
+                continue
+            return compression_type
+    return None
+
+
+# Returns the compression type according to the file extension (None if it's not one of the compressed extensions)
+def get_output_compression(file_path):
+    return extensions.get(os.path.splitext(file_path)[1].lower())
+
+
+# Returns an error message if the file cannot be decompressed (an empty string otherwise)
+def get_input_error(file_path):
+    if detect_compression(file_path) == 'zstd' and zstandard is None:
+        return "The file " + os.path.basename(file_path) + " is zstd-compressed.\nPlease install the 'zstandard' " \
+                                                           "module to read it, or decompress it first"
+    return ""
+
+
+# Open a file for reading ('r' or 'rb' mode), decompressing it while reading if it's compressed
+def open_input(file_path, mode='r'):
+    compression_type = detect_compression(file_path)
+
+    if compression_type is None:
+        return open(file_path, mode)
+
+    if compression_type == 'gzip':
+        stream = gzip.open(file_path, 'rb')
+    elif compression_type == 'bz2':
+        stream = bz2.open(file_path, 'rb')
+    elif compression_type == 'xz':
+        stream = lzma.open(file_path, 'rb')
+    else:
+        # A multi-threaded zstd compression may write several frames
+        stream = zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), read_across_frames=True,
+                                                            closefd=True)
+        stream = io.BufferedReader(stream)
+
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream)
+
+
+# Decompress a compressed file to an anonymous temporary file in the given directory (the system's temporary
+# directory if None), which is deleted when it's closed. Returns the open temporary file.
+def decompress_to_temp_file(file_path, dir_path=None):
+    temp_file = tempfile.TemporaryFile(dir=dir_path)
+    with open_input(file_path, 'rb') as infile:
+        shutil.copyfileobj(infile, temp_file, decompress_chunk_size)
+    temp_file.flush()
+    return temp_file
+
+
+# Open a file for writing ('w' or 'wb' mode), compressed according to its extension.
+# zstd compression uses multiple threads (the other codecs don't support it).
+def open_output(file_path, mode='w'):
+    compression_type = get_output_compression(file_path)
+
+    if compression_type is None or (compression_type == 'zstd' and zstandard is None):
+        if compression_type is not None:
+            print("The 'zstandard' module is not installed - saving " + os.path.basename(file_path) +
+                  " without compression")
+        return open(file_path, mode)
+
+    if compression_type == 'gzip':
+        stream = gzip.open(file_path, 'wb', compresslevel=gzip_compression_level)
+    elif compression_type == 'bz2':
+        stream = bz2.open(file_path, 'wb')
+    elif compression_type == 'xz':
+        stream = lzma.open(file_path, 'wb')
+    else:
+        stream = zstandard.ZstdCompressor(threads=-1).stream_writer(open(file_path, 'wb'), closefd=True)
+
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream)
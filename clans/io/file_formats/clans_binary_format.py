@@ -0,0 +1,225 @@
+import os
+import json
+import struct
+import numpy as np
+import clans.config as cfg
+import clans.data.string_pool as string_pool
+import clans.data.sequences as seq
+import clans.data.sequence_pairs as sp
+import clans.io.compression as compression
+import clans.io.file_formats.clans_format as clans
+
+# A binary companion of the CLANS format, for fast saving and loading of large maps.
+# The file contains the same information as a standard CLANS file and can be converted to and from it without changes:
+# if the pairs were loaded from a file (see sequence_pairs.set_pairs_source()), they are also kept as they were read
+# (in their input order, with their original value tokens) and written back from there. Otherwise, the values of the
+# pairs are written from the edges, with the precision of sequence_pairs.get_edges_values() (as a CLANS file would
+# be written).
+#
+# File layout:
+# - A fixed header: the magic bytes, the format version (uint32) and the length of the metadata (uint64),
+#   all little-endian.
+# - The metadata: a UTF-8 JSON object with the number of sequences, the type of values (hsp/att), the parameters
+#   (the <param> block, as written in the CLANS file), the groups table (the <seqgroups> block) and the location,
+#   dtype and shape of each of the array sections.
+# - The array sections (raw little-endian arrays, each one aligned to 64 bytes so it can be memory-mapped):
+#   coordinates (float32, (N, 3)), the edges arrays (as in config.py: edges indices (int32, (E, 2)), -log10 E-values
+#   (float32) and quantized attraction values (uint16), also of the HSPs), and the titles and the sequences, each as int64 offsets
+#   (N + 1) into a UTF-8 blob.
+#   If the pairs have a source file: the pairs as they were read (source pairs indices (int32, (P, 2)), and their value
+#   tokens as int64 offsets (P + 1) into an ASCII blob of newline-terminated tokens).
+#   Version 1 files have the pairs as they were read (pairs indices (int32, (P, 2)) and pairs values (float64))
+#   instead of the edges.
+
+magic = b'CLANSBIN'
+format_version = 3
+header_struct = struct.Struct('<8sIQ')
+section_alignment = 64
+
+
+# Encode a list of strings as UTF-8: returns the offsets of the strings in the blob (int64, N + 1) and the blob
+def encode_strings(strings):
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+# Returns a StringPool of the strings in the blob (copied from the file)
+def get_string_pool(offsets, blob):
+    offsets = np.array(offsets, dtype=np.int64)
+    return string_pool.StringPool(blob.tobytes(), offsets[:-1], offsets[1:])
+
+
+# Reading fills the same fields as ClansFormat.read_file(), so the values are filled by ClansFormat.fill_values()
+class ClansBinaryFormat(clans.ClansFormat):
+
+    def __init__(self):
+        super().__init__()
+        self.arrays = {}
+
+    def read_file(self, file_path):
+
+        self.file_name = os.path.basename(file_path)
+        self.file_path = file_path
+
+        # Verify that the file exists
+        if not os.path.isfile(file_path):
+            self.file_is_valid = 0
+            self.error = "The file \'" + file_path + "\' does not exist"
+            return
+
+        # Verify that the file can be decompressed (if it's compressed)
+        self.error = compression.get_input_error(file_path)
+        if self.error != "":
+            self.file_is_valid = 0
+            return
+
+        is_compressed = compression.detect_compression(file_path) is not None
+
+        # Read and verify the header and the metadata
+        with compression.open_input(file_path, 'rb') as infile:
+            header = infile.read(header_struct.size)
+            if len(header) < header_struct.size or header[:len(magic)] != magic:
+                self.file_is_valid = 0
+                self.error = "The file " + self.file_name + " is not a binary CLANS file"
+                print(self.error)
+                return
+
+            file_magic, version, metadata_len = header_struct.unpack(header)
+            if version > format_version:
+                self.file_is_valid = 0
+                self.error = "The file " + self.file_name + " was saved in a newer version of the binary CLANS " \
+                                                            "format (" + str(version) + ").\nPlease update CLANS " \
+                                                            "or load the file in CLANS format"
+                print(self.error)
+                return
+
+            try:
+                metadata = json.loads(infile.read(metadata_len).decode())
+            except ValueError:
+                metadata = None
+
+        # A compressed file cannot be mapped - it's decompressed to a temporary file, which is mapped instead (and
+        # deleted when the arrays are unmapped)
+        if metadata is None:
+            mapped_file = None
+        elif is_compressed:
+            mapped_file = compression.decompress_to_temp_file(file_path, cfg.run_params.get('working_dir'))
+        else:
+            mapped_file = open(file_path, 'rb')
+        file_size = os.fstat(mapped_file.fileno()).st_size if mapped_file is not None else 0
+
+        if metadata is None or any(section['offset'] + section['size'] > file_size
+                                   for section in metadata['sections'].values()):
+            self.file_is_valid = 0
+            self.error = "The file " + self.file_name + " has invalid binary CLANS format:\n" \
+                                                        "The file is truncated or corrupted"
+            print(self.error)
+            if mapped_file is not None:
+                mapped_file.close()
+            return
+
+        # Map the array sections to memory
+        arrays = {}
+        with mapped_file:
+            for name, section in metadata['sections'].items():
+                shape = tuple(section['shape'])
+                if np.prod(shape) == 0:
+                    arrays[name] = np.zeros(shape, dtype=section['dtype'])
+                else:
+                    arrays[name] = np.memmap(mapped_file, dtype=section['dtype'], mode='r',
+                                             offset=section['offset'], shape=shape)
+
+        cfg.run_params['total_sequences_num'] = metadata['sequences_num']
+        print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
+
+        # Fill the same fields as when reading a CLANS file
+        self.titles.append(get_string_pool(arrays['titles_offsets'], arrays['titles']))
+        self.sequences.append(get_string_pool(arrays['sequences_offsets'], arrays['sequences']))
+        self.pos_indices.append(np.arange(metadata['sequences_num']))
+        self.coordinates.append(arrays['coordinates'])
+        self.arrays = arrays
+        self.type_of_values = metadata['type_of_values']
+        self.params = metadata['params']
+
+        # The groups (the same fields as in the <seqgroups> block)
+        for order, group in enumerate(metadata['groups']):
+            self.is_groups = 1
+            cfg.groups_dict[order + 1] = clans.get_group_dict(group['name'], group['size'], group['color'], order,
+                                                             group['numbers'])
+
+    # The edges are used as they are mapped, with their saved attraction values, so they can be streamed (version 1
+    # files have the pairs, which are converted to edges). The source pairs (if any) are written back from the mapped
+    # arrays.
+    def create_edges(self):
+        if 'pairs_indices' in self.arrays:
+            sp.set_edges(self.arrays['pairs_indices'][:, 0].astype(np.int64),
+                         self.arrays['pairs_indices'][:, 1].astype(np.int64), self.arrays['pairs_values'],
+                         self.type_of_values)
+            if self.type_of_values == 'hsp':
+                sp.calculate_attraction_values()
+        else:
+            sp.load_edges(self.arrays['edges_indices'], self.arrays['edges_minus_log_evalues'],
+                          self.arrays['edges_att_values'])
+            if 'source_pairs_indices' in self.arrays:
+                sp.set_pairs_source(self.file_path, 'clans-binary', self.read_pairs)
+
+    def read_pairs(self, file_path):
+        yield from sp.read_encoded_pairs(self.arrays['source_pairs_indices'], self.arrays['source_pairs_offsets'],
+                                         self.arrays['source_pairs_tokens'])
+
+    def write_file(self, file_path, is_param):
+        sequences = cfg.sequences_array[:cfg.run_params['total_sequences_num']]
+
+        coordinates = np.column_stack((sequences['x_coor'], sequences['y_coor'],
+                                       sequences['z_coor'])).astype('<f4')
+        titles_offsets, titles = encode_strings(seq.get_titles(range(sequences.shape[0])))
+        sequences_offsets, sequences_blob = encode_strings(seq.get_sequences(range(sequences.shape[0])))
+        arrays = {'coordinates': coordinates,
+                  'edges_indices': np.ascontiguousarray(cfg.edges_indices, dtype='<i4'),
+                  'edges_minus_log_evalues': np.ascontiguousarray(cfg.edges_minus_log_evalues, dtype='<f4'),
+                  'edges_att_values': np.ascontiguousarray(cfg.edges_att_values, dtype='<u2'),
+                  'titles_offsets': titles_offsets,
+                  'titles': titles,
+                  'sequences_offsets': sequences_offsets,
+                  'sequences': sequences_blob}
+        if sp.is_pairs_source_current():
+            arrays['source_pairs_indices'], arrays['source_pairs_offsets'], arrays['source_pairs_tokens'] = \
+                sp.encode_source_pairs()
+
+        groups = []
+        for group_ID in cfg.groups_dict:
+            groups.append({'name': str(cfg.groups_dict[group_ID]['name']),
+                           'size': str(cfg.groups_dict[group_ID]['size']),
+                           'color': str(cfg.groups_dict[group_ID]['color']),
+                           'numbers': [int(seq_index) for seq_index in cfg.groups_dict[group_ID]['seqIDs']]})
+
+        metadata = {'sequences_num': int(sequences.shape[0]),
+                    'type_of_values': cfg.run_params['type_of_values'],
+                    'params': clans.get_params() if is_param else {},
+                    'groups': groups,
+                    'sections': {}}
+
+        # Place the sections one after the other (aligned) after the metadata.
+        # The offsets are part of the metadata, so its length is fixed first by padding it.
+        for name, array in arrays.items():
+            metadata['sections'][name] = {'offset': 0, 'size': array.nbytes, 'dtype': array.dtype.str,
+                                          'shape': list(array.shape)}
+        metadata_len = len(json.dumps(metadata).encode()) + 32 * len(arrays)
+        offset = header_struct.size + metadata_len
+        for name, array in arrays.items():
+            offset += -offset % section_alignment
+            metadata['sections'][name]['offset'] = offset
+            offset += array.nbytes
+        metadata_bytes = json.dumps(metadata).encode().ljust(metadata_len)
+
+        # The file may be compressed (by its extension), so the alignment gaps are written and not skipped
+        with compression.open_output(file_path, 'wb') as output:
+            output.write(header_struct.pack(magic, format_version, metadata_len))
+            output.write(metadata_bytes)
+            position = header_struct.size + metadata_len
+            for name, array in arrays.items():
+                output.write(bytes(metadata['sections'][name]['offset'] - position))
+                output.write(array.data)
+                position = metadata['sections'][name]['offset'] + array.nbytes
@@ -0,0 +1,310 @@
+import re
+import warnings
+import numpy as np
+import numba
+import clans.io.parallel_reader as pr
+import clans.data.string_pool as string_pool
+
+# Bulk parsing of the numeric blocks of the CLANS formats (<pos>, <hsp>, <att>).
+# Instead of matching a regular expression on each line, the whole block is scanned once (in numba) to validate the
+# lines and extract the indices, and the value tokens are converted to floats in one call.
+# Large blocks are split into line-aligned byte ranges which are parsed concurrently (see parallel_reader).
+
+# The line formats (the same as the regular expressions used per line before):
+pos_mode = 0  # <index> <x> <y> <z>
+hsp_mode = 1  # <index1> <index2>:<E-value>
+att_mode = 2  # <index1> <index2> <attraction value>
+
+source_range_size = 1 << 26  # The pairs are read from the source file in ranges of 64 MB (see read_pairs())
+
+
+@numba.njit(nogil=True)
+def is_space(char):
+    # space, \t, \n, \v, \f, \r
+    return char == 32 or 9 <= char <= 13
+
+
+@numba.njit(nogil=True)
+def is_digit(char):
+    return 48 <= char <= 57
+
+
+# Scan the lines of a block (between start and end). For each line, parse the first index (and the second index, in hsp/att modes) and copy
+# the value tokens to 'tokens', separated by spaces.
+# Returns the number of valid lines before the first invalid one and the length of their tokens in the buffer.
+@numba.njit(nogil=True)
+def scan_block(buffer, start, end, mode, first_indices, second_indices, tokens):
+    length = end
+    tokens_num = 3 if mode == pos_mode else 1
+    pos = start
+    tokens_len = 0
+    line_num = 0
+
+    while pos < length:
+        line_tokens_len = tokens_len
+
+        # Skip leading whitespace (not including the line end)
+        while pos < length and buffer[pos] != 10 and is_space(buffer[pos]):
+            pos += 1
+
+        # The first index
+        if pos >= length or not is_digit(buffer[pos]):
+            return line_num, line_tokens_len
+        value = 0
+        while pos < length and is_digit(buffer[pos]):
+            value = value * 10 + buffer[pos] - 48
+            pos += 1
+        first_indices[line_num] = value
+
+        if mode != pos_mode:
+            # Whitespace, then the second index
+            if pos >= length or buffer[pos] == 10 or not is_space(buffer[pos]):
+                return line_num, line_tokens_len
+            while pos < length and buffer[pos] != 10 and is_space(buffer[pos]):
+                pos += 1
+            if pos >= length or not is_digit(buffer[pos]):
+                return line_num, line_tokens_len
+            value = 0
+            while pos < length and is_digit(buffer[pos]):
+                value = value * 10 + buffer[pos] - 48
+                pos += 1
+            second_indices[line_num] = value
+
+            # In hsp mode, the E-value comes right after a colon
+            if mode == hsp_mode:
+                if pos >= length or buffer[pos] != 58:
+                    return line_num, line_tokens_len
+                pos += 1
+
+        # The value tokens (non-whitespace), each one preceded by whitespace (except for the E-value)
+        for t in range(tokens_num):
+            if mode != hsp_mode:
+                if pos >= length or buffer[pos] == 10 or not is_space(buffer[pos]):
+                    return line_num, line_tokens_len
+                while pos < length and buffer[pos] != 10 and is_space(buffer[pos]):
+                    pos += 1
+            if pos >= length or is_space(buffer[pos]):
+                return line_num, line_tokens_len
+            while pos < length and not is_space(buffer[pos]):
+                tokens[tokens_len] = buffer[pos]
+                tokens_len += 1
+                pos += 1
+            tokens[tokens_len] = 32
+            tokens_len += 1
+
+        # Ignore the rest of the line
+        while pos < length and buffer[pos] != 10:
+            pos += 1
+        pos += 1
+        line_num += 1
+
+    return line_num, tokens_len
+
+
+# Decode a line of the mapped file (with a '\n' line end, as when reading the file in text mode)
+def decode_line(line_bytes):
+    line = line_bytes.decode()
+    if line.endswith('\r\n'):
+        line = line[:-2] + '\n'
+    return line
+
+
+# Find the end of a block whose content starts at 'start': a line containing only the closing tag.
+# Returns the position of the closing tag line and the position right after it
+# (the end of the data if there is no closing tag).
+def find_block_end(data, tag, start):
+    m = re.compile(b"^[^\\S\\n]*</" + tag.encode() + b">[^\\S\\n]*$", re.M).search(data, start)
+    if m is None:
+        return len(data), len(data)
+    return m.start(), pr.next_line_start(data, m.end(), len(data))
+
+
+# Scan the lines of one byte range of a block.
+# Returns: the number of valid lines (all the lines if they are valid), the total number of lines, the first
+# indices, the second indices (hsp/att) and the value tokens (bytes, separated by spaces) of the valid lines.
+def scan_range(buffer, start, end, mode):
+    lines_num = pr.count_lines(buffer, start, end)
+
+    first_indices = np.empty(lines_num, dtype=np.int64)
+    second_indices = np.empty(lines_num, dtype=np.int64)
+    tokens = np.empty(end - start + lines_num * 3, dtype=np.uint8)
+    valid_num, tokens_len = scan_block(buffer, start, end, mode, first_indices, second_indices, tokens)
+
+    return valid_num, lines_num, first_indices[:valid_num], second_indices[:valid_num], tokens[:tokens_len].tobytes()
+
+
+# Parse the lines of one byte range of a block.
+# Returns: the number of valid lines (all the lines if they are valid), the total number of lines, the first
+# indices, the second indices (hsp/att) and the values (a 2D (lines_num, 3) array of coordinates for pos).
+# In case there's an invalid line, the arrays hold only the lines before it.
+def parse_range(buffer, start, end, mode):
+    valid_num, lines_num, first_indices, second_indices, tokens_bytes = scan_range(buffer, start, end, mode)
+
+    # Convert all the value tokens at once
+    tokens_num = 3 if mode == pos_mode else 1
+    try:
+        values = np.fromstring(tokens_bytes, dtype=np.float64, sep=' ')
+    except ValueError:
+        values = None
+
+    # A value token is not a number - find it (token by token) and treat its line as invalid
+    if values is None or values.shape[0] != valid_num * tokens_num:
+        values_list = []
+        for token in tokens_bytes.split():
+            try:
+                values_list.append(float(token))
+            except ValueError:
+                break
+        valid_num = len(values_list) // tokens_num
+        values = np.array(values_list[:valid_num * tokens_num], dtype=np.float64)
+
+    if mode == pos_mode:
+        values = values.reshape((valid_num, 3))
+
+    return valid_num, lines_num, first_indices[:valid_num], second_indices[:valid_num], values
+
+
+# Parse a block of the given mode, found between start and end in the (memory-mapped) data.
+# The block is split into byte ranges which are parsed concurrently and the results are concatenated.
+# Returns the same as parse_range() for the whole block.
+def parse_block(data, start, end, mode):
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    ranges = pr.split_ranges(data, start, end)
+    # The warnings of np.fromstring (about tokens which are not numbers) are suppressed here, for all the threads,
+    # since catch_warnings() is not thread-safe
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = pr.parse_ranges(lambda buffer, range_start, range_end: parse_range(buffer, range_start, range_end,
+                                                                                     mode), buffer, ranges)
+    del buffer
+
+    if len(results) == 0:
+        return 0, 0, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), \
+            np.empty((0, 3) if mode == pos_mode else 0)
+
+    valid_num = 0
+    lines_num = 0
+    first_indices = []
+    second_indices = []
+    values = []
+    for range_valid_num, range_lines_num, range_first, range_second, range_values in results:
+        valid_num += range_valid_num
+        lines_num += range_lines_num
+        first_indices.append(range_first)
+        second_indices.append(range_second)
+        values.append(range_values)
+
+        # Ignore everything after the first invalid line
+        if range_valid_num < range_lines_num:
+            lines_num = valid_num + 1
+            break
+
+    return valid_num, lines_num, np.concatenate(first_indices), np.concatenate(second_indices), \
+        np.concatenate(values)
+
+
+# Returns the positions of the blocks of the CLANS file: [tag, start of the opening tag line, start of the content,
+# end of the content (the closing tag line), start of the next block]
+def find_blocks(data):
+    opening_tag = re.compile(b"^[^\\S\\n]*<(\\w+)>[^\\S\\n]*$", re.M)
+    blocks = []
+    offset = pr.next_line_start(data, 0, len(data))
+    while True:
+        m = opening_tag.search(data, offset)
+        if m is None:
+            break
+        tag = m.group(1).decode()
+        content_start = pr.next_line_start(data, m.end(), len(data))
+        content_end, offset = find_block_end(data, tag, content_start)
+        if len(blocks) > 0:
+            blocks[-1][4] = m.start()
+        blocks.append([tag, m.start(), content_start, content_end, offset])
+    return blocks
+
+
+# Read the pairs of the <hsp> and <att> blocks of a CLANS / minimal CLANS file, as they are kept when the file is read
+# (only the non-redundant HSPs, index1 < index2). The blocks are scanned in ranges of at most source_range_size bytes.
+# Yields chunks of (index1, index2, value tokens).
+def read_pairs(file_path):
+    data = pr.map_file(file_path)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    try:
+        for tag, start, content_start, content_end, end in find_blocks(data):
+            if tag not in ('hsp', 'att'):
+                continue
+            mode = hsp_mode if tag == 'hsp' else att_mode
+            range_start = content_start
+            while range_start < content_end:
+                range_end = pr.next_line_start(data, min(range_start + source_range_size, content_end) - 1,
+                                               content_end)
+                valid_num, lines_num, index1, index2, tokens_bytes = scan_range(buffer, range_start, range_end, mode)
+                tokens = np.array(tokens_bytes.decode().split(), dtype=object)
+                if mode == hsp_mode:
+                    is_upper = index1 < index2
+                    yield index1[is_upper], index2[is_upper], tokens[is_upper]
+                else:
+                    yield index1, index2, tokens
+                if valid_num < lines_num:
+                    break
+                range_start = range_end
+    finally:
+        del buffer
+        pr.unmap_file(data)
+
+
+# Index the lines of a <seq> block (between start and end): each line starting with '>' is a title, and each of the
+# other lines is the sequence of a record (stripped of whitespace), which has the last title before it.
+# Fills the positions of the titles and the sequences of the records and returns the number of records.
+@numba.njit(nogil=True)
+def scan_seq_block(buffer, start, end, title_starts, title_ends, seq_starts, seq_ends):
+    pos = start
+    title_start = start
+    title_end = start
+    records_num = 0
+
+    while pos < end:
+        line_end = pos
+        while line_end < end and buffer[line_end] != 10:
+            line_end += 1
+        next_pos = line_end + 1
+
+        # A title: the rest of the line (without the line end)
+        if buffer[pos] == 62 and line_end > pos + 1 and not (line_end == pos + 2 and buffer[pos + 1] == 13):
+            title_start = pos + 1
+            title_end = line_end
+            if buffer[title_end - 1] == 13:
+                title_end -= 1
+
+        # A sequence
+        else:
+            while pos < line_end and is_space(buffer[pos]):
+                pos += 1
+            while line_end > pos and is_space(buffer[line_end - 1]):
+                line_end -= 1
+            title_starts[records_num] = title_start
+            title_ends[records_num] = title_end
+            seq_starts[records_num] = pos
+            seq_ends[records_num] = line_end
+            records_num += 1
+
+        pos = next_pos
+
+    return records_num
+
+
+# Index the records of a <seq> block, found between start and end in the (memory-mapped) data.
+# Returns two StringPools, of the titles and of the sequences, sharing one buffer (a copy of the block).
+def parse_seq_block(data, start, end):
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    lines_num = pr.count_lines(buffer, start, end)
+    title_starts = np.empty(lines_num, dtype=np.int64)
+    title_ends = np.empty(lines_num, dtype=np.int64)
+    seq_starts = np.empty(lines_num, dtype=np.int64)
+    seq_ends = np.empty(lines_num, dtype=np.int64)
+    records_num = scan_seq_block(buffer, start, end, title_starts, title_ends, seq_starts, seq_ends)
+    del buffer
+
+    block = bytes(data[start:end])
+    titles = string_pool.StringPool(block, title_starts[:records_num] - start, title_ends[:records_num] - start)
+    sequences = string_pool.StringPool(block, seq_starts[:records_num] - start, seq_ends[:records_num] - start)
+    return titles, sequences
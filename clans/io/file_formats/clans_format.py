@@ -4,32 +4,134 @@ import numpy as np
 import clans.config as cfg
 import clans.data.sequences as seq
 import clans.data.sequence_pairs as sp
+import clans.data.string_pool as string_pool
+import clans.io.parallel_reader as pr
+import clans.io.batched_writer as bw
+import clans.io.compression as compression
+import clans.io.file_formats.clans_blocks as cb
+
+
+# Returns the parameters to save in the <param> block (the keys and values as they are written in the file)
+def get_params():
+    params = {'rounds_done': str(cfg.run_params['rounds_done'])}
+    if cfg.run_params['dimensions_num_for_clustering'] == 2:
+        params['cluster2d'] = 'true'
+    else:
+        params['cluster2d'] = 'false'
+    params['pval'] = str(cfg.run_params['similarity_cutoff'])
+    params['attfactor'] = str(cfg.run_params['att_val'])
+    params['attvalpow'] = str(cfg.run_params['att_exp'])
+    params['repfactor'] = str(cfg.run_params['rep_val'])
+    params['repvalpow'] = str(cfg.run_params['rep_exp'])
+    params['cooling'] = str(cfg.run_params['cooling'])
+    if 'current_temp' in cfg.run_params and cfg.run_params['cooling'] < 1:
+        params['currcool'] = str(cfg.run_params['current_temp'])
+    params['dampening'] = str(cfg.run_params['dampening'])
+    params['maxmove'] = str(cfg.run_params['maxmove'])
+    params['minattract'] = str(cfg.run_params['gravity'])
+    return params
+
+
+# Save the parameters of the <param> block (as returned by get_params()) in the 'run_params' dict
+def set_params(params):
+    if 'rounds_done' in params:
+        cfg.run_params['num_of_rounds'] = int(params['rounds_done'])
+    if 'cluster2d' in params:
+        if params['cluster2d'] == 'true':
+            cfg.run_params['dimensions_num_for_clustering'] = 2
+            print("dim num of clustering: " + str(cfg.run_params['dimensions_num_for_clustering']))
+        else:
+            cfg.run_params['dimensions_num_for_clustering'] = 3
+    if 'pval' in params:
+        cfg.run_params['similarity_cutoff'] = float(params['pval'])
+    if 'attfactor' in params:
+        cfg.run_params['att_val'] = float(params['attfactor'])
+    if 'attvalpow' in params:
+        cfg.run_params['att_exp'] = int(params['attvalpow'])
+    if 'repfactor' in params:
+        cfg.run_params['rep_val'] = float(params['repfactor'])
+    if 'repvalpow' in params:
+        cfg.run_params['rep_exp'] = int(params['repvalpow'])
+    if 'cooling' in params:
+        cfg.run_params['cooling'] = float(params['cooling'])
+    if 'currcool' in params:
+        cfg.run_params['current_temp'] = float(params['currcool'])
+    if 'dampening' in params:
+        cfg.run_params['dampening'] = float(params['dampening'])
+    if 'maxmove' in params:
+        cfg.run_params['maxmove'] = float(params['maxmove'])
+    if 'minattract' in params:
+        cfg.run_params['gravity'] = float(params['minattract'])
+
+
+# Returns the dict of a group (as in cfg.groups_dict) with the fields written in the <seqgroups> block
+def get_group_dict(name, size, color, order, seq_indices):
+    color_arr = color.split(';')
+    return {'name': name, 'size': size, 'order': order, 'name_size': 10, 'is_bold': True, 'is_italic': False,
+            'color': color, 'color_rgb': color_arr[0] + "," + color_arr[1] + "," + color_arr[2] + ",255",
+            'color_array': [int(color_arr[i]) / 255 for i in range(3)] + [1.0],
+            'seqIDs': {seq_index: 1 for seq_index in seq_indices}}
+
+
+def write_params_block(output, params):
+    output.write('<param>\n')
+    for k, v in params.items():
+        output.write(k + '=' + v + '\n')
+    output.write('</param>\n')
+
+
+def write_groups_block(output, groups_dict):
+    groups_block = ""
+    output.write('<seqgroups>\n')
+    for group_ID in groups_dict:
+
+        seq_ids_str = ""
+        for seq_index in groups_dict[group_ID]['seqIDs']:
+            seq_ids_str += str(seq_index) + ";"
+        groups_block += 'name=' + groups_dict[group_ID]['name'] + '\n'
+        groups_block += 'size=' + groups_dict[group_ID]['size'] + '\n'
+        groups_block += 'color=' + groups_dict[group_ID]['color'] + '\n'
+        groups_block += 'numbers=' + seq_ids_str + '\n'
+    output.write(groups_block)
+    output.write('</seqgroups>\n')
+
+
+# Write the coordinates (<pos>) block of the given x, y, z columns (float32)
+def write_pos_block(output, x_coor, y_coor, z_coor):
+    output.write('<pos>\n')
+    bw.write_rows(output, '%d %s %s %s\n', [np.arange(x_coor.shape[0]), bw.float32_to_str(x_coor),
+                                            bw.float32_to_str(y_coor), bw.float32_to_str(z_coor)])
+    output.write('</pos>\n')
 
 
 class ClansFormat:
 
     def __init__(self):
-        self.sequences_list = []
+        self.titles = []
+        self.sequences = []
         self.file_is_valid = 1
         self.error = ""
         self.type_of_values = ""
         self.is_groups = 0
+        self.file_path = ""
         self.file_name = ""
         self.params = {}
+        self.pos_indices = []
+        self.coordinates = []
+        self.pairs_index1 = []
+        self.pairs_index2 = []
+        self.pairs_values = []
 
     def read_file(self, file_path):
 
         in_param_block = 0
-        in_seq_block = 0
         in_seqgroups_block = 0
-        in_pos_block = 0
-        in_hsp_block = 0
-        in_att_block = 0
         found_seq_block = 0
         found_pos_block = 0
         found_hsp_block = 0
         found_att_block = 0
 
+        self.file_path = file_path
         self.file_name = os.path.basename(file_path)
 
         # Verify that the file exists
@@ -38,193 +140,169 @@ class ClansFormat:
             self.error = "The file \'" + file_path + "\' does not exist"
             return
 
-        # Open the CLANS file
-        with open(file_path) as infile:
-            # Read the first line (number of sequences)
-            line = infile.readline()
-            m = re.search("^sequences=(\d+)", line)
-            if m:
-                cfg.run_params['total_sequences_num'] = int(m.group(1))
-                print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
-            else:
-                self.file_is_valid = 0
-                self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
-                self.error += "The first line in the clans file must be: \'sequences=<number of sequences>\'"
-                return
-
-            # Create a 2D Numpy array for the similarity values and initialize it with 100
-            cfg.similarity_values_mtx = np.full([cfg.run_params['total_sequences_num'],
-                                                 cfg.run_params['total_sequences_num']], 100, dtype=float)
-            cfg.attraction_values_mtx = np.zeros([cfg.run_params['total_sequences_num'],
-                                                  cfg.run_params['total_sequences_num']])
-
-            # A loop over the rest of the lines
-            for line in infile:
-                if line.strip() == "<param>":
-                    in_param_block = 1
-                elif in_param_block:
-                    if line.strip() == "</param>":
-                        in_param_block = 0
-                    else:
-                        m = re.search("^(\w+)\=(.+)\n", line)
-                        if m:
-                            k = m.group(1)
-                            v = m.group(2)
-                            self.params[k] = v
-
-                elif line.strip() == "<seq>":
-                    in_seq_block = 1
-                    found_seq_block = 1
-                elif in_seq_block:
-                    if line.strip() == "</seq>":
-                        in_seq_block = 0
-                    else:
-                        m = re.search("^>(.+)", line)
-                        if m:
-                            title = m.group(1)
-                            title.strip()
-                        else:
-                            sequence = line.strip()
-                            t = (title, sequence)
-                            self.sequences_list.append(t)
-
-                elif line.strip() == "<seqgroups>":
-                    in_seqgroups_block = 1
-                    self.is_groups = 1
-                    group_ID = 1
-                    order = 0
-                elif in_seqgroups_block:
-                    if line.strip() == "</seqgroups>":
-                        in_seqgroups_block = 0
-                    else:
-                        m = re.search("^(\w+)\=(.+)\n", line)
-                        if m:
-                            k = m.group(1)
-                            v = m.group(2)
-                            if k == 'name':
-                                # Initialize the current group's dict
-                                d = {k: v}
-                            elif k == 'numbers':
-                                d['seqIDs'] = {}
-                                for num in (v.split(';')):
-                                    if num != '':
-                                        d['seqIDs'][int(num)] = 1
-                                # Add the dictionary with the current group's info to the groups dictionary
-                                cfg.groups_dict[group_ID] = d.copy()
-                                group_ID += 1
-                                order += 1
-                            elif k == 'color':
-                                d[k] = v
-                                color_arr = v.split(';')
-                                d['color_rgb'] = color_arr[0] + "," + color_arr[1] + "," + color_arr[2] + ",255"
-                                d['color_array'] = []
-                                for i in range(3):
-                                    d['color_array'].append(int(color_arr[i]) / 255)
-                                d['color_array'].append(1.0)
-                            else:
-                                d[k] = v
-                                d['order'] = order
-                                # Add a default for the group-name size, bold and italic states
-                                # (these parameters are not written in the clans file)
-                                d['name_size'] = 10
-                                d['is_bold'] = True
-                                d['is_italic'] = False
-
-                elif line.strip() == "<pos>":
-                    in_pos_block = 1
-                    found_pos_block = 1
-                elif in_pos_block:
-                    if line.strip() == "</pos>":
-                        in_pos_block = 0
-                    else:
-
-                        # If there was no <seq> lock, probably it's the minimal-clans format -> print an error
-                        if found_seq_block == 0:
-                            self.file_is_valid = 0
-                            self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
-                            self.error += "The full CLANS format must contain a sequences block (<seq>)\n" \
-                                          "including the original sequences in FASTA format\n" \
-                                          "Alternatively, load a file in 'minimal-clans' format"
-                            break
-
-                        m = re.search("^(\d+)\s+(\S+)\s+(\S+)\s+(\S+)", line.strip())
-                        if m:
-                            index = int(m.group(1))
-                            x_coor = m.group(2)
-                            y_coor = m.group(3)
-                            z_coor = m.group(4)
-                            # Create a tuple with the coordinates information + initialization for the 'in_group'
-                            # and 'in_subset' fields
-                            coor_tuple = (x_coor, y_coor, z_coor, -1, False, x_coor, y_coor, z_coor)
-                            self.sequences_list[index] += coor_tuple
-                        else:
-                            self.file_is_valid = 0
-                            self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
-                            self.error += "The coordinates (<pos> block) cannot be read. The correct format is:\n" \
-                                         "<sequence index> <coor_x> <coor_y> <coor_z>"
-                            break
-
-                elif line.strip() == "<hsp>":
-                    in_hsp_block = 1
-                    found_hsp_block = 1
-                elif in_hsp_block == 1:
-                    if line.strip() == "</hsp>":
-                        in_hsp_block = 0
-                    else:
-                        m = re.search("^(\d+)\s+(\d+):(\S+)", line.strip())
-                        if m:
-                            index1 = int(m.group(1))
-                            index2 = int(m.group(2))
-                            evalue = m.group(3)
-
-                            if index1 < index2:
-
-                                # Assign the Evalue to the pair + reciprocal pair
-                                if float(evalue) == 0.0:
-                                    cfg.similarity_values_mtx[index1][index2] = 10 ** -180
-                                    cfg.similarity_values_mtx[index2][index1] = 10 ** -180
-                                else:
-                                    cfg.similarity_values_mtx[index1][index2] = evalue
-                                    cfg.similarity_values_mtx[index2][index1] = evalue
-
-                                pair_tuple = (index1, index2, evalue)
-                                cfg.similarity_values_list.append(pair_tuple)
-                        else:
-                            self.file_is_valid = 0
-                            self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
-                            self.error += "The HSPs cannot be read. The correct format is:\n" \
-                                         "<sequence1 index> <sequence2 index>: <E-value>"
-                            break
-
-                elif line.strip() == "<att>":
-                    in_att_block = 1
-                    found_att_block = 1
-                elif in_att_block == 1:
-                    if line.strip() == "</att>":
-                        in_att_block = 0
-                    else:
-                        m = re.search("^(\d+)\s+(\d+)\s+(\S+)", line.strip())
-                        if m:
-                            index1 = int(m.group(1))
-                            index2 = int(m.group(2))
-                            att = m.group(3)
-                            # Assign the attraction value to the pair + reciprocal pair
-                            if 0.0 <= float(att) <= 1.0:
-                                cfg.attraction_values_mtx[index1][index2] = att
-                                cfg.attraction_values_mtx[index2][index1] = att
-                            else:
-                                self.file_is_valid = 0
-                                self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
-                                self.error += "Attraction values must be numbers between 0 and 1"
-                                break
-                            pair_tuple = (index1, index2, att)
-                            cfg.similarity_values_list.append(pair_tuple)
+        # Verify that the file can be decompressed (if it's compressed)
+        self.error = compression.get_input_error(file_path)
+        if self.error != "":
+            self.file_is_valid = 0
+            return
+
+        # Map the CLANS file to memory
+        data = pr.map_file(file_path)
+
+        # Read the first line (number of sequences)
+        offset = pr.next_line_start(data, 0, len(data))
+        line = cb.decode_line(data[0:offset])
+        m = re.search("^sequences=(\d+)", line)
+        if m:
+            cfg.run_params['total_sequences_num'] = int(m.group(1))
+            print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
+        else:
+            self.file_is_valid = 0
+            self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
+            self.error += "The first line in the clans file must be: \'sequences=<number of sequences>\'"
+            pr.unmap_file(data)
+            return
+
+        # A loop over the rest of the lines. The numeric blocks (<pos>, <hsp>, <att>) are parsed in bulk.
+        while offset < len(data):
+            next_offset = pr.next_line_start(data, offset, len(data))
+            line = cb.decode_line(data[offset:next_offset])
+            offset = next_offset
+
+            if line.strip() == "<param>":
+                in_param_block = 1
+            elif in_param_block:
+                if line.strip() == "</param>":
+                    in_param_block = 0
+                else:
+                    m = re.search("^(\w+)\=(.+)\n", line)
+                    if m:
+                        k = m.group(1)
+                        v = m.group(2)
+                        self.params[k] = v
+
+            # The records of the <seq> block are indexed in bulk, and their sequences are decoded only when needed
+            elif line.strip() == "<seq>":
+                found_seq_block = 1
+                block_end, next_offset = cb.find_block_end(data, 'seq', offset)
+                titles, sequences = cb.parse_seq_block(data, offset, block_end)
+                self.titles.append(titles)
+                self.sequences.append(sequences)
+                offset = next_offset
+
+            elif line.strip() == "<seqgroups>":
+                in_seqgroups_block = 1
+                self.is_groups = 1
+                group_ID = 1
+                order = 0
+            elif in_seqgroups_block:
+                if line.strip() == "</seqgroups>":
+                    in_seqgroups_block = 0
+                else:
+                    m = re.search("^(\w+)\=(.+)\n", line)
+                    if m:
+                        k = m.group(1)
+                        v = m.group(2)
+                        if k == 'name':
+                            # Initialize the current group's dict
+                            d = {k: v}
+                        elif k == 'numbers':
+                            d['seqIDs'] = {}
+                            for num in (v.split(';')):
+                                if num != '':
+                                    d['seqIDs'][int(num)] = 1
+                            # Add the dictionary with the current group's info to the groups dictionary
+                            cfg.groups_dict[group_ID] = d.copy()
+                            group_ID += 1
+                            order += 1
+                        elif k == 'color':
+                            d[k] = v
+                            color_arr = v.split(';')
+                            d['color_rgb'] = color_arr[0] + "," + color_arr[1] + "," + color_arr[2] + ",255"
+                            d['color_array'] = []
+                            for i in range(3):
+                                d['color_array'].append(int(color_arr[i]) / 255)
+                            d['color_array'].append(1.0)
                         else:
-                            self.file_is_valid = 0
-                            self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
-                            self.error += "The attraction values cannot be read. The correct format is:\n" \
-                                         "<sequence1 index> <sequence2 index>: <attraction value>"
-                            break
+                            d[k] = v
+                            d['order'] = order
+                            # Add a default for the group-name size, bold and italic states
+                            # (these parameters are not written in the clans file)
+                            d['name_size'] = 10
+                            d['is_bold'] = True
+                            d['is_italic'] = False
+
+            elif line.strip() == "<pos>":
+                found_pos_block = 1
+                block_end, next_offset = cb.find_block_end(data, 'pos', offset)
+                block_start = offset
+                offset = next_offset
+
+                # If there was no <seq> lock, probably it's the minimal-clans format -> print an error
+                if found_seq_block == 0 and block_end > block_start:
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
+                    self.error += "The full CLANS format must contain a sequences block (<seq>)\n" \
+                                  "including the original sequences in FASTA format\n" \
+                                  "Alternatively, load a file in 'minimal-clans' format"
+                    break
+
+                valid_num, lines_num, indices, ignored, coordinates = cb.parse_block(data, block_start, block_end, cb.pos_mode)
+                self.pos_indices.append(indices)
+                self.coordinates.append(coordinates)
+                if valid_num < lines_num:
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
+                    self.error += "The coordinates (<pos> block) cannot be read. The correct format is:\n" \
+                                  "<sequence index> <coor_x> <coor_y> <coor_z>"
+                    break
+
+            elif line.strip() == "<hsp>":
+                found_hsp_block = 1
+                block_end, next_offset = cb.find_block_end(data, 'hsp', offset)
+                block_start = offset
+                offset = next_offset
+
+                valid_num, lines_num, index1, index2, evalues = cb.parse_block(data, block_start, block_end, cb.hsp_mode)
+
+                # Keep only the non-redundant pairs (index1 < index2)
+                is_upper = index1 < index2
+                self.pairs_index1.append(index1[is_upper].astype(np.int32))
+                self.pairs_index2.append(index2[is_upper].astype(np.int32))
+                self.pairs_values.append(evalues[is_upper])
+                if valid_num < lines_num:
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
+                    self.error += "The HSPs cannot be read. The correct format is:\n" \
+                                  "<sequence1 index> <sequence2 index>: <E-value>"
+                    break
+
+            elif line.strip() == "<att>":
+                found_att_block = 1
+                block_end, next_offset = cb.find_block_end(data, 'att', offset)
+                block_start = offset
+                offset = next_offset
+
+                valid_num, lines_num, index1, index2, att_values = cb.parse_block(data, block_start, block_end, cb.att_mode)
+
+                # Verify that the attraction values are between 0 and 1
+                # (the values are of the lines before the first invalid one, if any, so they are checked first)
+                if not np.all((att_values >= 0.0) & (att_values <= 1.0)):
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
+                    self.error += "Attraction values must be numbers between 0 and 1"
+                    break
+                self.pairs_index1.append(index1.astype(np.int32))
+                self.pairs_index2.append(index2.astype(np.int32))
+                self.pairs_values.append(att_values)
+                if valid_num < lines_num:
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
+                    self.error += "The attraction values cannot be read. The correct format is:\n" \
+                                  "<sequence1 index> <sequence2 index>: <attraction value>"
+                    break
+
+        pr.unmap_file(data)
 
         # Check whether there is either <hsp> block or <att>
         if self.file_is_valid:
@@ -259,8 +337,13 @@ class ClansFormat:
             print(self.error)
 
     def fill_values(self):
-        # Create the structured NumPy array of sequences
-        seq.create_sequences_array(self.sequences_list)
+        # Create the structured NumPy array of sequences (the coordinates are placed according to their indices)
+        titles = string_pool.concatenate(self.titles)
+        sequences = string_pool.concatenate(self.sequences)
+        coordinates = np.zeros((len(titles), 3), dtype=np.float32)
+        for indices, block_coordinates in zip(self.pos_indices, self.coordinates):
+            coordinates[indices] = block_coordinates
+        seq.create_sequences_array_from_columns(titles, sequences, coordinates)
 
         # If there sre groups - add the information to the sequences_list
         if self.is_groups:
@@ -273,40 +356,13 @@ class ClansFormat:
             seq.add_in_group_column(in_groups_array)
 
         # If parameters were defined in the file - save them in the 'run_params' dict
-        if 'rounds_done' in self.params:
-            cfg.run_params['num_of_rounds'] = int(self.params['rounds_done'])
-        if 'cluster2d' in self.params:
-            if self.params['cluster2d'] == 'true':
-                cfg.run_params['dimensions_num_for_clustering'] = 2
-                print("dim num of clustering: " + str(cfg.run_params['dimensions_num_for_clustering']))
-            else:
-                cfg.run_params['dimensions_num_for_clustering'] = 3
-        if 'pval' in self.params:
-            cfg.run_params['similarity_cutoff'] = float(self.params['pval'])
-        if 'attfactor' in self.params:
-            cfg.run_params['att_val'] = float(self.params['attfactor'])
-        if 'attvalpow' in self.params:
-            cfg.run_params['att_exp'] = int(self.params['attvalpow'])
-        if 'repfactor' in self.params:
-            cfg.run_params['rep_val'] = float(self.params['repfactor'])
-        if 'repvalpow' in self.params:
-            cfg.run_params['rep_exp'] = int(self.params['repvalpow'])
-        if 'cooling' in self.params:
-            cfg.run_params['cooling'] = float(self.params['cooling'])
-        if 'currcool' in self.params:
-            cfg.run_params['current_temp'] = float(self.params['currcool'])
-        if 'dampening' in self.params:
-            cfg.run_params['dampening'] = float(self.params['dampening'])
-        if 'maxmove' in self.params:
-            cfg.run_params['maxmove'] = float(self.params['maxmove'])
-        if 'minattract' in self.params:
-            cfg.run_params['gravity'] = float(self.params['minattract'])
-
-        # Apply the similarity cutoff
+        set_params(self.params)
+
+        # Create the compact edges arrays (with the attraction values) and apply the similarity cutoff
+        self.create_edges()
         if self.type_of_values == "hsp":
             cfg.run_params['type_of_values'] = "hsp"
             cfg.run_params['similarity_cutoff'] = cfg.similarity_cutoff
-            sp.calculate_attraction_values()
             sp.define_connected_sequences('hsp')
         elif self.type_of_values == 'att':
             cfg.run_params['type_of_values'] = "att"
@@ -315,83 +371,48 @@ class ClansFormat:
                 cfg.run_params['similarity_cutoff'] = 0.1
             sp.define_connected_sequences('att')
 
-    def write_file(self, file_path, is_param):
-        seq_block = ""
-        pos_block = ""
+    # Create the compact edges arrays from the pairs which were read (and the attraction values of the HSPs). The
+    # pairs are not kept - they are read again from the file when they are written.
+    def create_edges(self):
+        sp.set_edges(np.concatenate(self.pairs_index1), np.concatenate(self.pairs_index2),
+                     np.concatenate(self.pairs_values), self.type_of_values)
+        sp.set_pairs_source(self.file_path, 'clans', cb.read_pairs)
+        if self.type_of_values == 'hsp':
+            sp.calculate_attraction_values()
 
-        output = open(file_path, "w")
+    def write_file(self, file_path, is_param):
+        output = compression.open_output(file_path, "w")
         output.write('sequences=' + str(cfg.run_params['total_sequences_num']) + '\n')
 
         # Write the parameters block
         if is_param:
-            output.write('<param>\n')
-            output.write('rounds_done='+str(cfg.run_params['rounds_done'])+'\n')
-            if cfg.run_params['dimensions_num_for_clustering'] == 2:
-                output.write('cluster2d=true\n')
-            else:
-                output.write('cluster2d=false\n')
-            output.write('pval=' + str(cfg.run_params['similarity_cutoff']) + '\n')
-            output.write('attfactor=' + str(cfg.run_params['att_val']) + '\n')
-            output.write('attvalpow=' + str(cfg.run_params['att_exp']) + '\n')
-            output.write('repfactor=' + str(cfg.run_params['rep_val']) + '\n')
-            output.write('repvalpow=' + str(cfg.run_params['rep_exp']) + '\n')
-            output.write('cooling=' + str(cfg.run_params['cooling']) + '\n')
-            if 'current_temp' in cfg.run_params and cfg.run_params['cooling'] < 1:
-                output.write('currcool=' + str(cfg.run_params['current_temp']) + '\n')
-            output.write('dampening=' + str(cfg.run_params['dampening']) + '\n')
-            output.write('maxmove=' + str(cfg.run_params['maxmove']) + '\n')
-            output.write('minattract=' + str(cfg.run_params['gravity']) + '\n')
-            output.write('</param>\n')
+            write_params_block(output, get_params())
 
         # Write the sequences block
-        for seq in range(cfg.run_params['total_sequences_num']):
-            seq_block += '>' + cfg.sequences_array['seq_title'][seq] + '\n' + cfg.sequences_array['sequence'][seq] + '\n'
-            pos_block += str(seq) + ' ' + str(cfg.sequences_array['x_coor'][seq]) + ' ' + \
-                         str(cfg.sequences_array['y_coor'][seq]) + ' ' + str(cfg.sequences_array['z_coor'][seq]) + '\n'
-
+        sequences = cfg.sequences_array[:cfg.run_params['total_sequences_num']]
         output.write('<seq>\n')
-        output.write(seq_block)
+        bw.write_rows(output, '>%s\n%s\n', [seq.get_titles(range(sequences.shape[0])),
+                                              seq.get_sequences(range(sequences.shape[0]))])
         output.write('</seq>\n')
 
         # Write the groups block
         if len(cfg.groups_dict) > 0:
-            groups_block = ""
-            output.write('<seqgroups>\n')
-            for group_ID in cfg.groups_dict:
-
-                seq_ids_str = ""
-                for seq_index in cfg.groups_dict[group_ID]['seqIDs']:
-                    seq_ids_str += str(seq_index) + ";"
-                groups_block += 'name=' + cfg.groups_dict[group_ID]['name'] + '\n'
-                groups_block += 'size=' + cfg.groups_dict[group_ID]['size'] + '\n'
-                groups_block += 'color=' + cfg.groups_dict[group_ID]['color'] + '\n'
-                groups_block += 'numbers=' + seq_ids_str + '\n'
-            output.write(groups_block)
-            output.write('</seqgroups>\n')
+            write_groups_block(output, cfg.groups_dict)
 
-        output.write('<pos>\n')
-        output.write(pos_block)
-        output.write('</pos>\n')
+        # Write the coordinates (<pos>) block
+        write_pos_block(output, sequences['x_coor'], sequences['y_coor'], sequences['z_coor'])
 
         # Write the HSPs (<hsp>) block
         if cfg.run_params['type_of_values'] == 'hsp':
             output.write('<hsp>\n')
-            for i in range(len(cfg.similarity_values_list)):
-                index1 = cfg.similarity_values_list[i][0]
-                index2 = cfg.similarity_values_list[i][1]
-                eval = cfg.similarity_values_list[i][2]
-                pair_str = str(index1) + " " + str(index2) + ":" + str(eval) + "\n"
-                output.write(pair_str)
+            for index1, index2, values in sp.get_pairs_chunks():
+                bw.write_rows(output, '%d %d:%s\n', [index1, index2, values])
             output.write('</hsp>')
         # Write the attraction values (<att>) block
         elif cfg.run_params['type_of_values'] == 'att':
             output.write('<att>\n')
-            for i in range(len(cfg.similarity_values_list)):
-                index1 = cfg.similarity_values_list[i][0]
-                index2 = cfg.similarity_values_list[i][1]
-                att = cfg.similarity_values_list[i][2]
-                pair_str = str(index1) + " " + str(index2) + " " + str(att) + "\n"
-                output.write(pair_str)
+            for index1, index2, values in sp.get_pairs_chunks():
+                bw.write_rows(output, '%d %d %s\n', [index1, index2, values])
             output.write('</att>')
 
         output.close()
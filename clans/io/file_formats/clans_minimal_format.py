@@ -4,6 +4,10 @@ import numpy as np
 import clans.config as cfg
 import clans.data.sequences as seq
 import clans.data.sequence_pairs as sp
+import clans.io.parallel_reader as pr
+import clans.io.batched_writer as bw
+import clans.io.compression as compression
+import clans.io.file_formats.clans_blocks as cb
 
 
 class ClansMinimalFormat:
@@ -13,19 +17,23 @@ class ClansMinimalFormat:
         self.file_is_valid = 1
         self.error = ""
         self.type_of_values = ""
+        self.file_path = ""
         self.file_name = ""
         self.is_groups = 0
+        self.pos_indices = []
+        self.coordinates = []
+        self.pairs_index1 = []
+        self.pairs_index2 = []
+        self.pairs_values = []
 
     def read_file(self, file_path):
 
-        in_pos_block = 0
-        in_hsp_block = 0
-        in_att_block = 0
         in_seqgroups_block = 0
         found_pos_block = 0
         found_hsp_block = 0
         found_att_block = 0
 
+        self.file_path = file_path
         self.file_name = os.path.basename(file_path)
 
         # Verify that the file exists
@@ -34,156 +42,139 @@ class ClansMinimalFormat:
             self.error = "The file \'" + file_path + "\' does not exist"
             return
 
-        # Open the CLANS file
-        with open(file_path) as infile:
-            # Read the first line (number of sequences)
-            line = infile.readline()
-            m = re.search("^sequences=(\d+)", line)
-            if m:
-                cfg.run_params['total_sequences_num'] = int(m.group(1))
-                print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
-            else:
-                self.file_is_valid = 0
-                self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
-                self.error += "The first line in the clans file must be: \'sequences=<number of sequences>\'"
-                return
-
-            # Create a 2D Numpy array for the similarity values and initialize it with 100
-            cfg.similarity_values_mtx = np.full([cfg.run_params['total_sequences_num'],
-                                                 cfg.run_params['total_sequences_num']], 100, dtype=float)
-            cfg.attraction_values_mtx = np.zeros([cfg.run_params['total_sequences_num'],
-                                                  cfg.run_params['total_sequences_num']])
-
-            # A loop over the rest of the lines
-            for line in infile:
-
-                if line.strip() == "<pos>":
-                    in_pos_block = 1
-                    found_pos_block = 1
-                elif in_pos_block:
-                    if line.strip() == "</pos>":
-                        in_pos_block = 0
-                    else:
-                        m = re.search("^(\d+)\s+(\S+)\s+(\S+)\s+(\S+)", line.strip())
-                        if m:
-                            index = int(m.group(1))
-                            x_coor = m.group(2)
-                            y_coor = m.group(3)
-                            z_coor = m.group(4)
-                            # Create a tuple with the coordinates information + initialization for the 'in_group'
-                            # and 'in_subset' fields
-                            coor_tuple = (index, "", x_coor, y_coor, z_coor, -1, False, x_coor, y_coor, z_coor)
-                            self.sequences_list.append(coor_tuple)
-                        else:
-                            self.file_is_valid = 0
-                            self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
-                            self.error += "The coordinates (<pos> block) cannot be read. The correct format is:\n" \
-                                         "<sequence index> <coor_x> <coor_y> <coor_z>"
-                            break
-
-                elif line.strip() == "<hsp>":
-                    in_hsp_block = 1
-                    found_hsp_block = 1
-                elif in_hsp_block == 1:
-                    if line.strip() == "</hsp>":
-                        in_hsp_block = 0
-                    else:
-                        m = re.search("^(\d+)\s+(\d+):(\S+)", line.strip())
-                        if m:
-                            index1 = int(m.group(1))
-                            index2 = int(m.group(2))
-                            evalue = m.group(3)
-
-                            if index1 < index2:
-
-                                # Assign the Evalue to the pair + reciprocal pair
-                                if float(evalue) == 0.0:
-                                    cfg.similarity_values_mtx[index1][index2] = 10 ** -180
-                                    cfg.similarity_values_mtx[index2][index1] = 10 ** -180
-                                else:
-                                    cfg.similarity_values_mtx[index1][index2] = evalue
-                                    cfg.similarity_values_mtx[index2][index1] = evalue
-
-                                pair_tuple = (index1, index2, evalue)
-                                cfg.similarity_values_list.append(pair_tuple)
-                        else:
-                            self.file_is_valid = 0
-                            self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
-                            self.error += "The HSPs cannot be read. The correct format is:\n" \
-                                         "<sequence1 index> <sequence2 index>: <E-value>"
-                            break
-
-                elif line.strip() == "<att>":
-                    in_att_block = 1
-                    found_att_block = 1
-                elif in_att_block == 1:
-                    if line.strip() == "</att>":
-                        in_att_block = 0
-                    else:
-                        m = re.search("^(\d+)\s+(\d+)\s+(\S+)", line.strip())
-                        if m:
-                            index1 = int(m.group(1))
-                            index2 = int(m.group(2))
-                            att = m.group(3)
-                            # Assign the attraction value to the pair + reciprocal pair
-                            if 0.0 <= float(att) <= 1.0:
-                                cfg.attraction_values_mtx[index1][index2] = att
-                                cfg.attraction_values_mtx[index2][index1] = att
-                            else:
-                                self.file_is_valid = 0
-                                self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
-                                self.error += "Attraction values must be numbers between 0 and 1"
-                                break
-                            pair_tuple = (index1, index2, att)
-                            cfg.similarity_values_list.append(pair_tuple)
+        # Verify that the file can be decompressed (if it's compressed)
+        self.error = compression.get_input_error(file_path)
+        if self.error != "":
+            self.file_is_valid = 0
+            return
+
+        # Map the CLANS file to memory
+        data = pr.map_file(file_path)
+
+        # Read the first line (number of sequences)
+        offset = pr.next_line_start(data, 0, len(data))
+        line = cb.decode_line(data[0:offset])
+        m = re.search("^sequences=(\d+)", line)
+        if m:
+            cfg.run_params['total_sequences_num'] = int(m.group(1))
+            print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
+        else:
+            self.file_is_valid = 0
+            self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
+            self.error += "The first line in the clans file must be: \'sequences=<number of sequences>\'"
+            pr.unmap_file(data)
+            return
+
+        # A loop over the rest of the lines. The numeric blocks (<pos>, <hsp>, <att>) are parsed in bulk.
+        while offset < len(data):
+            next_offset = pr.next_line_start(data, offset, len(data))
+            line = cb.decode_line(data[offset:next_offset])
+            offset = next_offset
+
+            if line.strip() == "<pos>":
+                found_pos_block = 1
+                block_end, next_offset = cb.find_block_end(data, 'pos', offset)
+                block_start = offset
+                offset = next_offset
+
+                valid_num, lines_num, indices, ignored, coordinates = cb.parse_block(data, block_start, block_end, cb.pos_mode)
+                self.pos_indices.append(indices)
+                self.coordinates.append(coordinates)
+                if valid_num < lines_num:
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
+                    self.error += "The coordinates (<pos> block) cannot be read. The correct format is:\n" \
+                                  "<sequence index> <coor_x> <coor_y> <coor_z>"
+                    break
+
+            elif line.strip() == "<hsp>":
+                found_hsp_block = 1
+                block_end, next_offset = cb.find_block_end(data, 'hsp', offset)
+                block_start = offset
+                offset = next_offset
+
+                valid_num, lines_num, index1, index2, evalues = cb.parse_block(data, block_start, block_end, cb.hsp_mode)
+
+                # Keep only the non-redundant pairs (index1 < index2)
+                is_upper = index1 < index2
+                self.pairs_index1.append(index1[is_upper].astype(np.int32))
+                self.pairs_index2.append(index2[is_upper].astype(np.int32))
+                self.pairs_values.append(evalues[is_upper])
+                if valid_num < lines_num:
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
+                    self.error += "The HSPs cannot be read. The correct format is:\n" \
+                                  "<sequence1 index> <sequence2 index>: <E-value>"
+                    break
+
+            elif line.strip() == "<att>":
+                found_att_block = 1
+                block_end, next_offset = cb.find_block_end(data, 'att', offset)
+                block_start = offset
+                offset = next_offset
+
+                valid_num, lines_num, index1, index2, att_values = cb.parse_block(data, block_start, block_end, cb.att_mode)
+
+                # Verify that the attraction values are between 0 and 1
+                # (the values are of the lines before the first invalid one, if any, so they are checked first)
+                if not np.all((att_values >= 0.0) & (att_values <= 1.0)):
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid minimal-clans format:\n"
+                    self.error += "Attraction values must be numbers between 0 and 1"
+                    break
+                self.pairs_index1.append(index1.astype(np.int32))
+                self.pairs_index2.append(index2.astype(np.int32))
+                self.pairs_values.append(att_values)
+                if valid_num < lines_num:
+                    self.file_is_valid = 0
+                    self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
+                    self.error += "The attraction values cannot be read. The correct format is:\n" \
+                                  "<sequence1 index> <sequence2 index>: <attraction value>"
+                    break
+
+            elif line.strip() == "<seqgroups>":
+                in_seqgroups_block = 1
+                self.is_groups = 1
+                group_ID = 1
+                order = 0
+            elif in_seqgroups_block:
+                if line.strip() == "</seqgroups>":
+                    in_seqgroups_block = 0
+                else:
+                    m = re.search("^(\w+)\=(.+)\n", line)
+                    if m:
+                        k = m.group(1)
+                        v = m.group(2)
+                        if k == 'name':
+                            # Initialize the current group's dict
+                            d = {k: v}
+                        elif k == 'numbers':
+                            d['seqIDs'] = {}
+                            for num in (v.split(';')):
+                                if num != '':
+                                    d['seqIDs'][int(num)] = 1
+                            # Add the dictionary with the current group's info to the groups dictionary
+                            cfg.groups_dict[group_ID] = d.copy()
+                            group_ID += 1
+                            order += 1
+                        elif k == 'color':
+                            d[k] = v
+                            color_arr = v.split(';')
+                            d['color_rgb'] = color_arr[0] + "," + color_arr[1] + "," + color_arr[2] + ",255"
+                            d['color_array'] = []
+                            for i in range(3):
+                                d['color_array'].append(int(color_arr[i]) / 255)
+                            d['color_array'].append(1.0)
                         else:
-                            self.file_is_valid = 0
-                            self.error = "The file " + self.file_name + " has invalid CLANS format:\n"
-                            self.error += "The attraction values cannot be read. The correct format is:\n" \
-                                         "<sequence1 index> <sequence2 index>: <attraction value>"
-                            break
-
-                elif line.strip() == "<seqgroups>":
-                    in_seqgroups_block = 1
-                    self.is_groups = 1
-                    group_ID = 1
-                    order = 0
-                elif in_seqgroups_block:
-                    if line.strip() == "</seqgroups>":
-                        in_seqgroups_block = 0
-                    else:
-                        m = re.search("^(\w+)\=(.+)\n", line)
-                        if m:
-                            k = m.group(1)
-                            v = m.group(2)
-                            if k == 'name':
-                                # Initialize the current group's dict
-                                d = {k: v}
-                            elif k == 'numbers':
-                                d['seqIDs'] = {}
-                                for num in (v.split(';')):
-                                    if num != '':
-                                        d['seqIDs'][int(num)] = 1
-                                # Add the dictionary with the current group's info to the groups dictionary
-                                cfg.groups_dict[group_ID] = d.copy()
-                                group_ID += 1
-                                order += 1
-                            elif k == 'color':
-                                d[k] = v
-                                color_arr = v.split(';')
-                                d['color_rgb'] = color_arr[0] + "," + color_arr[1] + "," + color_arr[2] + ",255"
-                                d['color_array'] = []
-                                for i in range(3):
-                                    d['color_array'].append(int(color_arr[i]) / 255)
-                                d['color_array'].append(1.0)
-                            else:
-                                d[k] = v
-                                d['order'] = order
-                                # Add a default for the group-name size, bold and italic states
-                                # (these parameters are not written in the clans file)
-                                d['name_size'] = 10
-                                d['is_bold'] = True
-                                d['is_italic'] = False
+                            d[k] = v
+                            d['order'] = order
+                            # Add a default for the group-name size, bold and italic states
+                            # (these parameters are not written in the clans file)
+                            d['name_size'] = 10
+                            d['is_bold'] = True
+                            d['is_italic'] = False
+
+        pr.unmap_file(data)
 
         # Check whether there is either <hsp> block or <att>
         if self.file_is_valid:
@@ -213,8 +204,9 @@ class ClansMinimalFormat:
             print(self.error)
 
     def fill_values(self):
-        # Create the structured NumPy array of sequences
-        seq.create_sequences_array(self.sequences_list)
+        # Create the structured NumPy array of sequences (in the order of the <pos> block, titled by their indices)
+        indices = np.concatenate(self.pos_indices)
+        seq.create_sequences_array_from_columns(indices.astype(str), "", np.concatenate(self.coordinates))
 
         # If there sre groups - add the information to the sequences_list
         if self.is_groups:
@@ -226,7 +218,11 @@ class ClansMinimalFormat:
                         in_groups_array[seq_index] = group_ID
             seq.add_in_group_column(in_groups_array)
 
-        # Apply the similarity cutoff
+        # Create the compact edges arrays and apply the similarity cutoff.
+        # The pairs are not kept - they are read again from the file when they are written.
+        sp.set_edges(np.concatenate(self.pairs_index1), np.concatenate(self.pairs_index2),
+                     np.concatenate(self.pairs_values), self.type_of_values)
+        sp.set_pairs_source(self.file_path, 'mini-clans', cb.read_pairs)
         if self.type_of_values == "hsp":
             cfg.run_params['type_of_values'] = "hsp"
             cfg.run_params['similarity_cutoff'] = cfg.similarity_cutoff
@@ -240,39 +236,28 @@ class ClansMinimalFormat:
             sp.define_connected_sequences('att')
 
     def write_file(self, file_path, is_param):
-        pos_block = ""
-
-        output = open(file_path, "w")
+        output = compression.open_output(file_path, "w")
         output.write('sequences=' + str(cfg.run_params['total_sequences_num']) + '\n')
 
         # Write the coordinates (<pos>) block
-        for seq in range(cfg.run_params['total_sequences_num']):
-            pos_block += str(seq) + ' ' + str(cfg.sequences_array['x_coor'][seq]) + ' ' + \
-                         str(cfg.sequences_array['y_coor'][seq]) + ' ' + str(cfg.sequences_array['z_coor'][seq]) + '\n'
-
+        sequences = cfg.sequences_array[:cfg.run_params['total_sequences_num']]
         output.write('<pos>\n')
-        output.write(pos_block)
+        bw.write_rows(output, '%d %s %s %s\n', [np.arange(sequences.shape[0]), bw.float32_to_str(sequences['x_coor']),
+                                                bw.float32_to_str(sequences['y_coor']),
+                                                bw.float32_to_str(sequences['z_coor'])])
         output.write('</pos>\n')
 
         # Write the HSPs (<hsp>) block
         if cfg.run_params['type_of_values'] == 'hsp':
             output.write('<hsp>\n')
-            for i in range(len(cfg.similarity_values_list)):
-                index1 = cfg.similarity_values_list[i][0]
-                index2 = cfg.similarity_values_list[i][1]
-                eval = cfg.similarity_values_list[i][2]
-                pair_str = str(index1) + " " + str(index2) + ":" + str(eval) + "\n"
-                output.write(pair_str)
+            for index1, index2, values in sp.get_pairs_chunks():
+                bw.write_rows(output, '%d %d:%s\n', [index1, index2, values])
             output.write('</hsp>')
         # Write the attraction values (<att>) block
         elif cfg.run_params['type_of_values'] == 'att':
             output.write('<att>\n')
-            for i in range(len(cfg.similarity_values_list)):
-                index1 = cfg.similarity_values_list[i][0]
-                index2 = cfg.similarity_values_list[i][1]
-                att = cfg.similarity_values_list[i][2]
-                pair_str = str(index1) + " " + str(index2) + " " + str(att) + "\n"
-                output.write(pair_str)
+            for index1, index2, values in sp.get_pairs_chunks():
+                bw.write_rows(output, '%d %d %s\n', [index1, index2, values])
             output.write('</att>')
 
         output.write('\n')
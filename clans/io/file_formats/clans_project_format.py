@@ -0,0 +1,236 @@
+import os
+import json
+import mmap
+import numpy as np
+import clans.config as cfg
+import clans.data.string_pool as string_pool
+import clans.data.sequences as seq
+import clans.data.sequence_pairs as sp
+import clans.io.file_formats.clans_format as clans
+
+# A CLANS project: a directory of memory-mapped arrays, for maps which are too large to be parsed on every launch
+# (or to be held in memory). Opening a project maps its arrays without reading them - the data is paged in by the OS
+# when it's accessed. The edges are saved after their creation, so they don't need to be recalculated either.
+#
+# Directory layout:
+# - project.json: the format version, the number of sequences, the type of values (hsp/att), the parameters (the
+#   <param> block, as written in the CLANS file) and the groups (name, size, color and number of members).
+#   It's written last, so a directory without it is not a (complete) project.
+# - coordinates.npy: float32 (N, 3). A layout saved to the same project is written into it in place.
+# - in_group.npy: int16 (N), the group index of each sequence (-1 = no group).
+# - groups_members.npy: int32, the sequence indices of all the groups (group after group, in the order of the groups).
+# - edges_indices.npy, edges_minus_log_evalues.npy, edges_att_values.npy: the compact edges arrays (as in config.py).
+# - titles.bin, sequences.bin: the UTF-8 strings, one after the other, with their int64 offsets (N + 1) in
+#   titles_offsets.npy and sequences_offsets.npy.
+# - source_pairs_indices.npy, source_pairs_offsets.npy, source_pairs_tokens.npy: if the pairs were loaded from a file
+#   (see sequence_pairs.set_pairs_source()), the pairs as they were read, so they are written back to a CLANS file
+#   without changes: their indices (int32, (P, 2)), and their value tokens as int64 offsets (P + 1) into an ASCII blob
+#   of newline-terminated tokens (uint8).
+# Version 1 projects also have pairs_indices.npy and pairs_values.npy (the pairs as read from the input), which are
+# not used.
+
+format_version = 3
+metadata_file = 'project.json'
+
+# The arrays which are not changed after the project is created (written only when saving a new project)
+static_arrays = ['edges_indices', 'edges_minus_log_evalues', 'edges_att_values',
+                 'titles_offsets', 'sequences_offsets']
+source_pairs_arrays = ['source_pairs_indices', 'source_pairs_offsets', 'source_pairs_tokens']
+
+
+def get_array_path(dir_path, name):
+    return os.path.join(dir_path, name + '.npy')
+
+
+# Returns True if the array is memory-mapped from the given file
+def is_mapped_from(array, file_path):
+    return isinstance(array, np.memmap) and array.filename is not None and \
+        os.path.realpath(array.filename) == os.path.realpath(file_path)
+
+
+# Map a strings file to memory (an empty file cannot be mapped)
+def map_strings(file_path):
+    if os.path.getsize(file_path) == 0:
+        return b''
+    with open(file_path, 'rb') as infile:
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Write the (encoded) strings of the pool one after the other, in chunks. Returns their offsets (int64, N + 1).
+def write_strings(file_path, pool):
+    offsets = np.zeros(len(pool) + 1, dtype='<i8')
+    np.cumsum(pool.ends - pool.starts, out=offsets[1:])
+    chunk_size = 1 << 16
+    with open(file_path, 'wb') as output:
+        for start in range(0, len(pool), chunk_size):
+            chunk = range(start, min(start + chunk_size, len(pool)))
+            output.write(b''.join([pool.buffer[pool.starts[i]:pool.ends[i]] for i in chunk]))
+    return offsets
+
+
+class ClansProjectFormat:
+
+    def __init__(self):
+        self.file_is_valid = 1
+        self.error = ""
+        self.file_name = ""
+        self.metadata = None
+        self.arrays = {}
+        self.titles = None
+        self.sequences = None
+
+    def read_file(self, dir_path):
+
+        self.file_name = os.path.basename(os.path.normpath(dir_path))
+
+        # Verify that the project exists
+        if not os.path.isdir(dir_path):
+            self.file_is_valid = 0
+            self.error = "The project directory \'" + dir_path + "\' does not exist"
+            return
+        if not os.path.isfile(os.path.join(dir_path, metadata_file)):
+            self.file_is_valid = 0
+            self.error = "The directory " + self.file_name + " is not a CLANS project (or it was not completely " \
+                                                             "saved)"
+            print(self.error)
+            return
+
+        try:
+            with open(os.path.join(dir_path, metadata_file)) as infile:
+                self.metadata = json.load(infile)
+        except ValueError:
+            self.metadata = None
+
+        if self.metadata is None or self.metadata.get('format_version', 0) > format_version:
+            self.file_is_valid = 0
+            self.error = "The project " + self.file_name + " is corrupted or was saved in a newer version of " \
+                                                           "CLANS"
+            print(self.error)
+            return
+
+        # Map the arrays (the small groups arrays are read, since they are rewritten on every save)
+        try:
+            for name in static_arrays + ['coordinates']:
+                self.arrays[name] = np.load(get_array_path(dir_path, name), mmap_mode='r')
+            for name in source_pairs_arrays:
+                if os.path.isfile(get_array_path(dir_path, name)):
+                    self.arrays[name] = np.load(get_array_path(dir_path, name), mmap_mode='r')
+            for name in ['in_group', 'groups_members']:
+                self.arrays[name] = np.load(get_array_path(dir_path, name))
+            titles_buffer = map_strings(os.path.join(dir_path, 'titles.bin'))
+            sequences_buffer = map_strings(os.path.join(dir_path, 'sequences.bin'))
+        except (OSError, ValueError) as error:
+            self.file_is_valid = 0
+            self.error = "The project " + self.file_name + " is corrupted:\n" + str(error)
+            print(self.error)
+            return
+
+        self.titles = string_pool.StringPool(titles_buffer, self.arrays['titles_offsets'][:-1],
+                                             self.arrays['titles_offsets'][1:])
+        self.sequences = string_pool.StringPool(sequences_buffer, self.arrays['sequences_offsets'][:-1],
+                                                self.arrays['sequences_offsets'][1:])
+
+        cfg.run_params['total_sequences_num'] = self.metadata['sequences_num']
+        print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
+
+    def fill_values(self):
+        seq.create_sequences_array_from_columns(self.titles, self.sequences, self.arrays['coordinates'])
+        seq.add_in_group_column(self.arrays['in_group'])
+
+        # The groups (the same fields as in the <seqgroups> block)
+        members_ends = np.cumsum([group['members_num'] for group in self.metadata['groups']], dtype=np.int64)
+        for order, group in enumerate(self.metadata['groups']):
+            members = self.arrays['groups_members'][members_ends[order] - group['members_num']:members_ends[order]]
+            cfg.groups_dict[order + 1] = clans.get_group_dict(group['name'], group['size'], group['color'], order,
+                                                             members.tolist())
+
+        clans.set_params(self.metadata['params'])
+
+        # The edges are used as they are mapped (they were already created when the project was saved) - only the
+        # connected edges are marked according to the similarity cutoff
+        sp.load_edges(self.arrays['edges_indices'], self.arrays['edges_minus_log_evalues'],
+                      self.arrays['edges_att_values'])
+        if 'source_pairs_tokens' in self.arrays:
+            sp.set_pairs_source(self.arrays['source_pairs_tokens'].filename, 'clans-project', self.read_pairs)
+
+        cfg.run_params['type_of_values'] = self.metadata['type_of_values']
+        if self.metadata['type_of_values'] == "hsp":
+            cfg.run_params['similarity_cutoff'] = cfg.similarity_cutoff
+            sp.define_connected_sequences('hsp')
+        else:
+            # If the user forgot to set the P-value between 0-1 (to match attraction values), set it to 0.1
+            if cfg.run_params['similarity_cutoff'] < 0.1:
+                cfg.run_params['similarity_cutoff'] = 0.1
+            sp.define_connected_sequences('att')
+
+    def read_pairs(self, file_path):
+        yield from sp.read_encoded_pairs(self.arrays['source_pairs_indices'], self.arrays['source_pairs_offsets'],
+                                         self.arrays['source_pairs_tokens'])
+
+    # Save the project to the given directory. If the loaded data is mapped from the same project, only the
+    # coordinates, the groups and the metadata are written (the coordinates in place).
+    def write_file(self, dir_path, is_param):
+        sequences = cfg.sequences_array[:cfg.run_params['total_sequences_num']]
+        sequences_num = sequences.shape[0]
+
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+
+        # Remove the metadata first, so an interrupted save doesn't leave a project with mismatching arrays
+        metadata_path = os.path.join(dir_path, metadata_file)
+        is_same_project = os.path.isfile(metadata_path) and \
+            is_mapped_from(cfg.edges_indices, get_array_path(dir_path, 'edges_indices'))
+        if os.path.isfile(metadata_path):
+            os.remove(metadata_path)
+
+        if not is_same_project:
+            arrays = {'edges_indices': np.asarray(cfg.edges_indices, dtype='<i4'),
+                      'edges_minus_log_evalues': np.asarray(cfg.edges_minus_log_evalues, dtype='<f4'),
+                      'edges_att_values': np.asarray(cfg.edges_att_values, dtype='<u2'),
+                      'titles_offsets': write_strings(os.path.join(dir_path, 'titles.bin'), cfg.titles_pool),
+                      'sequences_offsets': write_strings(os.path.join(dir_path, 'sequences.bin'),
+                                                         cfg.sequences_pool)}
+            # The source pairs of another project in the directory are removed if there are none to write
+            if sp.is_pairs_source_current():
+                arrays['source_pairs_indices'], arrays['source_pairs_offsets'], arrays['source_pairs_tokens'] = \
+                    sp.encode_source_pairs()
+            for name in source_pairs_arrays:
+                if name not in arrays and os.path.isfile(get_array_path(dir_path, name)):
+                    os.remove(get_array_path(dir_path, name))
+            for name, array in arrays.items():
+                np.save(get_array_path(dir_path, name), array)
+
+        # The coordinates are written into the existing array (if it has the same shape)
+        coordinates_path = get_array_path(dir_path, 'coordinates')
+        if is_same_project:
+            coordinates = np.load(coordinates_path, mmap_mode='r+')
+        else:
+            coordinates = np.lib.format.open_memmap(coordinates_path, mode='w+', dtype='<f4',
+                                                    shape=(sequences_num, 3))
+        coordinates[:, 0] = sequences['x_coor']
+        coordinates[:, 1] = sequences['y_coor']
+        coordinates[:, 2] = sequences['z_coor']
+        coordinates.flush()
+        del coordinates
+
+        groups = []
+        groups_members = []
+        for group_ID in cfg.groups_dict:
+            members = np.fromiter(cfg.groups_dict[group_ID]['seqIDs'], dtype=np.int64)
+            groups.append({'name': str(cfg.groups_dict[group_ID]['name']),
+                           'size': str(cfg.groups_dict[group_ID]['size']),
+                           'color': str(cfg.groups_dict[group_ID]['color']),
+                           'members_num': int(members.shape[0])})
+            groups_members.append(members)
+        np.save(get_array_path(dir_path, 'groups_members'),
+                np.concatenate(groups_members + [np.empty(0, dtype=np.int64)]).astype('<i4'))
+        np.save(get_array_path(dir_path, 'in_group'), np.asarray(sequences['in_group'], dtype='<i2'))
+
+        metadata = {'format_version': format_version,
+                    'sequences_num': int(sequences_num),
+                    'type_of_values': cfg.run_params['type_of_values'],
+                    'params': clans.get_params() if is_param else {},
+                    'groups': groups}
+        with open(metadata_path + '.tmp', 'w') as output:
+            json.dump(metadata, output)
+        os.replace(metadata_path + '.tmp', metadata_path)
@@ -1,40 +1,132 @@
+import os
 from Bio import SeqIO
-import random
+import numpy as np
+import numba
 import clans.config as cfg
 import clans.data.sequences as seq
-import clans.data.sequence_pairs as sp
+import clans.data.string_pool as string_pool
+import clans.io.parallel_reader as pr
+import clans.io.compression as compression
+import clans.io.file_formats.clans_blocks as cb
+
+# The FASTA file is memory-mapped and its records are indexed in one pass (in numba), copying the titles and the
+# residues directly into two buffers (StringPools), without creating an object per record.
+# Files that the scanner doesn't accept (with text before the first record) are read by Biopython instead.
+
+
+# Scan the records of the FASTA data: a title line starts with '>' and the following lines (until the next title)
+# hold the residues (whitespace is removed). The titles (without the '>' and the trailing whitespace) are copied to
+# 'titles' and the residues to 'residues', and the positions of each record in them are saved.
+# Returns the number of records, the lengths of the titles and residues buffers and whether the data is valid
+# (not valid if there is any text before the first title).
+@numba.njit(nogil=True)
+def scan_records(buffer, title_starts, title_ends, seq_starts, seq_ends, titles, residues):
+    length = buffer.shape[0]
+    pos = 0
+    records_num = 0
+    titles_len = 0
+    residues_len = 0
+
+    while pos < length:
+        line_end = pos
+        while line_end < length and buffer[line_end] != 10:
+            line_end += 1
+
+        # A title line - start a new record
+        if buffer[pos] == 62:
+            if records_num > 0:
+                seq_ends[records_num - 1] = residues_len
+            title_end = line_end
+            while title_end > pos + 1 and cb.is_space(buffer[title_end - 1]):
+                title_end -= 1
+            title_starts[records_num] = titles_len
+            for i in range(pos + 1, title_end):
+                titles[titles_len] = buffer[i]
+                titles_len += 1
+            title_ends[records_num] = titles_len
+            seq_starts[records_num] = residues_len
+            records_num += 1
+
+        # A line of residues
+        else:
+            for i in range(pos, line_end):
+                if not cb.is_space(buffer[i]):
+                    if records_num == 0:
+                        return 0, 0, 0, False
+                    residues[residues_len] = buffer[i]
+                    residues_len += 1
+
+        pos = line_end + 1
+
+    if records_num > 0:
+        seq_ends[records_num - 1] = residues_len
+
+    return records_num, titles_len, residues_len, True
+
+
+# Read the records of a FASTA file. Returns two StringPools: of the titles and of the sequences.
+def read_fasta(file_path):
+    data = pr.map_file(file_path)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    max_records_num = np.count_nonzero(buffer == 62)
+    title_starts = np.empty(max_records_num, dtype=np.int64)
+    title_ends = np.empty(max_records_num, dtype=np.int64)
+    seq_starts = np.empty(max_records_num, dtype=np.int64)
+    seq_ends = np.empty(max_records_num, dtype=np.int64)
+    titles = np.empty(len(data), dtype=np.uint8)
+    residues = np.empty(len(data), dtype=np.uint8)
+    records_num, titles_len, residues_len, is_valid = scan_records(buffer, title_starts, title_ends, seq_starts,
+                                                                   seq_ends, titles, residues)
+    del buffer
+    pr.unmap_file(data)
+
+    # Fall back to Biopython
+    if not is_valid:
+        return read_fasta_biopython(file_path)
+
+    return string_pool.StringPool(titles[:titles_len].tobytes(), title_starts[:records_num],
+                                  title_ends[:records_num]), \
+        string_pool.StringPool(residues[:residues_len].tobytes(), seq_starts[:records_num], seq_ends[:records_num])
+
+
+def read_fasta_biopython(file_path):
+    titles = []
+    sequences = []
+    with compression.open_input(file_path) as FH:
+        for record in SeqIO.parse(FH, "fasta"):
+            titles.append(record.description)
+            sequences.append(str(record.seq))
+    return string_pool.from_strings(titles), string_pool.from_strings(sequences)
 
 
 class FastaFormat:
 
     def __init__(self):
-        self.sequences_list = []
+        self.titles = None
+        self.sequences = None
         self.file_is_valid = 1
         self.error = ""
 
     def read_file(self, file_path):
-        with open(file_path) as FH:
-            for record in SeqIO.parse(FH, "fasta"):
-                seq_title = record.description
-                sequence = str(record.seq)
-                x_coor = self.generate_rand_pos()
-                y_coor = self.generate_rand_pos()
-                z_coor = self.generate_rand_pos()
-                coor_tuple = (seq_title, sequence, x_coor, y_coor, z_coor, -1, False, x_coor, y_coor, z_coor)
-                self.sequences_list.append(coor_tuple)
 
-    def fill_values(self):
-        cfg.run_params['total_sequences_num'] = len(self.sequences_list)
-        print("total number of sequences is " + str(cfg.run_params['total_sequences_num']))
-
-        # Create the structured NumPy array of sequences
-        seq.create_sequences_array(self.sequences_list)
+        # Verify that the file exists
+        if not os.path.isfile(file_path):
+            self.file_is_valid = 0
+            self.error = "The file \'" + file_path + "\' does not exist"
+            return
 
-    # Returns a random coordinate between -1 and 1
-    @staticmethod
-    def generate_rand_pos():
-        rand = random.random() * 2 - 1
-        return '{:.3f}'.format(rand)
+        # Verify that the file can be decompressed (if it's compressed)
+        self.error = compression.get_input_error(file_path)
+        if self.error != "":
+            self.file_is_valid = 0
+            return
 
+        self.titles, self.sequences = read_fasta(file_path)
 
+    def fill_values(self):
+        cfg.run_params['total_sequences_num'] = len(self.titles)
+        print("total number of sequences is " + str(cfg.run_params['total_sequences_num']))
 
+        # Create the structured NumPy array of sequences, with random x,y,z positions (rounded to 3 decimals)
+        coordinates = np.random.uniform(-1, 1, (len(self.titles), 3)).round(3).astype(np.float32)
+        seq.create_sequences_array_from_columns(self.titles, self.sequences, coordinates)
@@ -1,24 +1,246 @@
-import re
-import csv
 import os
+import warnings
 import numpy as np
+import numba
 import clans.config as cfg
 import clans.data.sequences as seq
 import clans.data.sequence_pairs as sp
+import clans.io.parallel_reader as pr
+import clans.io.batched_writer as bw
+import clans.io.compression as compression
+import clans.io.id_index as id_index
+
+# Flags of the scanned rows
+first_field_blank_flag = 1  # The first field is empty or contains only whitespace
+score_is_number_flag = 2  # The score (third field) is a float or exponential number: ^\d+\.?\d*[Ee]?[-+]?\d*$
+score_is_word_flag = 4  # The score consists of word characters only (a header): ^\w+$
+type_is_att_flag = 8  # The fourth field is 'score' or 'att'
+
+
+@numba.njit(nogil=True)
+def is_word_char(char):
+    # Letters, digits, '_' and any non-ASCII character
+    return 48 <= char <= 57 or 65 <= char <= 90 or 97 <= char <= 122 or char == 95 or char >= 128
+
+
+# Check whether the bytes between start and end match ^\d+\.?\d*[Ee]?[-+]?\d*$
+@numba.njit(nogil=True)
+def is_number(buffer, start, end):
+    pos = start
+    if pos >= end or not (48 <= buffer[pos] <= 57):
+        return False
+    while pos < end and 48 <= buffer[pos] <= 57:
+        pos += 1
+    if pos < end and buffer[pos] == 46:
+        pos += 1
+    while pos < end and 48 <= buffer[pos] <= 57:
+        pos += 1
+    if pos < end and (buffer[pos] == 69 or buffer[pos] == 101):
+        pos += 1
+    if pos < end and (buffer[pos] == 45 or buffer[pos] == 43):
+        pos += 1
+    while pos < end and 48 <= buffer[pos] <= 57:
+        pos += 1
+    return pos == end
+
+
+# Check whether the bytes between start and end are equal to the given word
+@numba.njit(nogil=True)
+def is_equal(buffer, start, end, word):
+    if end - start != word.shape[0]:
+        return False
+    for i in range(word.shape[0]):
+        if buffer[start + i] != word[i]:
+            return False
+    return True
+
+
+# Scan the tab-delimited rows between start and end. For each row, save the number of fields, the positions of the
+# first four fields, the hashes of the two ID fields and the row flags, and copy the valid scores to 'tokens'
+# (separated by spaces).
+# Returns the length of the tokens buffer.
+@numba.njit(nogil=True)
+def scan_rows(buffer, start, end, fields_num, field_starts, field_ends, hashes, check_hashes, flags, tokens,
+              score_word, att_word):
+    pos = start
+    row = 0
+    tokens_len = 0
+
+    while pos < end:
+        # Find the end of the row (without '\r\n' / '\n')
+        row_end = pos
+        while row_end < end and buffer[row_end] != 10:
+            row_end += 1
+        next_pos = row_end + 1
+        if row_end > pos and buffer[row_end - 1] == 13:
+            row_end -= 1
+
+        # Split the row into fields
+        fields_num[row] = 0
+        if row_end > pos:
+            field_start = pos
+            for i in range(pos, row_end + 1):
+                if i == row_end or buffer[i] == 9:
+                    if fields_num[row] < 4:
+                        field_starts[row][fields_num[row]] = field_start
+                        field_ends[row][fields_num[row]] = i
+                    fields_num[row] += 1
+                    field_start = i + 1
+
+            for i in range(min(fields_num[row], 2)):
+                hashes[row][i] = id_index.hash_bytes(buffer, field_starts[row][i], field_ends[row][i])
+                check_hashes[row][i] = id_index.check_hash_bytes(buffer, field_starts[row][i], field_ends[row][i])
+
+        row_flags = 0
+        if fields_num[row] == 0:
+            row_flags |= first_field_blank_flag
+        else:
+            is_blank = True
+            for i in range(field_starts[row][0], field_ends[row][0]):
+                if not (buffer[i] == 32 or 9 <= buffer[i] <= 13):
+                    is_blank = False
+                    break
+            if is_blank:
+                row_flags |= first_field_blank_flag
+
+        if fields_num[row] >= 3:
+            score_start = field_starts[row][2]
+            score_end = field_ends[row][2]
+            if is_number(buffer, score_start, score_end):
+                row_flags |= score_is_number_flag
+                for i in range(score_start, score_end):
+                    tokens[tokens_len] = buffer[i]
+                    tokens_len += 1
+                tokens[tokens_len] = 32
+                tokens_len += 1
+            is_word = score_end > score_start
+            for i in range(score_start, score_end):
+                if not is_word_char(buffer[i]):
+                    is_word = False
+                    break
+            if is_word:
+                row_flags |= score_is_word_flag
+
+        if fields_num[row] > 3:
+            if is_equal(buffer, field_starts[row][3], field_ends[row][3], score_word) or \
+                    is_equal(buffer, field_starts[row][3], field_ends[row][3], att_word):
+                row_flags |= type_is_att_flag
+
+        flags[row] = row_flags
+        pos = next_pos
+        row += 1
+
+    return tokens_len
+
+
+# Scan the rows of one byte range of the file.
+# Returns the number of fields, the positions of the first four fields, the hashes of the ID fields and the flags of the
+# rows, and the valid scores (bytes, separated by spaces).
+def scan_range(buffer, start, end):
+    rows_num = pr.count_lines(buffer, start, end)
+    fields_num = np.zeros(rows_num, dtype=np.int64)
+    field_starts = np.zeros((rows_num, 4), dtype=np.int64)
+    field_ends = np.zeros((rows_num, 4), dtype=np.int64)
+    hashes = np.zeros((rows_num, 2), dtype=np.uint64)
+    check_hashes = np.zeros((rows_num, 2), dtype=np.uint64)
+    flags = np.zeros(rows_num, dtype=np.uint8)
+    tokens = np.empty(end - start + rows_num, dtype=np.uint8)
+    tokens_len = scan_rows(buffer, start, end, fields_num, field_starts, field_ends, hashes, check_hashes, flags,
+                           tokens, np.frombuffer(b'score', dtype=np.uint8), np.frombuffer(b'att', dtype=np.uint8))
+
+    return fields_num, field_starts, field_ends, hashes, check_hashes, flags, tokens[:tokens_len].tobytes()
+
+
+# Scan the rows of one byte range of the file and convert their valid scores (all at once).
+# Returns the same as scan_range(), with the scores instead of their tokens (the scores array contains only the rows
+# with valid scores, or None if one of them failed to convert).
+def parse_range(buffer, start, end):
+    fields_num, field_starts, field_ends, hashes, check_hashes, flags, tokens_bytes = scan_range(buffer, start, end)
+
+    try:
+        scores = np.fromstring(tokens_bytes, dtype=np.float64, sep=' ')
+    except ValueError:
+        scores = None
+    if scores is not None and scores.shape[0] != np.count_nonzero(flags & score_is_number_flag):
+        scores = None
+
+    return fields_num, field_starts, field_ends, hashes, check_hashes, flags, scores
+
+
+# Concatenate the results of the ranges (the first six arrays)
+def concatenate_ranges(results):
+    if len(results) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64), np.zeros((0, 4), dtype=np.int64), \
+            np.zeros((0, 2), dtype=np.uint64), np.zeros((0, 2), dtype=np.uint64), np.zeros(0, dtype=np.uint8)
+    return tuple(np.concatenate([result[i] for result in results]) for i in range(6))
+
+
+# Returns the first data row (after the header row, if any) and the end of the data rows (the first empty line).
+# The first row is None if a row before the data rows has less than 3 columns.
+def find_data_rows(fields_num, flags):
+    first_row = 0
+    while first_row < fields_num.shape[0]:
+
+        # The file is not valid - must contain at least 3 columns
+        if fields_num[first_row] < 3:
+            return None, None
+
+        # Stop if there are empty lines
+        if flags[first_row] & first_field_blank_flag:
+            break
+
+        # Ignore the first header row (if any)
+        if flags[first_row] & score_is_word_flag and not flags[first_row] & score_is_number_flag:
+            first_row += 1
+            continue
+
+        break
+
+    # The data rows continue until the first empty line
+    blank_rows = np.flatnonzero(flags[first_row:] & first_field_blank_flag)
+    if blank_rows.shape[0] > 0:
+        return first_row, first_row + blank_rows[0]
+    return first_row, fields_num.shape[0]
+
+
+# Read the pairs of a delimited file (the indices of the IDs are given in the order of appearance, as when the file is
+# read). Yields one chunk of (index1, index2, score tokens).
+def read_pairs(file_path):
+    data = pr.map_file(file_path)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    results = pr.parse_ranges(scan_range, buffer, pr.split_ranges(data, 0, len(data)))
+    del buffer
+
+    fields_num, field_starts, field_ends, hashes, check_hashes, flags = concatenate_ranges(results)
+    tokens = np.array([token for result in results for token in result[6].decode().split()], dtype=object)
+    first_row, last_row = find_data_rows(fields_num, flags)
+    rows = np.arange(first_row, last_row)
+    score_ranks = np.cumsum((flags & score_is_number_flag) > 0) - 1
+
+    indices, titles = id_index.encode_ids(data, field_starts[rows, :2].ravel(), field_ends[rows, :2].ravel(),
+                                          hashes[rows].ravel(), check_hashes[rows].ravel())
+    pr.unmap_file(data)
+    indices = indices.reshape((-1, 2))
+    yield indices[:, 0], indices[:, 1], tokens[score_ranks[rows]]
 
 
 class DelimitedFormat:
 
     def __init__(self):
-        self.sequences_list = []
-        self.names_indices_dict = {}
         self.file_is_valid = 1
         self.error = ""
         self.type_of_values = "hsp"
+        self.file_path = ""
         self.file_name = ""
+        self.titles = []
+        self.coordinates = None
+        self.index1 = None
+        self.index2 = None
+        self.scores = None
 
     def read_file(self, file_path):
 
+        self.file_path = file_path
         self.file_name = os.path.basename(file_path)
 
         # Verify that the file exists
@@ -27,124 +249,90 @@ class DelimitedFormat:
             self.error = "The file \'" + file_path + "\' does not exist"
             return
 
-        # Open and read the delimited text file
-        with open(file_path) as infile:
-            reader = csv.reader(infile, delimiter='\t')
-
-            seq_index = 0
-            for row in reader:
-
-                fields_num = len(row)
-
-                # The file is not valid - must contain at least 3 columns
-                if seq_index == 0 and fields_num < 3:
-                    self.file_is_valid = 0
-                    self.error = "The file " + self.file_name + " is missing information:\n"
-                    self.error += "The file must contain at least 3 columns: sequenceID_1, sequenceID_2, " \
-                                 "similarity_score/P_value"
-                    return
-
-                # Stop if there are empty lines
-                if re.search("^\s*$", row[0]):
-                    break
-
-                # The file has at least 3 columns
-                id1 = row[0]
-                id2 = row[1]
-                score = row[2]
-
-                # Ignore the first header row (if any)
-                if seq_index == 0 and re.search("^\w+$", score):
-                    continue
-
-                # The score field is not a valid number
-                if not re.search("^\d+\.?\d*[Ee]?[-+]?\d*$", score):
-                    self.file_is_valid = 0
-                    self.error = "The file " + self.file_name + " has an invalid format:\n"
-                    self.error += "The third column must contain a float or exponential number for the " \
-                                 "similarity-score or P_value"
-                    return
-
-                if fields_num > 3:
-                    type_of_values = row[3]
-                    if type_of_values == "score" or type_of_values == "att":
-                        self.type_of_values = "att"
-
-                # Name 1 is new
-                if id1 not in self.names_indices_dict:
-                    self.names_indices_dict[id1] = seq_index
-
-                    # Create random x,y,z positions
-                    pos_x = seq.generate_rand_pos()
-                    pos_y = seq.generate_rand_pos()
-                    pos_z = seq.generate_rand_pos()
-
-                    seq_tuple = (id1, "", pos_x, pos_y, pos_z, -1, False, pos_x, pos_y, pos_z)
-                    self.sequences_list.append(seq_tuple)
+        # Verify that the file can be decompressed (if it's compressed)
+        self.error = compression.get_input_error(file_path)
+        if self.error != "":
+            self.file_is_valid = 0
+            return
 
-                    seq_index += 1
+        # Map the delimited text file to memory and scan its rows in parallel (in line-aligned byte ranges)
+        data = pr.map_file(file_path)
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        # The warnings of np.fromstring are suppressed here, for all the threads (catch_warnings() is not thread-safe)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            results = pr.parse_ranges(parse_range, buffer, pr.split_ranges(data, 0, len(data)))
+        del buffer
+        fields_num, field_starts, field_ends, hashes, check_hashes, flags = concatenate_ranges(results)
+
+        # The scores of all the rows with valid scores
+        if all(result[6] is not None for result in results):
+            valid_scores = np.concatenate([result[6] for result in results] + [np.empty(0)])
+        else:
+            valid_scores = None
+
+        # The file is not valid - must contain at least 3 columns
+        first_row, last_row = find_data_rows(fields_num, flags)
+        if first_row is None:
+            self.file_is_valid = 0
+            self.error = "The file " + self.file_name + " is missing information:\n"
+            self.error += "The file must contain at least 3 columns: sequenceID_1, sequenceID_2, " \
+                          "similarity_score/P_value"
+            pr.unmap_file(data)
+            return
+        rows = np.arange(first_row, last_row)
 
-                # Name 2 is new
-                if id2 not in self.names_indices_dict:
-                    self.names_indices_dict[id2] = seq_index
+        # The score field is not a valid number
+        is_valid = (fields_num[rows] >= 3) & (flags[rows] & score_is_number_flag > 0)
+        if not np.all(is_valid) or (valid_scores is None and rows.shape[0] > 0):
+            self.file_is_valid = 0
+            self.error = "The file " + self.file_name + " has an invalid format:\n"
+            self.error += "The third column must contain a float or exponential number for the " \
+                          "similarity-score or P_value"
+            pr.unmap_file(data)
+            return
 
-                    # Create random x,y,z positions
-                    pos_x = seq.generate_rand_pos()
-                    pos_y = seq.generate_rand_pos()
-                    pos_z = seq.generate_rand_pos()
+        if np.any(flags[rows] & type_is_att_flag):
+            self.type_of_values = "att"
 
-                    seq_tuple = (id2, "", pos_x, pos_y, pos_z, -1, False, pos_x, pos_y, pos_z)
-                    self.sequences_list.append(seq_tuple)
+        # The scores of the data rows (among all the rows with valid scores)
+        score_ranks = np.cumsum((flags & score_is_number_flag) > 0) - 1
+        self.scores = valid_scores[score_ranks[rows]] if rows.shape[0] > 0 else np.empty(0)
 
-                    seq_index += 1
+        # Give each sequence ID an index, in the order of appearance (ID_1 before ID_2 of each row)
+        indices, self.titles = id_index.encode_ids(data, field_starts[rows, :2].ravel(), field_ends[rows, :2].ravel(),
+                                                   hashes[rows].ravel(), check_hashes[rows].ravel())
+        pr.unmap_file(data)
+        indices = indices.reshape((-1, 2))
+        self.index1 = indices[:, 0]
+        self.index2 = indices[:, 1]
+        seq_num = len(self.titles)
 
-                pair_tuple = (self.names_indices_dict[id1], self.names_indices_dict[id2], score)
-                cfg.similarity_values_list.append(pair_tuple)
+        # Create random x,y,z positions
+        self.coordinates = np.random.uniform(-1, 1, (seq_num, 3)).astype(np.float32)
 
         # Get the total number of sequences
-        cfg.run_params['total_sequences_num'] = seq_index
+        cfg.run_params['total_sequences_num'] = seq_num
         print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
 
-        # Create a 2D Numpy array for the similarity values and initialize it with 1
-        cfg.similarity_values_mtx = np.full([cfg.run_params['total_sequences_num'],
-                                                 cfg.run_params['total_sequences_num']], 100, dtype=float)
-        cfg.attraction_values_mtx = np.zeros([cfg.run_params['total_sequences_num'],
-                                                  cfg.run_params['total_sequences_num']])
-
-        # Go over the list of pairs to fill the matrix
-        for pair in cfg.similarity_values_list:
-            index1 = pair[0]
-            index2 = pair[1]
-            score = pair[2]
-
-            # Assign the Evalue to the pair + reciprocal pair
-            # E-values (HSPs)
-            if self.type_of_values == "hsp":
-                if float(score) == 0.0:
-                    cfg.similarity_values_mtx[index1][index2] = 10 ** -180
-                    cfg.similarity_values_mtx[index2][index1] = 10 ** -180
-                else:
-                    cfg.similarity_values_mtx[index1][index2] = score
-                    cfg.similarity_values_mtx[index2][index1] = score
-            # Scores 0.0-1.0 (attraction values)
-            else:
-                if 0.0 <= float(score) <= 1.0:
-                    cfg.attraction_values_mtx[index1][index2] = score
-                    cfg.attraction_values_mtx[index2][index1] = score
-                else:
-                    self.file_is_valid = 0
-                    self.error = "The file " + self.file_name + " has invalid format:\n"
-                    self.error += "Attraction values must be numbers between 0 and 1"
-                    break
+        # Verify that the attraction values (scores) are between 0 and 1
+        if self.type_of_values == "att":
+            if not np.all((self.scores >= 0.0) & (self.scores <= 1.0)):
+                self.file_is_valid = 0
+                self.error = "The file " + self.file_name + " has invalid format:\n"
+                self.error += "Attraction values must be numbers between 0 and 1"
 
         if self.file_is_valid == 0:
             print(self.error)
 
     def fill_values(self):
         # Create the structured NumPy array of sequences
-        seq.create_sequences_array(self.sequences_list)
+        seq.create_sequences_array_from_columns(self.titles, "", self.coordinates)
 
-        # Apply the similarity cutoff
+        # Create the compact edges arrays and apply the similarity cutoff.
+        # The pairs are not kept - they are read again from the file when they are written.
+        sp.set_edges(self.index1, self.index2, self.scores, self.type_of_values)
+        sp.set_pairs_source(self.file_path, 'delimited', read_pairs)
         if self.type_of_values == "hsp":
             cfg.run_params['type_of_values'] = "hsp"
             cfg.run_params['similarity_cutoff'] = cfg.similarity_cutoff
@@ -160,23 +348,21 @@ class DelimitedFormat:
 
     def write_file(self, file_path, is_param):
 
-        output = open(file_path, "w")
+        output = compression.open_output(file_path, "w")
 
         output.write("ID_1\tID_2\tSimilarity_score\tType_of_score\n")
 
-        for i in range(len(cfg.similarity_values_list)):
-            index1 = cfg.similarity_values_list[i][0]
-            index2 = cfg.similarity_values_list[i][1]
-            score = cfg.similarity_values_list[i][2]
+        # The type of values is the same in all the rows (a constant part of the row format)
+        row_end = "\t" + cfg.run_params['type_of_values'].replace('%', '%%') + "\n"
 
+        # An object array of the titles, so that indexing it by the pairs doesn't copy the strings
+        if cfg.run_params['input_format'] == 'delimited':
+            titles = np.array(seq.get_titles(), dtype=object)
+        for index1, index2, values in sp.get_pairs_chunks():
             if cfg.run_params['input_format'] == 'delimited':
-                pair_str = cfg.sequences_array[int(index1)]['seq_title'] + "\t" + \
-                           cfg.sequences_array[int(index2)]['seq_title'] + \
-                           "\t" + score + "\t" + cfg.run_params['type_of_values'] + "\n"
+                bw.write_rows(output, "%s\t%s\t%s" + row_end, [titles[index1], titles[index2], values])
             else:
-                pair_str = str(index1) + "\t" + str(index2) + "\t" + str(score) + "\t" + cfg.run_params['type_of_values'] + "\n"
-
-            output.write(pair_str)
+                bw.write_rows(output, "%d\t%d\t%s" + row_end, [index1, index2, values])
 
         output.close()
 
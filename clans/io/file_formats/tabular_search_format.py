@@ -0,0 +1,250 @@
+import os
+import warnings
+import numpy as np
+import numba
+import clans.config as cfg
+import clans.data.sequences as seq
+import clans.data.sequence_pairs as sp
+import clans.data.string_pool as string_pool
+import clans.io.parallel_reader as pr
+import clans.io.compression as compression
+import clans.io.id_index as id_index
+import clans.io.file_formats.tab_delimited_format as tab
+import clans.io.file_formats.fasta_format as fasta
+
+# Reading the tabular output of an all-against-all similarity search: BLAST (-outfmt 6), MMseqs2 (convertalis) or
+# DIAMOND (--outfmt 6 / m8). Each row has (at least) 12 tab-separated columns:
+# qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
+# Only the IDs and the E-value are used. A pair may appear in several rows (several HSPs, or both directions) -
+# the best (lowest) E-value of each pair is kept.
+
+columns_num = 12
+evalue_column = 10
+
+
+# Scan the rows between start and end. Empty lines and comment lines (starting with '#', as in -outfmt 7) are skipped.
+# For each row, save the positions and the hashes of the two IDs and copy the E-value to 'tokens'
+# (separated by spaces).
+# Returns the number of rows, the length of the tokens buffer and the line number (in the range) of the first invalid
+# row (-1 if all the rows are valid).
+@numba.njit(nogil=True)
+def scan_rows(buffer, start, end, id_starts, id_ends, hashes, check_hashes, tokens):
+    pos = start
+    row = 0
+    line_num = 0
+    tokens_len = 0
+
+    while pos < end:
+        row_end = pos
+        while row_end < end and buffer[row_end] != 10:
+            row_end += 1
+        next_pos = row_end + 1
+        if row_end > pos and buffer[row_end - 1] == 13:
+            row_end -= 1
+
+        if row_end > pos and buffer[pos] != 35:
+            # Find the ID fields and the E-value field
+            fields_num = 0
+            field_start = pos
+            evalue_start = pos
+            evalue_end = pos
+            for i in range(pos, row_end + 1):
+                if i == row_end or buffer[i] == 9:
+                    if fields_num < 2:
+                        id_starts[row, fields_num] = field_start
+                        id_ends[row, fields_num] = i
+                    elif fields_num == evalue_column:
+                        evalue_start = field_start
+                        evalue_end = i
+                    fields_num += 1
+                    field_start = i + 1
+
+            if fields_num < columns_num or not tab.is_number(buffer, evalue_start, evalue_end):
+                return row, tokens_len, line_num
+
+            for i in range(2):
+                hashes[row, i] = id_index.hash_bytes(buffer, id_starts[row, i], id_ends[row, i])
+                check_hashes[row, i] = id_index.check_hash_bytes(buffer, id_starts[row, i], id_ends[row, i])
+            for i in range(evalue_start, evalue_end):
+                tokens[tokens_len] = buffer[i]
+                tokens_len += 1
+            tokens[tokens_len] = 32
+            tokens_len += 1
+            row += 1
+
+        pos = next_pos
+        line_num += 1
+
+    return row, tokens_len, -1
+
+
+# Scan the rows of one byte range of the file and convert their E-values (all at once).
+# Returns the number of lines in the range, the line number of the first invalid row (-1 if there is none),
+# the positions and hashes of the IDs (2D (rows_num, 2) arrays) and the E-values of the valid rows.
+def parse_range(buffer, start, end):
+    lines_num = pr.count_lines(buffer, start, end)
+    id_starts = np.empty((lines_num, 2), dtype=np.int64)
+    id_ends = np.empty((lines_num, 2), dtype=np.int64)
+    hashes = np.empty((lines_num, 2), dtype=np.uint64)
+    check_hashes = np.empty((lines_num, 2), dtype=np.uint64)
+    tokens = np.empty(end - start + lines_num, dtype=np.uint8)
+    rows_num, tokens_len, invalid_line = scan_rows(buffer, start, end, id_starts, id_ends, hashes, check_hashes,
+                                                   tokens)
+
+    evalues = np.fromstring(tokens[:tokens_len].tobytes(), dtype=np.float64, sep=' ')
+
+    return lines_num, invalid_line, id_starts[:rows_num], id_ends[:rows_num], hashes[:rows_num], \
+        check_hashes[:rows_num], evalues
+
+
+# Keep the best (lowest) E-value of each unordered pair of different sequences.
+# Returns the pairs (index1 < index2, sorted) and their E-values.
+def reduce_pairs(index1, index2, evalues, seq_num):
+    is_pair = index1 != index2
+    low = np.minimum(index1, index2)[is_pair]
+    high = np.maximum(index1, index2)[is_pair]
+    evalues = evalues[is_pair]
+
+    # Sort by the pair and then by the E-value, and take the first row of each pair
+    keys = low * seq_num + high
+    order = np.lexsort((evalues, keys))
+    keys = keys[order]
+    is_first = np.ones(keys.shape[0], dtype=bool)
+    is_first[1:] = keys[1:] != keys[:-1]
+    best = order[is_first]
+
+    return low[best], high[best], evalues[best]
+
+
+class TabularSearchFormat:
+
+    def __init__(self):
+        self.file_is_valid = 1
+        self.error = ""
+        self.file_name = ""
+        self.titles = []
+        self.sequences = []
+        self.coordinates = None
+        self.index1 = None
+        self.index2 = None
+        self.evalues = None
+
+    def read_file(self, file_path):
+
+        self.file_name = os.path.basename(file_path)
+
+        # Verify that the file exists
+        if not os.path.isfile(file_path):
+            self.file_is_valid = 0
+            self.error = "The file \'" + file_path + "\' does not exist"
+            return
+
+        # Verify that the file can be decompressed (if it's compressed)
+        self.error = compression.get_input_error(file_path)
+        if self.error != "":
+            self.file_is_valid = 0
+            return
+
+        # Map the file to memory and scan its rows in parallel (in line-aligned byte ranges)
+        data = pr.map_file(file_path)
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        # The warnings of np.fromstring are suppressed here, for all the threads (catch_warnings() is not thread-safe)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            results = pr.parse_ranges(parse_range, buffer, pr.split_ranges(data, 0, len(data)))
+        del buffer
+
+        # The file is not valid - report the first invalid row
+        lines_before = 0
+        for lines_num, invalid_line, range_id_starts, range_id_ends, range_hashes, range_check_hashes, \
+                range_evalues in results:
+            if invalid_line >= 0:
+                self.file_is_valid = 0
+                self.error = "The file " + self.file_name + " has an invalid format (line " + \
+                             str(lines_before + invalid_line + 1) + "):\n"
+                self.error += "The file must contain the " + str(columns_num) + " tab-separated columns of the " \
+                              "tabular search output (BLAST -outfmt 6 / m8), with the E-value in the " + \
+                              str(evalue_column + 1) + "th column"
+                print(self.error)
+                pr.unmap_file(data)
+                return
+            lines_before += lines_num
+
+        if len(results) > 0:
+            id_starts = np.concatenate([result[2] for result in results])
+            id_ends = np.concatenate([result[3] for result in results])
+            hashes = np.concatenate([result[4] for result in results])
+            check_hashes = np.concatenate([result[5] for result in results])
+            evalues = np.concatenate([result[6] for result in results])
+        else:
+            id_starts = id_ends = np.empty((0, 2), dtype=np.int64)
+            hashes = check_hashes = np.empty((0, 2), dtype=np.uint64)
+            evalues = np.empty(0)
+
+        # Give each ID an index, in the order of appearance (the query ID before the subject ID of each row)
+        indices, ids = id_index.encode_ids(data, id_starts.ravel(), id_ends.ravel(), hashes.ravel(),
+                                           check_hashes.ravel())
+        pr.unmap_file(data)
+        indices = indices.reshape((-1, 2))
+
+        self.titles = ids
+        self.sequences = ""
+
+        # Take the titles and the sequences from the FASTA file (if given)
+        if cfg.run_params.get('sequences_file') is not None:
+            self.join_fasta(cfg.run_params['sequences_file'], indices)
+            if self.file_is_valid == 0:
+                return
+
+        seq_num = len(self.titles)
+        self.index1, self.index2, self.evalues = reduce_pairs(indices[:, 0], indices[:, 1], evalues, seq_num)
+
+        # Create random x,y,z positions
+        self.coordinates = np.random.uniform(-1, 1, (seq_num, 3)).astype(np.float32)
+
+        cfg.run_params['total_sequences_num'] = seq_num
+        print("Total number of sequences: " + str(cfg.run_params['total_sequences_num']))
+
+    # Read the sequences of the IDs from a FASTA file (matched by the record ID - the first word of the header).
+    # The sequences are numbered in the order of the FASTA file, followed by the IDs that are not found in it.
+    # The given indices are updated accordingly.
+    def join_fasta(self, fasta_path, indices):
+        if not os.path.isfile(fasta_path):
+            self.file_is_valid = 0
+            self.error = "The FASTA file \'" + fasta_path + "\' does not exist"
+            return
+
+        # Verify that the file can be decompressed (if it's compressed)
+        self.error = compression.get_input_error(fasta_path)
+        if self.error != "":
+            self.file_is_valid = 0
+            return
+
+        fasta_titles, fasta_sequences = fasta.read_fasta(fasta_path)
+        fasta_indices_dict = {}
+        for index, title in enumerate(fasta_titles.get_list()):
+            fasta_indices_dict.setdefault((title.split(None, 1) or [''])[0], index)
+
+        # Map the IDs to the FASTA records (or to new indices after them)
+        new_indices = np.empty(len(self.titles), dtype=np.int64)
+        missing_ids = []
+        for i, seq_id in enumerate(self.titles):
+            if seq_id in fasta_indices_dict:
+                new_indices[i] = fasta_indices_dict[seq_id]
+            else:
+                new_indices[i] = len(fasta_titles) + len(missing_ids)
+                missing_ids.append(seq_id)
+        indices[:] = new_indices[indices]
+
+        self.titles = string_pool.concatenate([fasta_titles, string_pool.from_strings(missing_ids)])
+        self.sequences = string_pool.concatenate([fasta_sequences, string_pool.empty_strings(len(missing_ids))])
+
+    def fill_values(self):
+        # Create the structured NumPy array of sequences
+        seq.create_sequences_array_from_columns(self.titles, self.sequences, self.coordinates)
+
+        # Create the compact edges arrays, calculate the attraction values and apply the similarity cutoff
+        cfg.run_params['type_of_values'] = "hsp"
+        sp.set_edges(self.index1, self.index2, self.evalues, 'hsp')
+        sp.calculate_attraction_values()
+        sp.define_connected_sequences('hsp')
@@ -1,8 +1,14 @@
+import os
 import clans.io.file_formats.clans_format as clans
 import clans.io.file_formats.clans_minimal_format as mini_clans
+import clans.io.file_formats.clans_binary_format as clans_binary
+import clans.io.file_formats.clans_project_format as clans_project
 import clans.io.file_formats.fasta_format as fasta
 import clans.io.file_formats.tab_delimited_format as tab
+import clans.io.file_formats.tabular_search_format as m8
+import clans.io.journal as journal
 import clans.config as cfg
+import clans.data.sequence_pairs as sp
 
 
 #@profile
@@ -13,12 +19,22 @@ def read_input_file(file_path, file_format):
         format_object = clans.ClansFormat()
     elif file_format == 'mini-clans':
         format_object = mini_clans.ClansMinimalFormat()
+    elif file_format == 'clans-binary':
+        format_object = clans_binary.ClansBinaryFormat()
+    elif file_format == 'clans-project':
+        format_object = clans_project.ClansProjectFormat()
     elif file_format == 'delimited':
         format_object = tab.DelimitedFormat()
+    elif file_format == 'm8':
+        format_object = m8.TabularSearchFormat()
 
     # Read the input file according to the specified file format
     format_object.read_file(file_path)
 
+    # Apply the changes which were saved incrementally to the journal of a CLANS file (if any)
+    if file_format == 'clans' and format_object.file_is_valid == 1:
+        journal.replay(file_path, format_object)
+
     # If the file is valid without errors, fill the sequences information in the related global variables
     if format_object.file_is_valid == 1:
         format_object.fill_values()
@@ -28,6 +44,25 @@ def read_input_file(file_path, file_format):
         cfg.run_params['error'] = format_object.error
 
 
+# Write the file in the format of the format object.
+# The pairs are read from the file they were loaded from while they are written (see sequence_pairs.py), so a file
+# which is saved over it is written to a temporary file (with the same extension) first.
+# A running compaction of a CLANS journal would replace the file after it's written, so it's waited for first.
+def write_format_file(format_object, file_path, file_format, is_param):
+    journal.wait_compaction()
+    if not sp.is_pairs_source(file_path):
+        format_object.write_file(file_path, is_param)
+        return
+
+    temp_path = os.path.join(os.path.dirname(file_path), '.saving.' + os.path.basename(file_path))
+    format_object.write_file(temp_path, is_param)
+    os.replace(temp_path, file_path)
+    if cfg.pairs_source['format'] == file_format:
+        sp.refresh_pairs_source(file_path)
+    else:
+        cfg.pairs_source = None
+
+
 def write_file(file_path, file_format):
 
     is_param_block = False
@@ -43,10 +78,28 @@ def write_file(file_path, file_format):
     elif file_format == 'mini-clans':
         format_object = mini_clans.ClansMinimalFormat()
 
+    # Binary CLANS (with the <params> block, as in CLANS format)
+    elif file_format == 'clans-binary':
+        format_object = clans_binary.ClansBinaryFormat()
+
+        if cfg.run_params['rounds_done'] > 0:
+            is_param_block = True
+
+    # CLANS project directory (with the <params> block, as in CLANS format)
+    elif file_format == 'clans-project':
+        format_object = clans_project.ClansProjectFormat()
+
+        if cfg.run_params['rounds_done'] > 0:
+            is_param_block = True
+
     # tab-delimited format
     else:
         format_object = tab.DelimitedFormat()
 
 
     # Write CLANS file without <params> block
-    format_object.write_file(file_path, is_param_block)
+    write_format_file(format_object, file_path, file_format, is_param_block)
+
+    # A fully written CLANS file has no journal
+    if file_format == 'clans':
+        journal.remove(file_path)
@@ -0,0 +1,73 @@
+import numpy as np
+import numba
+
+# Encoding of sequence IDs (byte strings in the input file) as indices, without decoding each occurrence:
+# each ID field is hashed (in numba, while scanning the file), the hashes are factorized in one vectorized pass and
+# only the first occurrence of each distinct ID is decoded.
+# A second, independent hash of each field is used to detect the (very unlikely) collisions of the main hash.
+
+fnv_offset_basis = np.uint64(14695981039346656037)
+fnv_prime = np.uint64(1099511628211)
+check_multiplier = np.uint64(131)
+
+
+# The main hash of the bytes between start and end (FNV-1a, 64 bit)
+@numba.njit(nogil=True)
+def hash_bytes(buffer, start, end):
+    h = fnv_offset_basis
+    for i in range(start, end):
+        h = (h ^ np.uint64(buffer[i])) * fnv_prime
+    return h
+
+
+# The check hash of the bytes between start and end (a polynomial hash, 64 bit)
+@numba.njit(nogil=True)
+def check_hash_bytes(buffer, start, end):
+    h = np.uint64(end - start)
+    for i in range(start, end):
+        h = h * check_multiplier + np.uint64(buffer[i])
+    return h
+
+
+# Factorize the hashes of the IDs: give each distinct ID an index, in the order of their first appearance.
+# Returns the index of each of the IDs and the position of the first appearance of each distinct ID,
+# or None if two different IDs have the same hash (their check hashes are different).
+def factorize(hashes, check_hashes):
+    unique_hashes, first_positions, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    if not np.array_equal(check_hashes, check_hashes[first_positions][inverse]):
+        return None
+
+    # Rank the distinct IDs by their first appearance
+    order = np.argsort(first_positions)
+    ranks = np.empty(order.shape[0], dtype=np.int64)
+    ranks[order] = np.arange(order.shape[0])
+    return ranks[inverse], first_positions[order]
+
+
+# The slow way: decode all the IDs and give each new ID the next index, using a dictionary.
+# Returns the same as factorize() and the list of the distinct IDs.
+def factorize_by_dict(data, starts, ends):
+    names_indices_dict = {}
+    indices = np.empty(starts.shape[0], dtype=np.int64)
+    first_positions = []
+    ids = []
+    for i in range(starts.shape[0]):
+        seq_id = data[starts[i]:ends[i]].decode()
+        if seq_id not in names_indices_dict:
+            names_indices_dict[seq_id] = len(ids)
+            ids.append(seq_id)
+            first_positions.append(i)
+        indices[i] = names_indices_dict[seq_id]
+    return indices, np.array(first_positions, dtype=np.int64), ids
+
+
+# Encode the ID fields found at the given positions of the data (1D arrays, in the order of appearance).
+# Returns the index of each ID field and the list of the distinct IDs (by their index).
+def encode_ids(data, starts, ends, hashes, check_hashes):
+    result = factorize(hashes, check_hashes)
+    if result is None:
+        indices, first_positions, ids = factorize_by_dict(data, starts, ends)
+    else:
+        indices, first_positions = result
+        ids = [data[starts[i]:ends[i]].decode() for i in first_positions]
+    return indices, ids
@@ -2,8 +2,13 @@ from PyQt5.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
 import clans.config as cfg
 import clans.io.file_formats.clans_format as clans
 import clans.io.file_formats.clans_minimal_format as clans_mini
+import clans.io.file_formats.clans_binary_format as clans_binary
+import clans.io.file_formats.clans_project_format as clans_project
 import clans.io.file_formats.tab_delimited_format as tab
+import clans.io.file_formats.tabular_search_format as m8
 import clans.data.sequence_pairs as sp
+import clans.io.journal as journal
+import clans.io.file_handler as fh
 import time
 
 
@@ -16,11 +21,18 @@ class ReadInputWorker(QRunnable):
         super().__init__()
 
         self.signals = ReadInputSignals()
+        self.format = format
 
         if format == 'clans':
             self.format_object = clans.ClansFormat()
         elif format == 'mini_clans':
             self.format_object = clans_mini.ClansMinimalFormat()
+        elif format == 'clans_binary' or format == 'clans-binary':
+            self.format_object = clans_binary.ClansBinaryFormat()
+        elif format == 'clans_project' or format == 'clans-project':
+            self.format_object = clans_project.ClansProjectFormat()
+        elif format == 'm8':
+            self.format_object = m8.TabularSearchFormat()
         else:
             self.format_object = tab.DelimitedFormat()
 
@@ -42,6 +54,10 @@ class ReadInputWorker(QRunnable):
                 duration = (self.after - self.before)
                 print("Filling connections and groups took " + str(duration) + " seconds")
 
+            # The next saves to the loaded CLANS file can be appended to its journal
+            if self.format == 'clans':
+                journal.start(cfg.run_params['input_file'], True)
+
             # Build the list of connected pairs (non-redundant, [indexi][indexj]) for the edges display
             self.before = time.time()
             sp.define_connected_sequences_list()
@@ -62,9 +78,16 @@ class ReadInputWorker(QRunnable):
     @pyqtSlot()
     def run(self):
 
+        # The loaded data is replaced - stop journaling the previous file
+        journal.stop()
+
         self.before = time.time()
         self.format_object.read_file(cfg.run_params['input_file'])
 
+        # Apply the changes which were saved incrementally to the journal of a CLANS file (if any)
+        if self.format == 'clans' and self.format_object.file_is_valid == 1:
+            journal.replay(cfg.run_params['input_file'], self.format_object)
+
         if cfg.run_params['is_debug_mode']:
             self.after = time.time()
             duration = (self.after - self.before)
@@ -83,12 +106,27 @@ class FileHandler:
             self.format_object = clans.ClansFormat()
         elif self.file_format == 'mini_clans':
             self.format_object = clans_mini.ClansMinimalFormat()
+        elif self.file_format == 'clans_binary':
+            self.format_object = clans_binary.ClansBinaryFormat()
+        elif self.file_format == 'clans_project':
+            self.format_object = clans_project.ClansProjectFormat()
         else:
             self.format_object = tab.DelimitedFormat()
 
     def write_file(self, file_path, is_param):
         self.file_path = file_path
-        self.format_object.write_file(file_path, is_param)
+
+        # Saving to the journaled CLANS file appends only the changes to its journal
+        if self.file_format == 'clans' and journal.is_active(file_path):
+            journal.append(file_path, is_param)
+
+        else:
+            fh.write_format_file(self.format_object, file_path, self.file_format.replace('_', '-'), is_param)
+
+            # The file was fully written - start journaling it
+            if self.file_format == 'clans':
+                journal.remove(file_path)
+                journal.start(file_path, is_param)
 
         if self.format_object.error == "":
             print("Successfully saved to: " + str(self.file_path))
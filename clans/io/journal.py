@@ -0,0 +1,318 @@
+import os
+import json
+import struct
+import threading
+import numpy as np
+import clans.config as cfg
+import clans.data.sequence_pairs as sp
+import clans.io.parallel_reader as pr
+import clans.io.compression as compression
+import clans.io.file_formats.clans_format as clans
+import clans.io.file_formats.clans_blocks as cb
+
+# Incremental saving of CLANS files in interactive sessions.
+# Instead of rewriting the whole file (with all the sequences and the HSPs) on every save, the changes since the last
+# save are appended to a journal next to the file (<file>.journal): the coordinates that have changed, the groups (if
+# they have changed) and the parameters (if they have changed). When the file is read, the journal is replayed on top
+# of it. When the journal grows too large, it's compacted into the file in a background thread: the parameters, groups
+# and coordinates blocks are rewritten and the other blocks are copied from the file as they are. The compacted file
+# keeps what a full save doesn't write (the blocks CLANS doesn't read, like <rotmtx>, and the <param> keys which are
+# not saved by clans_format.get_params()), so it's not necessarily identical to a full save of the same values.
+# A full save of the file waits for the compaction to finish first (see wait_compaction()).
+#
+# Journal layout (little-endian):
+# - A header: the magic bytes, the format version (uint32) and the size (uint64) and modification time (int64, ns) of
+#   the file it belongs to. A journal which doesn't match its file (which was rewritten since) is ignored.
+# - Records, each with its type (uint8) and the length of its content (uint64):
+#   coordinates - the number of changed sequences (uint32), their indices (int32) and their x,y,z (float32);
+#   groups - the length of a JSON list of the groups (uint32), the list (name, size, color and number of members of
+#   each group) and the members of all the groups (int32);
+#   params - a JSON object of the <param> block.
+#   A truncated record at the end (of an interrupted save) is ignored.
+
+magic = b'CLANSJNL'
+format_version = 1
+header_struct = struct.Struct('<8sIQq')
+record_struct = struct.Struct('<BQ')
+coordinates_record = 1
+groups_record = 2
+params_record = 3
+
+# The journal is compacted into the file when it's larger than this part of the file,
+# or when it holds more coordinates than this number of full layouts
+compaction_size_ratio = 0.25
+compaction_layouts_num = 4
+copy_chunk_size = 1 << 26  # The blocks which are not changed are copied to the compacted file in chunks of 64 MB
+
+# The state of the journaled file: its path and the values as they were last saved (the baseline of the next save)
+base_path = None
+saved_coordinates = None
+saved_groups = None
+saved_params = None
+journal_coordinates_num = 0
+compaction_thread = None
+lock = threading.Lock()
+
+
+def get_journal_path(file_path):
+    return file_path + '.journal'
+
+
+def get_header(file_path):
+    file_stat = os.stat(file_path)
+    return header_struct.pack(magic, format_version, file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def get_record(record_type, content):
+    return record_struct.pack(record_type, len(content)) + content
+
+
+def get_coordinates():
+    sequences = cfg.sequences_array[:cfg.run_params['total_sequences_num']]
+    return np.column_stack((sequences['x_coor'], sequences['y_coor'], sequences['z_coor'])).astype('<f4')
+
+
+def encode_groups(groups_dict):
+    groups = []
+    members = []
+    for group_ID in groups_dict:
+        group_members = [int(seq_index) for seq_index in groups_dict[group_ID]['seqIDs']]
+        groups.append({'name': groups_dict[group_ID]['name'], 'size': groups_dict[group_ID]['size'],
+                       'color': groups_dict[group_ID]['color'], 'members_num': len(group_members)})
+        members += group_members
+    groups_json = json.dumps(groups).encode()
+    return struct.pack('<I', len(groups_json)) + groups_json + np.array(members, dtype='<i4').tobytes()
+
+
+# Returns a dict of the groups (as in cfg.groups_dict)
+def decode_groups(content):
+    json_len = struct.unpack_from('<I', content)[0]
+    groups = json.loads(content[4:4 + json_len].decode())
+    members = np.frombuffer(content, dtype='<i4', offset=4 + json_len)
+    groups_dict = {}
+    members_start = 0
+    for order, group in enumerate(groups):
+        members_end = members_start + group['members_num']
+        groups_dict[order + 1] = clans.get_group_dict(group['name'], group['size'], group['color'], order,
+                                                      members[members_start:members_end].tolist())
+        members_start = members_end
+    return groups_dict
+
+
+def encode_params(params):
+    return json.dumps(params).encode()
+
+
+# Returns the list of the (type, content) records of the journal, or None if it doesn't match the file
+def read_records(file_path):
+    with open(get_journal_path(file_path), 'rb') as infile:
+        data = infile.read()
+    if data[:header_struct.size] != get_header(file_path):
+        return None
+
+    records = []
+    offset = header_struct.size
+    while offset + record_struct.size <= len(data):
+        record_type, content_len = record_struct.unpack_from(data, offset)
+        offset += record_struct.size
+        if offset + content_len > len(data):
+            break
+        records.append((record_type, data[offset:offset + content_len]))
+        offset += content_len
+    return records
+
+
+# Apply the journal of the file (if there is one) to the values read by ClansFormat.read_file()
+def replay(file_path, format_object):
+    if not os.path.isfile(get_journal_path(file_path)):
+        return
+
+    records = read_records(file_path)
+    if records is None:
+        print("Ignoring the journal of " + os.path.basename(file_path) + " - the file was changed after it")
+        return
+
+    for record_type, content in records:
+        if record_type == coordinates_record:
+            changed_num = struct.unpack_from('<I', content)[0]
+            indices = np.frombuffer(content, dtype='<i4', count=changed_num, offset=4)
+            coordinates = np.frombuffer(content, dtype='<f4', count=changed_num * 3,
+                                        offset=4 + changed_num * 4).reshape((-1, 3))
+            if np.any(indices >= cfg.run_params['total_sequences_num']):
+                print("Ignoring the rest of the journal of " + os.path.basename(file_path) + " - it doesn't match "
+                      "the number of sequences")
+                return
+            format_object.pos_indices.append(indices.astype(np.int64))
+            format_object.coordinates.append(coordinates)
+        elif record_type == groups_record:
+            cfg.groups_dict = decode_groups(content)
+            format_object.is_groups = 1 if len(cfg.groups_dict) > 0 else 0
+        elif record_type == params_record:
+            format_object.params = json.loads(content.decode())
+
+    print("Replayed " + str(len(records)) + " saved changes from the journal of " + os.path.basename(file_path))
+
+
+# Start journaling the file: the current values (as they were just loaded from the file or fully saved to it) are the
+# baseline of the next save
+def start(file_path, is_param):
+    global base_path, saved_coordinates, saved_groups, saved_params, journal_coordinates_num
+
+    with lock:
+        base_path = os.path.realpath(file_path)
+        saved_coordinates = get_coordinates()
+        saved_groups = encode_groups(cfg.groups_dict)
+        saved_params = encode_params(clans.get_params()) if is_param else None
+        journal_coordinates_num = 0
+
+
+# Stop journaling (the loaded data was replaced)
+def stop():
+    global base_path
+    with lock:
+        base_path = None
+
+
+# Returns True if saving to the file can be done by appending to its journal
+def is_active(file_path):
+    return base_path is not None and base_path == os.path.realpath(file_path) and os.path.isfile(file_path) and \
+        compression.get_output_compression(file_path) is None and \
+        saved_coordinates.shape[0] == cfg.run_params['total_sequences_num']
+
+
+# Wait for the compaction of the journal (if running), which replaces the file when it's done - before the file is
+# fully rewritten
+def wait_compaction():
+    if compaction_thread is not None:
+        compaction_thread.join()
+
+
+# Delete the journal of the file (which is fully rewritten), after the compaction of the journal (if running)
+def remove(file_path):
+    wait_compaction()
+    if os.path.isfile(get_journal_path(file_path)):
+        os.remove(get_journal_path(file_path))
+
+
+# Append the changes since the last save to the journal of the file
+def append(file_path, is_param):
+    global saved_coordinates, saved_groups, saved_params, journal_coordinates_num
+
+    coordinates = get_coordinates()
+    groups = encode_groups(cfg.groups_dict)
+    params = encode_params(clans.get_params()) if is_param else None
+
+    records = []
+    changed = np.flatnonzero(np.any(coordinates != saved_coordinates, axis=1)).astype('<i4')
+    if changed.shape[0] > 0:
+        records.append(get_record(coordinates_record, struct.pack('<I', changed.shape[0]) + changed.tobytes() +
+                                  coordinates[changed].tobytes()))
+    if groups != saved_groups:
+        records.append(get_record(groups_record, groups))
+    if params is not None and params != saved_params:
+        records.append(get_record(params_record, params))
+
+    with lock:
+        journal_path = get_journal_path(file_path)
+        if not os.path.isfile(journal_path):
+            with open(journal_path, 'wb') as output:
+                output.write(get_header(file_path))
+        with open(journal_path, 'ab') as output:
+            output.write(b''.join(records))
+
+        saved_coordinates = coordinates
+        saved_groups = groups
+        if params is not None:
+            saved_params = params
+        journal_coordinates_num += changed.shape[0]
+
+        journal_size = os.path.getsize(journal_path)
+        is_compaction_needed = journal_size > compaction_size_ratio * os.path.getsize(file_path) or \
+            journal_coordinates_num > compaction_layouts_num * coordinates.shape[0]
+
+    if is_compaction_needed and (compaction_thread is None or not compaction_thread.is_alive()):
+        start_compaction(file_path, journal_size)
+
+
+# Compact the journal into the file in a background thread, from a snapshot of the saved values
+def start_compaction(file_path, journal_size):
+    global compaction_thread, journal_coordinates_num
+
+    with lock:
+        snapshot = (saved_coordinates, decode_groups(saved_groups),
+                    None if saved_params is None else json.loads(saved_params.decode()))
+        journal_coordinates_num = 0
+    compaction_thread = threading.Thread(target=compact, args=(file_path, journal_size) + snapshot)
+    compaction_thread.start()
+
+
+# Returns the parameters of the <param> block between content_start and content_end (the keys and values as they are
+# written in the file)
+def read_params_block(data, content_start, content_end):
+    params = {}
+    for line in data[content_start:content_end].decode().splitlines():
+        key, separator, value = line.strip().partition('=')
+        if separator != '':
+            params[key] = value
+    return params
+
+
+# Write a new version of the file with the given values (and the other blocks as they are in the file) and replace
+# the file and its journal (keeping the records appended to the journal since its first journal_size bytes)
+def compact(file_path, journal_size, coordinates, groups_dict, params):
+    compacted_path = file_path + '.compacting'
+    data = pr.map_file(file_path)
+    blocks = cb.find_blocks(data)
+    tags = [block[0] for block in blocks]
+
+    with open(compacted_path, 'w') as output:
+        output.write(data[:pr.next_line_start(data, 0, len(data))].decode())
+        if params is not None and 'param' not in tags:
+            clans.write_params_block(output, params)
+
+        is_pos_written = False
+        for tag, start, content_start, content_end, end in blocks:
+            # The parameters of the file which are not saved by CLANS are kept
+            if tag == 'param' and params is not None:
+                file_params = read_params_block(data, content_start, content_end)
+                file_params.update(params)
+                clans.write_params_block(output, file_params)
+            elif tag == 'seqgroups':
+                if len(groups_dict) > 0:
+                    clans.write_groups_block(output, groups_dict)
+            elif tag == 'pos':
+                if 'seqgroups' not in tags and len(groups_dict) > 0:
+                    clans.write_groups_block(output, groups_dict)
+                if not is_pos_written:
+                    clans.write_pos_block(output, coordinates[:, 0], coordinates[:, 1], coordinates[:, 2])
+                    is_pos_written = True
+            else:
+                output.flush()
+                for chunk_start in range(start, end, copy_chunk_size):
+                    output.buffer.write(data[chunk_start:min(chunk_start + copy_chunk_size, end)])
+        output.flush()
+        os.fsync(output.fileno())
+
+    pr.unmap_file(data)
+
+    # Replace the file and move the records which were appended during the compaction to a new journal
+    with lock:
+        journal_path = get_journal_path(file_path)
+        with open(journal_path, 'rb') as infile:
+            infile.seek(journal_size)
+            new_records = infile.read()
+        if len(new_records) > 0:
+            with open(journal_path + '.compacting', 'wb') as output:
+                output.write(get_header(compacted_path))
+                output.write(new_records)
+
+        os.replace(compacted_path, file_path)
+        # The pairs blocks were copied as they are, so the file is still the source of the pairs (if it was)
+        sp.refresh_pairs_source(file_path)
+        if len(new_records) > 0:
+            os.replace(journal_path + '.compacting', journal_path)
+        else:
+            os.remove(journal_path)
+
+    if cfg.run_params['is_debug_mode']:
+        print("Compacted the journal of " + os.path.basename(file_path))
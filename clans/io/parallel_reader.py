@@ -0,0 +1,89 @@
+import os
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+import numba
+import clans.config as cfg
+import clans.io.compression as compression
+
+# Parallel parsing of large input files: the file is memory-mapped, the part to parse is split into line-aligned
+# byte ranges and each range is parsed in a separate thread. The parsing functions should release the GIL
+# (numba functions with nogil=True, np.fromstring) for the threads to run concurrently.
+
+min_range_size = 1 << 20  # Don't split into ranges smaller than 1 MB
+
+
+# Memory-map the (open) file for reading
+def map_open_file(infile):
+    # An empty file cannot be mapped
+    if os.fstat(infile.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Memory-map the file for reading. Returns the mapped data (supports slicing and find(), like bytes).
+# A compressed file is decompressed to a temporary file (in the working directory, if defined), which is mapped
+# instead. The temporary file is deleted when the data is unmapped.
+def map_file(file_path):
+    if compression.detect_compression(file_path) is not None:
+        with compression.decompress_to_temp_file(file_path, cfg.run_params.get('working_dir')) as temp_file:
+            return map_open_file(temp_file)
+
+    with open(file_path, 'rb') as infile:
+        return map_open_file(infile)
+
+
+def unmap_file(data):
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+
+# Returns the position of the first byte of the line following the one containing 'pos' (or 'end')
+def next_line_start(data, pos, end):
+    newline_pos = data.find(b'\n', pos, end)
+    if newline_pos == -1:
+        return end
+    return newline_pos + 1
+
+
+# Count the lines between start and end (a last line without a newline is also counted)
+@numba.njit(nogil=True)
+def count_lines(buffer, start, end):
+    lines_num = 0
+    for pos in range(start, end):
+        if buffer[pos] == 10:
+            lines_num += 1
+    if end > start and buffer[end - 1] != 10:
+        lines_num += 1
+    return lines_num
+
+
+def get_threads_num():
+    if cfg.run_params['parse_threads'] > 0:
+        return cfg.run_params['parse_threads']
+    return os.cpu_count()
+
+
+# Split the bytes between start and end into line-aligned ranges, one per thread (at least min_range_size each).
+# Returns a list of (range_start, range_end) tuples.
+def split_ranges(data, start, end):
+    ranges_num = max(1, min(get_threads_num(), (end - start) // min_range_size))
+    boundaries = [start]
+    for i in range(1, ranges_num):
+        boundary = next_line_start(data, start + (end - start) * i // ranges_num, end)
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    boundaries.append(end)
+
+    return [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1) if boundaries[i + 1] >
+            boundaries[i]]
+
+
+# Run the parsing function on each range concurrently: function(buffer, range_start, range_end).
+# Returns the list of the results, in the order of the ranges.
+def parse_ranges(function, buffer, ranges):
+    if len(ranges) <= 1:
+        return [function(buffer, range_start, range_end) for range_start, range_end in ranges]
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(function, buffer, range_start, range_end) for range_start, range_end in ranges]
+        return [future.result() for future in futures]
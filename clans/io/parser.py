@@ -9,7 +9,8 @@ def parse_arguments():
                         help="Load a network file containing at least pairs of sequences and similarity-scores",
                         type=str)
     parser.add_argument("-format", metavar="input_file_format", help="Input file format (default is CLANS format)",
-                        type=str, choices=['clans', 'mini-clans', 'delimited'], default=cfg.input_format)
+                        type=str, choices=['clans', 'mini-clans', 'clans-binary', 'clans-project', 'delimited',
+                                           'm8'], default=cfg.input_format)
 
     ## Clustering parameters
     parser.add_argument("-dorounds", metavar="rounds", help="Number of clustering rounds to perform (default=0)",
@@ -19,6 +20,8 @@ def parse_arguments():
                         default=cfg.similarity_cutoff)
 
     ## Misc parameters
+    parser.add_argument("--parse_threads", help="Number of threads for parsing large input files (default=0, the "
+                                                "number of CPUs)", type=int, default=cfg.parse_threads)
     parser.add_argument("--debug", help="Debug mode: add debug printouts", action='store_true', default=False)
     # parser.add_argument("-logfile", metavar="clans_logfile_path", help="a destination file for logging", type=str)
 
@@ -35,6 +38,7 @@ def parse_arguments():
 
     cfg.run_params['num_of_rounds'] = args.dorounds
     cfg.run_params['similarity_cutoff'] = args.pval
+    cfg.run_params['parse_threads'] = args.parse_threads
     cfg.run_params['is_debug_mode'] = args.debug
     if cfg.run_params['is_debug_mode']:
         print("Run parameters:")
@@ -51,14 +55,25 @@ def parse_arguments_cmd():
                                                                  "or tab-delimited formats", type=str)
     parser.add_argument("-input_format", metavar="input_file_format",
                         help="Input file format (default is CLANS format)", type=str,
-                        choices=['clans', 'mini-clans', 'delimited'], default=cfg.input_format)
+                        choices=['clans', 'mini-clans', 'clans-binary', 'clans-project', 'delimited', 'm8'],
+                        default=cfg.input_format)
+    parser.add_argument("-fasta", metavar="fasta_file_path", help="A FASTA file with the sequences of the IDs in the "
+                                                                  "tabular search results (optional, for "
+                                                                  "-input_format m8)", type=str)
     parser.add_argument("-saveto", metavar="destination_file_path", required=True,
                         help="A destination path for saving the output file (in CLANS format, by default)", type=str)
     parser.add_argument("-output_format", metavar="output_file_format",
                         help="Output file format (default is CLANS format)", type=str,
-                        choices=['clans', 'mini-clans', 'delimited'], default=cfg.output_format)
+                        choices=['clans', 'mini-clans', 'clans-binary', 'clans-project', 'delimited'],
+                        default=cfg.output_format)
 
     ## Blast search parameters
+    parser.add_argument("-search_engine", metavar="search_engine", help="The similarity-search engine for the FASTA "
+                                                                     "input: blast, mmseqs, diamond or sw (the "
+                                                                     "built-in Smith-Waterman search, without "
+                                                                     "external programs; default: "
+                                                                     + cfg.search_engine + ")",
+                        type=str, choices=['blast', 'mmseqs', 'diamond', 'sw'], default=cfg.search_engine)
     parser.add_argument("-eval", metavar="E-value_threshold", help="E-value threshold for extracting BLAST HSPs "
                                                                    "(default="+str(cfg.BLAST_Evalue_cutoff)+")",
                         type=float, default=cfg.BLAST_Evalue_cutoff)
@@ -66,6 +81,52 @@ def parse_arguments_cmd():
                         + cfg.BLAST_scoring_matrix + ")", type=str,
                         choices=['BLOSUM62', 'BLOSUM45', 'BLOSUM80', 'PAM30', 'PAM70'],
                         default=cfg.BLAST_scoring_matrix)
+    parser.add_argument("--blast_cores", help="Total number of cores for the concurrent BLAST processes (default=0, "
+                                              "the number of CPUs)", type=int, default=cfg.BLAST_cores)
+    parser.add_argument("--blast_job_threads", help="Number of threads of each BLAST process (default="
+                                                    + str(cfg.BLAST_job_threads) + ")",
+                        type=int, default=cfg.BLAST_job_threads)
+    parser.add_argument("--blast_triangular", help="Search each pair of sequences only once: each query chunk is "
+                                                   "searched against its own and the following chunks of the database",
+                        action='store_true', default=cfg.BLAST_triangular)
+    parser.add_argument("--blast_reciprocal", help="With --blast_triangular: search the borderline pairs again in the "
+                                                   "other direction and keep the better E-value",
+                        action='store_true', default=cfg.BLAST_reciprocal)
+    parser.add_argument("--blast_cache", metavar="cache_dir_path", help="A directory for caching the search results: "
+                                                                        "only the sequences which are not in the cache "
+                                                                        "are searched (against all the sequences)",
+                        type=str, default=cfg.BLAST_cache_dir)
+    parser.add_argument("--prefilter", help="Search only the candidate pairs found by a k-mer (MinHash) prefilter. "
+                                            "It trades the recall of remote homologs for speed: with the defaults "
+                                            "(spaced 6-mers, 1024 bands of 1 row), about 0.2%% of the pairs of "
+                                            "synthetic protein families were candidates, and about 50%% of the pairs "
+                                            "with E-value <= 1e-4, 70%% with E-value <= 1e-20 and 90%% with E-value "
+                                            "<= 1e-40 were found. Shorter k-mers find more homologs with more "
+                                            "candidates (--prefilter_pattern 1101011: 3%% candidates, 65-75%%, "
+                                            "85-90%% and 97-99%% of these pairs). Measure the recall on a sample of "
+                                            "the sequences with --prefilter_recall. The queries are searched in "
+                                            "small chunks against a database of the candidates of their chunk, so "
+                                            "some pairs which are not candidates are reported as well",
+                        action='store_true', default=cfg.prefilter)
+    parser.add_argument("--prefilter_pattern", help="The spaced-seed pattern of the prefilter k-mers ('1' = a used "
+                                                    "position, default=" + cfg.prefilter_pattern + ")",
+                        type=str, default=cfg.prefilter_pattern)
+    parser.add_argument("--prefilter_bands", help="Number of LSH bands of the prefilter sketches (default="
+                                                  + str(cfg.prefilter_bands) + ")", type=int,
+                        default=cfg.prefilter_bands)
+    parser.add_argument("--prefilter_rows", help="Number of hashes in each band of the prefilter sketches (more rows "
+                                                 "find fewer candidates and miss more homologs, default="
+                                                 + str(cfg.prefilter_rows) + ")", type=int, default=cfg.prefilter_rows)
+    parser.add_argument("--prefilter_recall", help="Measure the recall of the prefilter: run the full search as well "
+                                                   "and report the part of its pairs found with the prefilter",
+                        action='store_true', default=False)
+    parser.add_argument("--collapse_redundant", help="Collapse the identical and nearly identical sequences of the "
+                                                     "FASTA input into representatives for the search and the layout "
+                                                     "(the other sequences are placed next to their representative, in "
+                                                     "a group)", action='store_true', default=cfg.collapse_redundant)
+    parser.add_argument("--collapse_identity", help="The minimal identity of nearly identical sequences (1 = exact "
+                                                    "duplicates only, default=" + str(cfg.collapse_identity) + ")",
+                        type=float, default=cfg.collapse_identity)
 
     ## Clustering parameters
     parser.add_argument("-dorounds", metavar="rounds", help="Number of clustering rounds to perform (default=0)",
@@ -107,8 +168,48 @@ def parse_arguments_cmd():
                                           ". It scales linearly with the distance from origin (default="
                                           + str(cfg.layouts['FR']['params']['gravity']) + ")",
                         type=float, default=cfg.layouts['FR']['params']['gravity'])
+    parser.add_argument("--node_order", help="The internal order of the sequences during the layout calculation, "
+                                             "for better memory locality: 'rcm' (reverse Cuthill-McKee on the "
+                                             "connections), 'morton' (space-filling curve on the coordinates) or "
+                                             "'none' (default=" + cfg.node_ordering + ")",
+                        type=str, choices=['none', 'rcm', 'morton'], default=cfg.node_ordering)
+    parser.add_argument("--node_order_interval", help="Number of rounds between recalculations of the 'morton' order "
+                                                      "(default=" + str(cfg.node_ordering_interval) + ")",
+                        type=int, default=cfg.node_ordering_interval)
+    parser.add_argument("--landmarks", help="Landmark layout for a quick preview of large datasets: lay out only this "
+                                            "number of well-spread sequences (for -dorounds rounds) and place the "
+                                            "rest by interpolation from their connected landmarks (default=0, off)",
+                        type=int, default=cfg.landmarks_num)
+    parser.add_argument("--landmark_refine", help="Number of global FR rounds to refine the landmark layout with "
+                                                  "(default=" + str(cfg.landmark_refine_rounds) + ")",
+                        type=int, default=cfg.landmark_refine_rounds)
+    parser.add_argument("--shards", help="Sharded layout: split the sequences between this number of worker "
+                                         "processes, which exchange only their boundary coordinates and a coarse "
+                                         "summary of their positions every round (default=0, off)",
+                        type=int, default=cfg.shards_num)
+    parser.add_argument("--shard_address", help="The host:port on which the coordinator of the sharded layout listens "
+                                                 "for its workers (default=" + cfg.shard_address + ")",
+                        type=str, default=cfg.shard_address)
+    parser.add_argument("--shard_remote", help="Don't start the sharded layout workers locally - wait for them to "
+                                               "connect (start them on any host with clans_worker.py)",
+                        action='store_true', default=False)
+    parser.add_argument("--shard_cells", help="Number of grid cells per dimension for summarizing the other shards "
+                                              "in the far-field repulsion (default=" + str(cfg.shard_cells_per_dim)
+                                              + ")",
+                        type=int, default=cfg.shard_cells_per_dim)
+    parser.add_argument("--stream_edges", help="Out-of-core layout for edge sets which don't fit in memory: stream "
+                                               "the connected edges through the attraction calculation in chunks, "
+                                               "directly from the input file. Requires an input whose edges are "
+                                               "memory-mapped (clans-binary or clans-project) - otherwise the layout "
+                                               "is calculated in memory",
+                        action='store_true', default=cfg.stream_edges)
+    parser.add_argument("--edge_chunk", help="Number of edges per chunk when streaming the edges (default="
+                                             + str(cfg.edge_chunk_size) + ")",
+                        type=int, default=cfg.edge_chunk_size)
 
     ## Misc parameters
+    parser.add_argument("--parse_threads", help="Number of threads for parsing large input files (default=0, the "
+                                                "number of CPUs)", type=int, default=cfg.parse_threads)
     parser.add_argument("--debug", help="Debug mode: add debug printouts", action='store_true', default=False)
     # parser.add_argument("-logfile", metavar="clans_logfile_path", help="a destination file for logging", type=str)
 
@@ -123,6 +224,7 @@ def parse_arguments_cmd():
         if args.load is not None:
             cfg.run_params['input_file'] = args.load
             cfg.run_params['input_format'] = args.input_format
+            cfg.run_params['sequences_file'] = args.fasta
             cfg.run_params['run_blast'] = False
         else:
             cfg.run_params['error'] = "You must provide an input file - either a FASTA file for BLAST search " \
@@ -140,6 +242,19 @@ def parse_arguments_cmd():
 
     cfg.run_params['evalue_cutoff'] = args.eval
     cfg.run_params['scoring_matrix'] = args.matrix
+    cfg.run_params['search_engine'] = args.search_engine
+    cfg.run_params['blast_cores'] = args.blast_cores
+    cfg.run_params['blast_job_threads'] = args.blast_job_threads
+    cfg.run_params['blast_triangular'] = args.blast_triangular
+    cfg.run_params['blast_reciprocal'] = args.blast_reciprocal
+    cfg.run_params['blast_cache'] = args.blast_cache
+    cfg.run_params['prefilter'] = args.prefilter
+    cfg.run_params['prefilter_pattern'] = args.prefilter_pattern
+    cfg.run_params['prefilter_bands'] = args.prefilter_bands
+    cfg.run_params['prefilter_rows'] = args.prefilter_rows
+    cfg.run_params['prefilter_recall'] = args.prefilter_recall
+    cfg.run_params['collapse_redundant'] = args.collapse_redundant
+    cfg.run_params['collapse_identity'] = args.collapse_identity
     cfg.run_params['num_of_rounds'] = args.dorounds
     cfg.run_params['similarity_cutoff'] = args.pval
     cfg.run_params['cooling'] = args.cooling
@@ -150,6 +265,17 @@ def parse_arguments_cmd():
     cfg.run_params['rep_exp'] = args.rep_exp
     cfg.run_params['dampening'] = args.dampening
     cfg.run_params['gravity'] = args.gravity
+    cfg.run_params['node_ordering'] = args.node_order
+    cfg.run_params['node_ordering_interval'] = args.node_order_interval
+    cfg.run_params['landmarks_num'] = args.landmarks
+    cfg.run_params['landmark_refine_rounds'] = args.landmark_refine
+    cfg.run_params['shards_num'] = args.shards
+    cfg.run_params['shard_address'] = args.shard_address
+    cfg.run_params['is_shard_remote'] = args.shard_remote
+    cfg.run_params['shard_cells_per_dim'] = args.shard_cells
+    cfg.run_params['stream_edges'] = args.stream_edges
+    cfg.run_params['edge_chunk_size'] = args.edge_chunk
+    cfg.run_params['parse_threads'] = args.parse_threads
     cfg.run_params['is_debug_mode'] = args.debug
     if args.cluster2d:
         cfg.run_params['dimensions_num_for_clustering'] = 2
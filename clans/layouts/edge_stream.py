@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import clans.config as cfg
+import clans.layouts.fruchterman_reingold_numba as frn
+
+# Out-of-core attraction for edge sets which are too large to be held in memory (even in the compact form).
+# The edges are streamed directly from the memory-mapped edges arrays of the input (a clans-binary file or a CLANS
+# project, see sp.load_edges()), without copying them: in each round they are read through the attraction kernel
+# chunk by chunk (only the connected ones), while the next chunk is read ahead in a background thread.
+# Only the coordinates, the movement, the connected mask and two chunks of edges are held in memory.
+# The edges are kept in the order of cfg.edges_indices, which set_edges() sorts by the first (source) sequence,
+# so each chunk covers a contiguous range of source sequences.
+
+
+# Returns True if the edges arrays are memory-mapped from the input (so they can be streamed)
+def is_mapped():
+    return isinstance(cfg.edges_indices, np.memmap) and isinstance(cfg.edges_att_values, np.memmap)
+
+
+class EdgeStore:
+
+    # A store of the current edges arrays (which should be memory-mapped, see is_mapped()), read chunk_size edges at
+    # a time. The connected edges are selected by cfg.edges_connected while reading.
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.edges = cfg.edges_indices
+        self.att_values = cfg.edges_att_values
+        self.connected = cfg.edges_connected
+        self.total_edges_num = self.edges.shape[0]
+        self.edges_num = int(np.count_nonzero(self.connected))
+
+        if cfg.run_params['is_debug_mode']:
+            print("Streaming " + str(self.edges_num) + " connected edges (of " + str(self.total_edges_num) +
+                  ") in chunks of " + str(chunk_size))
+
+    # The store can be reused as long as the edges and the connected mask are the same (the mask is replaced when
+    # the cutoff changes)
+    def is_current(self, chunk_size):
+        return self.edges is cfg.edges_indices and self.att_values is cfg.edges_att_values and \
+            self.connected is cfg.edges_connected and self.chunk_size == chunk_size
+
+    # Read the connected edges of one chunk of the store into memory (in the background thread)
+    def read_chunk(self, start):
+        end = min(start + self.chunk_size, self.total_edges_num)
+        connected = self.connected[start:end]
+        return np.array(self.edges[start:end][connected]), np.array(self.att_values[start:end][connected])
+
+    # Add the attractive movement along all the edges of the store to the movement array
+    def calculate_attractive_forces(self, coordinates, movement, n_dims, att_val, att_exp):
+        if self.edges_num == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_chunk = executor.submit(self.read_chunk, 0)
+            for start in range(0, self.total_edges_num, self.chunk_size):
+                edges, att_values = next_chunk.result()
+                if start + self.chunk_size < self.total_edges_num:
+                    next_chunk = executor.submit(self.read_chunk, start + self.chunk_size)
+
+                frn.calculate_attractive_forces(coordinates, edges, att_values, cfg.att_quantization_scale, movement,
+                                                n_dims, att_val, att_exp)
@@ -1,15 +1,29 @@
 import numpy as np
 import numba
 import clans.config as cfg
+import clans.data.sequence_pairs as sp
+import clans.layouts.fruchterman_reingold_numba as frn
+import clans.layouts.node_ordering as no
+import clans.layouts.edge_stream as es
 
 coordinates = []
 total_seq_last_movement = []
 current_temp = 1.0
+ordering = None
+connected_edges = None
+attraction_values = None
+permuted_connected_edges = None
+permuted_attraction_values = None
+edge_store = None
 
 
 def init_variables():
     global coordinates
     global total_seq_last_movement
+    global ordering
+    global connected_edges
+    global attraction_values
+    global edge_store
 
     if cfg.run_params['dimensions_num_for_clustering'] == 2:
         coordinates = np.column_stack((cfg.sequences_array['x_coor'], cfg.sequences_array['y_coor']))
@@ -19,20 +33,62 @@ def init_variables():
 
     total_seq_last_movement = np.zeros((cfg.run_params['total_sequences_num'], cfg.run_params['dimensions_num_for_clustering']))
 
+    # The connected pairs (edges) and their quantized attraction values.
+    # When the edges are streamed from the disk, the pair-forces kernel calculates only the repulsion. The store is
+    # kept between the runs as long as the edges don't change.
+    node_ordering = cfg.run_params['node_ordering']
+    is_streamed = cfg.run_params['stream_edges'] and es.is_mapped()
+    if cfg.run_params['stream_edges'] and not is_streamed:
+        print("The edges cannot be streamed: they are streamed only when they are memory-mapped from a clans-binary "
+              "file or a CLANS project (and not changed after loading) - calculating the layout in memory")
+
+    if is_streamed:
+        if edge_store is None or not edge_store.is_current(cfg.run_params['edge_chunk_size']):
+            edge_store = es.EdgeStore(cfg.run_params['edge_chunk_size'])
+        connected_edges = np.empty((0, 2), dtype=np.int32)
+        attraction_values = np.empty(0, dtype=np.uint16)
+
+        # The RCM order is calculated from the connections, which are not held in memory
+        if node_ordering == 'rcm':
+            print("The 'rcm' order is not available when streaming the edges - using the file order")
+            node_ordering = 'none'
+    else:
+        edge_store = None
+        connected_edges, attraction_values = sp.get_connected_edges()
+
+    # The internal order of the sequences in the pair-forces calculation
+    ordering = no.NodeOrdering(node_ordering, cfg.run_params['node_ordering_interval'])
+
 
 #@profile
 def calculate_new_positions():
     global coordinates
     global total_seq_last_movement
     global current_temp
-    attraction_values = cfg.attraction_values_mtx
-    connected_sequences = cfg.connected_sequences_mtx
+    global permuted_connected_edges
+    global permuted_attraction_values
     movement = np.zeros((cfg.run_params['total_sequences_num'], cfg.run_params['dimensions_num_for_clustering']))
 
     # Calculate the movement created by the attractive and repulsive forces between the pairs
-    calculate_pair_forces(coordinates, attraction_values, connected_sequences, movement,
-                          cfg.run_params['dimensions_num_for_clustering'], cfg.run_params['att_val'],
-                          cfg.run_params['att_exp'], cfg.run_params['rep_val'], cfg.run_params['rep_exp'])
+    # (running over the sequences in the internal order, if defined, and restoring the original order afterwards)
+    if ordering.is_active():
+        if ordering.refresh(coordinates, connected_edges):
+            permuted_connected_edges, permuted_attraction_values = ordering.permute_edges(connected_edges,
+                                                                                          attraction_values)
+        frn.calculate_pair_forces(ordering.permute_array(coordinates), permuted_connected_edges,
+                                  permuted_attraction_values, cfg.att_quantization_scale, movement,
+                                  cfg.run_params['dimensions_num_for_clustering'], cfg.run_params['att_val'],
+                                  cfg.run_params['att_exp'], cfg.run_params['rep_val'], cfg.run_params['rep_exp'])
+        movement = ordering.restore_array(movement)
+    else:
+        frn.calculate_pair_forces(coordinates, connected_edges, attraction_values, cfg.att_quantization_scale,
+                                  movement, cfg.run_params['dimensions_num_for_clustering'], cfg.run_params['att_val'],
+                                  cfg.run_params['att_exp'], cfg.run_params['rep_val'], cfg.run_params['rep_exp'])
+
+    # Stream the edges from the disk through the attraction kernel (in the original order of the sequences)
+    if edge_store is not None:
+        edge_store.calculate_attractive_forces(coordinates, movement, cfg.run_params['dimensions_num_for_clustering'],
+                                               cfg.run_params['att_val'], cfg.run_params['att_exp'])
     #print("movement:" + str(movement))
 
     # Add the 'gravity' movement towards the origin
@@ -90,48 +146,6 @@ def calc_moves_per_seq(pair_moves):
     return seq_moves
 
 
-@numba.njit(parallel=True)
-def calculate_pair_forces(coor, attraction_values, connected_sequences, movement, n_dims, att_val, att_exp, rep_val, rep_exp):
-    n_sequences = coor.shape[0]
-    dist_array = np.zeros(n_dims)
-
-    for i in range(n_sequences-1):
-        for j in range(i+1, n_sequences):
-            euclidean_dist = 0
-
-            # Calculate the pair-distances in each dimension and the Euclidean distance for each pair
-            for dim in range(n_dims):
-                dist_array[dim] = coor[i][dim] - coor[j][dim]
-                euclidean_dist += square_num(dist_array[dim])
-            if euclidean_dist == 0:
-                euclidean_dist = 0.000001
-            else:
-                euclidean_dist = sqrt_num(euclidean_dist)
-
-            # Calculate the pairwise repulsive forces between all the sequences
-            rep_force = calc_rep_force(rep_val, euclidean_dist, rep_exp)
-
-            # Calculate the pairwise attractive forces between the connected sequences only
-            if connected_sequences[i][j] == 1:
-                att_force = calc_att_force(attraction_values[i][j], att_val, euclidean_dist, att_exp)
-
-            for dim in range(n_dims):
-                # Calculate the pairwise movement, resulted from the repulsive force, in each dimension separately
-                rep_movement = calc_pair_move(dist_array[dim], euclidean_dist, rep_force)
-
-                # add the repulsive movement to both sequences in opposite directions
-                movement[i][dim] += rep_movement
-                movement[j][dim] -= rep_movement
-
-                if connected_sequences[i][j] == 1:
-                    # Calculate the pairwise movement, resulted from the attractive force, in each dimension separately
-                    att_movement = calc_pair_move(dist_array[dim], euclidean_dist, att_force)
-
-                    # add the attractive movement to both sequences in opposite directions (towards each other)
-                    movement[i][dim] -= att_movement
-                    movement[j][dim] += att_movement
-
-
 @numba.guvectorize([(numba.float64[:, :], numba.int64, numba.float64, numba.float64, numba.float64[:, :])],
                    '(m, n), (), (), () -> (m, n)', nopython=True, target='parallel')
 def calculate_total_sequence_movement(last_movement, n_dims, dampening, maxmove, movement):
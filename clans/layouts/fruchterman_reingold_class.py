@@ -1,6 +1,8 @@
 import numpy as np
 import clans.config as cfg
+import clans.data.sequence_pairs as sp
 import clans.layouts.fruchterman_reingold_numba as frn
+import clans.layouts.node_ordering as no
 
 
 class FruchtermanReingold:
@@ -22,8 +24,13 @@ class FruchtermanReingold:
         else:
             self.current_temp = 1.0
 
-        self.attraction_values = cfg.attraction_values_mtx
-        self.connected_sequences = cfg.connected_sequences_mtx
+        # The connected pairs (edges) and their quantized attraction values
+        self.connected_edges, self.attraction_values = sp.get_connected_edges()
+
+        # The internal order of the sequences in the pair-forces calculation
+        self.node_ordering = no.NodeOrdering(cfg.run_params['node_ordering'], cfg.run_params['node_ordering_interval'])
+        self.permuted_connected_edges = None
+        self.permuted_attraction_values = None
 
     def init_calculation(self, coor_x, coor_y, coor_z):
 
@@ -38,8 +45,8 @@ class FruchtermanReingold:
         self.total_seq_last_movement = np.zeros((self.total_seq_num, self.dim_num))
 
         self.current_temp = 1.0
-        self.attraction_values = cfg.attraction_values_mtx
-        self.connected_sequences = cfg.connected_sequences_mtx
+        self.connected_edges, self.attraction_values = sp.get_connected_edges()
+        self.node_ordering.reset()
 
     def init_coordinates(self, coor_x, coor_y, coor_z):
 
@@ -51,27 +58,55 @@ class FruchtermanReingold:
             self.dim_num = 2
 
         self.total_seq_last_movement = np.zeros((self.total_seq_num, self.dim_num))
+        self.node_ordering.reset()
 
     def update_connections(self):
-        self.attraction_values = cfg.attraction_values_mtx
-        self.connected_sequences = cfg.connected_sequences_mtx
+        self.connected_edges, self.attraction_values = sp.get_connected_edges()
+        self.node_ordering.reset()
 
-    def calculate_new_positions(self, is_subset_mode):
+    # Use a given set of connected pairs instead of the global ones (e.g. the induced subgraph of a sample)
+    def set_connections(self, connected_edges, attraction_values):
+        self.connected_edges = connected_edges
+        self.attraction_values = attraction_values
+        self.node_ordering.reset()
 
+    # Calculate the movement created by the attractive and repulsive forces between the pairs
+    def calculate_pair_forces(self, coordinates, edges, attraction_values, in_subset, is_subset_mode):
         movement = np.zeros((self.total_seq_num, self.dim_num))
 
-        # Calculate the movement created by the attractive and repulsive forces between the pairs
         if not is_subset_mode:
-            frn.calculate_pair_forces(self.coordinates, self.attraction_values, self.connected_sequences, movement,
+            frn.calculate_pair_forces(coordinates, edges, attraction_values, cfg.att_quantization_scale, movement,
                                       self.dim_num, cfg.run_params['att_val'], cfg.run_params['att_exp'],
                                       cfg.run_params['rep_val'], cfg.run_params['rep_exp'])
 
         # Subset mode - ignore pairs which are not in the subset
         else:
-            frn.calculate_pair_forces_subset(self.coordinates, self.attraction_values, self.connected_sequences,
+            frn.calculate_pair_forces_subset(coordinates, edges, attraction_values, cfg.att_quantization_scale,
                                              movement, self.dim_num, cfg.run_params['att_val'],
                                              cfg.run_params['att_exp'], cfg.run_params['rep_val'],
-                                             cfg.run_params['rep_exp'], cfg.sequences_array['in_subset'])
+                                             cfg.run_params['rep_exp'], in_subset)
+        return movement
+
+    def calculate_new_positions(self, is_subset_mode):
+
+        # Calculate the pair-forces with the kernels running over the sequences in the internal (permuted) order
+        # and bring the movement back to the original order of the sequences
+        if self.node_ordering.is_active():
+
+            # Translate the edges only when the permutation changes
+            if self.node_ordering.refresh(self.coordinates, self.connected_edges):
+                self.permuted_connected_edges, self.permuted_attraction_values = \
+                    self.node_ordering.permute_edges(self.connected_edges, self.attraction_values)
+
+            movement = self.calculate_pair_forces(self.node_ordering.permute_array(self.coordinates),
+                                                  self.permuted_connected_edges, self.permuted_attraction_values,
+                                                  self.node_ordering.permute_array(cfg.sequences_array['in_subset']),
+                                                  is_subset_mode)
+            movement = self.node_ordering.restore_array(movement)
+
+        else:
+            movement = self.calculate_pair_forces(self.coordinates, self.connected_edges, self.attraction_values,
+                                                  cfg.sequences_array['in_subset'], is_subset_mode)
         # print("movement:" + str(movement))
 
         # Add the 'gravity' movement towards the origin
@@ -37,10 +37,11 @@ def calc_moves_per_seq(pair_moves):
 
 
 @numba.njit(parallel=True)
-def calculate_pair_forces(coor, attraction_values, connected_sequences, movement, n_dims, att_val, att_exp, rep_val, rep_exp):
+def calculate_pair_forces(coor, edges, att_values, att_scale, movement, n_dims, att_val, att_exp, rep_val, rep_exp):
     n_sequences = coor.shape[0]
     dist_array = np.zeros(n_dims)
 
+    # Calculate the pairwise repulsive forces between all the sequences
     for i in range(n_sequences-1):
         for j in range(i+1, n_sequences):
             euclidean_dist = 0
@@ -54,13 +55,8 @@ def calculate_pair_forces(coor, attraction_values, connected_sequences, movement
             else:
                 euclidean_dist = sqrt_num(euclidean_dist)
 
-            # Calculate the pairwise repulsive forces between all the sequences
             rep_force = calc_rep_force(rep_val, euclidean_dist, rep_exp)
 
-            # Calculate the pairwise attractive forces between the connected sequences only
-            if connected_sequences[i][j] == 1:
-                att_force = calc_att_force(attraction_values[i][j], att_val, euclidean_dist, att_exp)
-
             for dim in range(n_dims):
                 # Calculate the pairwise movement, resulted from the repulsive force, in each dimension separately
                 rep_movement = calc_pair_move(dist_array[dim], euclidean_dist, rep_force)
@@ -69,21 +65,48 @@ def calculate_pair_forces(coor, attraction_values, connected_sequences, movement
                 movement[i][dim] += rep_movement
                 movement[j][dim] -= rep_movement
 
-                if connected_sequences[i][j] == 1:
-                    # Calculate the pairwise movement, resulted from the attractive force, in each dimension separately
-                    att_movement = calc_pair_move(dist_array[dim], euclidean_dist, att_force)
+    # Calculate the pairwise attractive forces between the connected sequences only (the edges)
+    calculate_attractive_forces(coor, edges, att_values, att_scale, movement, n_dims, att_val, att_exp)
+
+
+# Calculate the pairwise attractive forces between the connected sequences (the edges).
+# The attraction values are quantized and are divided by att_scale to get values between 0 and 1.
+# Releases the GIL, so the streamed edges (edge_stream.py) can be read ahead while it runs.
+@numba.njit(nogil=True)
+def calculate_attractive_forces(coor, edges, att_values, att_scale, movement, n_dims, att_val, att_exp):
+    dist_array = np.zeros(n_dims)
+
+    for e in range(edges.shape[0]):
+        i = edges[e][0]
+        j = edges[e][1]
+        euclidean_dist = 0
+
+        for dim in range(n_dims):
+            dist_array[dim] = coor[i][dim] - coor[j][dim]
+            euclidean_dist += square_num(dist_array[dim])
+        if euclidean_dist == 0:
+            euclidean_dist = 0.000001
+        else:
+            euclidean_dist = sqrt_num(euclidean_dist)
+
+        att_force = calc_att_force(att_values[e] / att_scale, att_val, euclidean_dist, att_exp)
+
+        for dim in range(n_dims):
+            # Calculate the pairwise movement, resulted from the attractive force, in each dimension separately
+            att_movement = calc_pair_move(dist_array[dim], euclidean_dist, att_force)
 
-                    # add the attractive movement to both sequences in opposite directions (towards each other)
-                    movement[i][dim] -= att_movement
-                    movement[j][dim] += att_movement
+            # add the attractive movement to both sequences in opposite directions (towards each other)
+            movement[i][dim] -= att_movement
+            movement[j][dim] += att_movement
 
 
 @numba.njit(parallel=True)
-def calculate_pair_forces_subset(coor, attraction_values, connected_sequences, movement, n_dims, att_val, att_exp,
+def calculate_pair_forces_subset(coor, edges, att_values, att_scale, movement, n_dims, att_val, att_exp,
                                  rep_val, rep_exp, in_subset):
     n_sequences = coor.shape[0]
     dist_array = np.zeros(n_dims)
 
+    # Calculate the pairwise repulsive forces between all the sequences in the subset
     for i in range(n_sequences-1):
 
         # Ignore sequences which are not included in the subset
@@ -107,13 +130,8 @@ def calculate_pair_forces_subset(coor, attraction_values, connected_sequences, m
             else:
                 euclidean_dist = sqrt_num(euclidean_dist)
 
-            # Calculate the pairwise repulsive forces between all the sequences
             rep_force = calc_rep_force(rep_val, euclidean_dist, rep_exp)
 
-            # Calculate the pairwise attractive forces between the connected sequences only
-            if connected_sequences[i][j] == 1:
-                att_force = calc_att_force(attraction_values[i][j], att_val, euclidean_dist, att_exp)
-
             for dim in range(n_dims):
                 # Calculate the pairwise movement, resulted from the repulsive force, in each dimension separately
                 rep_movement = calc_pair_move(dist_array[dim], euclidean_dist, rep_force)
@@ -122,13 +140,34 @@ def calculate_pair_forces_subset(coor, attraction_values, connected_sequences, m
                 movement[i][dim] += rep_movement
                 movement[j][dim] -= rep_movement
 
-                if connected_sequences[i][j] == 1:
-                    # Calculate the pairwise movement, resulted from the attractive force, in each dimension separately
-                    att_movement = calc_pair_move(dist_array[dim], euclidean_dist, att_force)
+    # Calculate the pairwise attractive forces between the connected sequences in the subset
+    for e in range(edges.shape[0]):
+        i = edges[e][0]
+        j = edges[e][1]
+
+        # Ignore pairs which are not included in the subset
+        if not in_subset[i] or not in_subset[j]:
+            continue
+
+        euclidean_dist = 0
+
+        for dim in range(n_dims):
+            dist_array[dim] = coor[i][dim] - coor[j][dim]
+            euclidean_dist += square_num(dist_array[dim])
+        if euclidean_dist == 0:
+            euclidean_dist = 0.000001
+        else:
+            euclidean_dist = sqrt_num(euclidean_dist)
+
+        att_force = calc_att_force(att_values[e] / att_scale, att_val, euclidean_dist, att_exp)
+
+        for dim in range(n_dims):
+            # Calculate the pairwise movement, resulted from the attractive force, in each dimension separately
+            att_movement = calc_pair_move(dist_array[dim], euclidean_dist, att_force)
 
-                    # add the attractive movement to both sequences in opposite directions (towards each other)
-                    movement[i][dim] -= att_movement
-                    movement[j][dim] += att_movement
+            # add the attractive movement to both sequences in opposite directions (towards each other)
+            movement[i][dim] -= att_movement
+            movement[j][dim] += att_movement
 
 
 @numba.guvectorize([(numba.float64[:, :], numba.int64, numba.float64, numba.float64, numba.float64, numba.float64[:, :])],
@@ -0,0 +1,168 @@
+import time
+import numpy as np
+import numba
+import clans.config as cfg
+import clans.data.sequence_pairs as sp
+import clans.layouts.node_ordering as no
+import clans.layouts.fruchterman_reingold_class as fr_class
+
+
+# Breadth-first search from the given source, updating the minimal graph distance of each sequence to any landmark
+@numba.njit
+def update_min_distances(indptr, indices, source, min_dist, queue, dist):
+    dist[:] = -1
+    dist[source] = 0
+    queue[0] = source
+    head = 0
+    tail = 1
+
+    while head < tail:
+        current = queue[head]
+        head += 1
+        if dist[current] < min_dist[current]:
+            min_dist[current] = dist[current]
+
+        # Don't expand sequences which are already at least as close to another landmark
+        if dist[current] > min_dist[current]:
+            continue
+
+        for k in range(indptr[current], indptr[current + 1]):
+            neighbour = indices[k]
+            if dist[neighbour] == -1:
+                dist[neighbour] = dist[current] + 1
+                queue[tail] = neighbour
+                tail += 1
+
+
+# Max-min sampling over the graph distance: each new landmark is the sequence farthest from all the previous ones.
+# Sequences in components that contain no landmark yet are the farthest (infinite distance), so every component
+# gets a landmark before any component gets a second one.
+def select_landmarks(indptr, indices, landmarks_num, seq_num):
+    landmarks_num = min(landmarks_num, seq_num)
+    unreached = np.iinfo(np.int64).max
+    min_dist = np.full(seq_num, unreached, dtype=np.int64)
+    queue = np.empty(seq_num, dtype=np.int64)
+    dist = np.empty(seq_num, dtype=np.int64)
+    landmarks = np.empty(landmarks_num, dtype=np.int64)
+
+    # Start from the sequence with the highest number of connections
+    degrees = indptr[1:] - indptr[:-1]
+    landmark = np.argmax(degrees)
+
+    for i in range(landmarks_num):
+        landmarks[i] = landmark
+        update_min_distances(indptr, indices, landmark, min_dist, queue, dist)
+        min_dist[landmark] = -1
+        landmark = np.argmax(min_dist)
+
+    return np.sort(landmarks)
+
+
+# Place every sequence which is not placed yet at the weighted average position of its placed neighbours.
+# Repeat the passes until no more sequences can be placed. Returns the number of placed sequences.
+@numba.njit
+def interpolate_positions(indptr, indices, weights, coordinates, is_placed):
+    seq_num = coordinates.shape[0]
+    n_dims = coordinates.shape[1]
+    new_coor = np.zeros(n_dims)
+    newly_placed = np.zeros(seq_num, dtype=numba.boolean)
+    placed_num = 0
+
+    while True:
+        placed_in_pass = 0
+
+        for i in range(seq_num):
+            if is_placed[i]:
+                continue
+
+            weights_sum = 0.0
+            for dim in range(n_dims):
+                new_coor[dim] = 0.0
+
+            for k in range(indptr[i], indptr[i + 1]):
+                neighbour = indices[k]
+                if is_placed[neighbour]:
+                    # Sequences connected only by zero attraction still count, with a minimal weight
+                    weight = max(weights[k], 1e-6)
+                    weights_sum += weight
+                    for dim in range(n_dims):
+                        new_coor[dim] += weight * coordinates[neighbour][dim]
+
+            if weights_sum > 0:
+                for dim in range(n_dims):
+                    coordinates[i][dim] = new_coor[dim] / weights_sum
+                newly_placed[i] = True
+                placed_in_pass += 1
+
+        if placed_in_pass == 0:
+            break
+
+        # The sequences placed in this pass serve as anchors only in the next one
+        for i in range(seq_num):
+            if newly_placed[i]:
+                is_placed[i] = True
+                newly_placed[i] = False
+        placed_num += placed_in_pass
+
+    return placed_num
+
+
+# Calculate an approximate layout for large datasets:
+# 1. Select a well-spread sample of landmark sequences (max-min sampling over the graph distance).
+# 2. Run the FR layout on the subgraph induced by the landmarks.
+# 3. Place the rest of the sequences by weighted interpolation from their connected (placed) neighbours.
+# Returns the coordinates array of all the sequences (in the original order).
+def calculate_landmark_layout(coordinates, landmarks_num, rounds_num):
+    seq_num = coordinates.shape[0]
+    n_dims = coordinates.shape[1]
+
+    connected_edges, att_values = sp.get_connected_edges()
+    indptr, indices, edge_ids = no.adjacency_from_edges(connected_edges, seq_num)
+    weights = sp.dequantize_att_values(att_values)[edge_ids]
+
+    before = time.time()
+    landmarks = select_landmarks(indptr, indices, landmarks_num, seq_num)
+    if cfg.run_params['is_debug_mode']:
+        print("Selecting " + str(landmarks.shape[0]) + " landmarks took " + str(time.time() - before) + " seconds")
+
+    # Build the subgraph induced by the landmarks (with the landmark indices)
+    landmark_index = np.full(seq_num, -1, dtype=np.int64)
+    landmark_index[landmarks] = np.arange(landmarks.shape[0])
+    is_induced = (landmark_index[connected_edges[:, 0]] >= 0) & (landmark_index[connected_edges[:, 1]] >= 0)
+    induced_edges = landmark_index[connected_edges[is_induced]].astype(np.int32)
+
+    # Run the FR layout on the landmarks only
+    before = time.time()
+    landmarks_coor = coordinates[landmarks]
+    if n_dims == 3:
+        fr_object = fr_class.FruchtermanReingold(landmarks_coor[:, 0], landmarks_coor[:, 1], landmarks_coor[:, 2])
+    else:
+        fr_object = fr_class.FruchtermanReingold(landmarks_coor[:, 0], landmarks_coor[:, 1], None)
+    fr_object.set_connections(induced_edges, att_values[is_induced])
+
+    for i in range(rounds_num):
+        fr_object.calculate_new_positions(False)
+    if cfg.run_params['is_debug_mode']:
+        print("The layout of the landmarks (" + str(rounds_num) + " rounds) took " + str(time.time() - before)
+              + " seconds")
+
+    # Place the rest of the sequences around the landmarks
+    before = time.time()
+    coordinates = coordinates.astype(np.float64)
+    coordinates[landmarks] = fr_object.coordinates
+    is_placed = np.zeros(seq_num, dtype=bool)
+    is_placed[landmarks] = True
+    interpolate_positions(indptr, indices, weights, coordinates, is_placed)
+
+    # Add a small jitter, so that sequences interpolated from the same landmarks don't overlap.
+    # Sequences which have no connections at all keep their original positions.
+    spread = np.std(fr_object.coordinates, axis=0).mean() if landmarks.shape[0] > 1 else 1.0
+    is_interpolated = is_placed.copy()
+    is_interpolated[landmarks] = False
+    coordinates[is_interpolated] += np.random.uniform(-1, 1, (np.count_nonzero(is_interpolated), n_dims)) \
+        * spread * 0.01
+    if cfg.run_params['is_debug_mode']:
+        print("Interpolating the positions of " + str(np.count_nonzero(is_interpolated)) + " sequences took "
+              + str(time.time() - before) + " seconds")
+
+    return coordinates
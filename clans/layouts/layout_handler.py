@@ -1,11 +1,20 @@
 import time
+import numpy as np
 import clans.config as cfg
 import clans.data.sequences as seq
 import clans.layouts.fruchterman_reingold as fr
+import clans.layouts.landmark_layout as ll
+import clans.layouts.sharded_layout as sl
 
 
 def calculate_layout(layout):
-    if layout == "FR":
+    if layout == "FR" and cfg.run_params['landmarks_num'] > 0:
+        calculate_landmark_layout()
+
+    elif layout == "FR" and cfg.run_params['shards_num'] > 0:
+        calculate_sharded_layout()
+
+    elif layout == "FR":
         fr.init_variables()
         # If pre-defined number of rounds, perform this number of iterations
         if cfg.run_params['num_of_rounds'] > 0:
@@ -47,3 +56,60 @@ def calculate_layout(layout):
 
         # In the end of the clustering cycles, update the new coordinates in the main sequences_array
         seq.update_positions(fr.coordinates.T, 'full')
+
+
+# Lay out a sample of landmark sequences, interpolate the positions of the rest and optionally refine the whole layout
+def calculate_landmark_layout():
+    before = time.time()
+
+    if cfg.run_params['dimensions_num_for_clustering'] == 2:
+        coordinates = np.column_stack((cfg.sequences_array['x_coor'], cfg.sequences_array['y_coor']))
+    else:
+        coordinates = np.column_stack(
+            (cfg.sequences_array['x_coor'], cfg.sequences_array['y_coor'], cfg.sequences_array['z_coor']))
+
+    coordinates = ll.calculate_landmark_layout(coordinates, cfg.run_params['landmarks_num'],
+                                               cfg.run_params['num_of_rounds'])
+    seq.update_positions(coordinates.T, 'full')
+
+    after = time.time()
+    duration = after - before
+    print("The landmark layout (" + str(cfg.run_params['landmarks_num']) + " landmarks) took " + str(duration)
+          + " seconds")
+
+    # Refine the interpolated layout with a few rounds of the full calculation
+    if cfg.run_params['landmark_refine_rounds'] > 0:
+        fr.init_variables()
+        for i in range(cfg.run_params['landmark_refine_rounds']):
+            fr.calculate_new_positions()
+        seq.update_positions(fr.coordinates.T, 'full')
+
+    cfg.run_params['rounds_done'] = cfg.run_params['num_of_rounds'] + cfg.run_params['landmark_refine_rounds']
+
+
+# Run the FR layout sharded between several worker processes (local or remote)
+def calculate_sharded_layout():
+    before = time.time()
+
+    if cfg.run_params['dimensions_num_for_clustering'] == 2:
+        coordinates = np.column_stack((cfg.sequences_array['x_coor'], cfg.sequences_array['y_coor']))
+    else:
+        coordinates = np.column_stack(
+            (cfg.sequences_array['x_coor'], cfg.sequences_array['y_coor'], cfg.sequences_array['z_coor']))
+
+    is_remote = cfg.run_params['is_shard_remote']
+    address = sl.parse_address(cfg.run_params['shard_address'])
+    try:
+        coordinates, rounds_done = sl.calculate_sharded_layout(coordinates, cfg.run_params['num_of_rounds'],
+                                                               cfg.run_params['shards_num'], address,
+                                                               sl.get_authkey(is_remote), is_remote)
+    except sl.ShardError as error:
+        cfg.run_params['is_problem'] = True
+        cfg.run_params['error'] = "The sharded layout failed: " + str(error)
+        return
+    seq.update_positions(coordinates.T, 'full')
+    cfg.run_params['rounds_done'] = rounds_done
+
+    after = time.time()
+    duration = after - before
+    print("The sharded layout (" + str(cfg.run_params['shards_num']) + " shards) took " + str(duration) + " seconds")
@@ -0,0 +1,169 @@
+import numpy as np
+import numba
+import clans.config as cfg
+
+
+# Build a CSR adjacency structure (indptr, indices) from the non-redundant array of connected pairs (edges).
+# Also returns, for each adjacency entry, the index of its edge in the given edges array.
+def adjacency_from_edges(edges, seq_num):
+    edge_ids = np.arange(edges.shape[0], dtype=np.int64)
+
+    # Ignore self-connections
+    not_self = edges[:, 0] != edges[:, 1]
+    edges = edges[not_self]
+    edge_ids = edge_ids[not_self]
+
+    # Each edge is added in both directions
+    rows = np.concatenate((edges[:, 0], edges[:, 1])).astype(np.int64)
+    cols = np.concatenate((edges[:, 1], edges[:, 0])).astype(np.int64)
+    edge_ids = np.concatenate((edge_ids, edge_ids))
+    order = np.argsort(rows, kind='mergesort')
+
+    indptr = np.zeros(seq_num + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=seq_num), out=indptr[1:])
+
+    return indptr, cols[order], edge_ids[order]
+
+
+# Reverse Cuthill-McKee ordering of a graph given in CSR format.
+# Returns the permutation array: permutation[new_index] = original_index
+@numba.njit
+def reverse_cuthill_mckee(indptr, indices):
+    seq_num = indptr.shape[0] - 1
+    degrees = indptr[1:] - indptr[:-1]
+    visited = np.zeros(seq_num, dtype=numba.boolean)
+    order = np.empty(seq_num, dtype=np.int64)
+
+    # Start each connected component from its vertex with the lowest degree
+    by_degree = np.argsort(degrees, kind='mergesort')
+
+    head = 0
+    tail = 0
+    for start_index in range(seq_num):
+        start = by_degree[start_index]
+        if visited[start]:
+            continue
+
+        visited[start] = True
+        order[tail] = start
+        tail += 1
+
+        # Breadth-first search, adding the unvisited neighbours of each vertex by increasing degree
+        while head < tail:
+            current = order[head]
+            head += 1
+
+            first_new = tail
+            for k in range(indptr[current], indptr[current + 1]):
+                neighbour = indices[k]
+                if not visited[neighbour]:
+                    visited[neighbour] = True
+                    order[tail] = neighbour
+                    tail += 1
+
+            # Insertion sort of the newly added neighbours according to their degree (the lists are short)
+            for k in range(first_new + 1, tail):
+                value = order[k]
+                m = k - 1
+                while m >= first_new and degrees[order[m]] > degrees[value]:
+                    order[m + 1] = order[m]
+                    m -= 1
+                order[m + 1] = value
+
+    return order[::-1].copy()
+
+
+# Spread the lowest 'bits_num' bits of each value so that there are (dims_num - 1) zero-bits between them
+def spread_bits(values, bits_num, dims_num):
+    spread = np.zeros(values.shape[0], dtype=np.uint64)
+    for bit in range(bits_num):
+        spread |= ((values >> np.uint64(bit)) & np.uint64(1)) << np.uint64(bit * dims_num)
+    return spread
+
+
+# Morton (Z-order) space-filling curve ordering of the given coordinates.
+# Returns the permutation array: permutation[new_index] = original_index
+def morton_order(coordinates):
+    dims_num = coordinates.shape[1]
+    bits_num = 63 // dims_num
+
+    # Quantize each dimension to 'bits_num' bits over the bounding box of the coordinates
+    min_coor = coordinates.min(axis=0)
+    extent = coordinates.max(axis=0) - min_coor
+    extent[extent == 0] = 1.0
+    max_cell = (1 << bits_num) - 1
+    cells = ((coordinates - min_coor) / extent * max_cell).astype(np.uint64)
+
+    # Interleave the bits of all the dimensions into one key per sequence
+    keys = np.zeros(coordinates.shape[0], dtype=np.uint64)
+    for dim in range(dims_num):
+        keys |= spread_bits(cells[:, dim], bits_num, dims_num) << np.uint64(dim)
+
+    return np.argsort(keys, kind='mergesort')
+
+
+# Holds the internal order in which the layout kernels visit the sequences.
+# 'permutation[new_index] = original_index' and 'inverse[original_index] = new_index'.
+# The order is transparent to the rest of the program - the coordinates are always kept in the original order.
+class NodeOrdering:
+
+    def __init__(self, method, refresh_interval):
+        self.method = method
+        self.refresh_interval = refresh_interval
+        self.permutation = None
+        self.inverse = None
+        self.rounds_since_refresh = 0
+
+    def is_active(self):
+        return self.method != 'none'
+
+    # Calculate a new permutation if there is none or if 'refresh_interval' rounds have passed since the last one.
+    # Returns True if the permutation has changed.
+    def refresh(self, coordinates, edges):
+        if not self.is_active():
+            return False
+
+        if self.permutation is not None:
+            self.rounds_since_refresh += 1
+
+            # RCM depends only on the connections, which do not change between rounds
+            if self.method == 'rcm' or self.refresh_interval <= 0 or \
+                    self.rounds_since_refresh < self.refresh_interval:
+                return False
+
+        if self.method == 'rcm':
+            indptr, indices, edge_ids = adjacency_from_edges(edges, coordinates.shape[0])
+            self.permutation = reverse_cuthill_mckee(indptr, indices)
+        else:
+            self.permutation = morton_order(coordinates)
+
+        self.inverse = np.empty_like(self.permutation)
+        self.inverse[self.permutation] = np.arange(self.permutation.shape[0])
+        self.rounds_since_refresh = 0
+
+        if cfg.run_params['is_debug_mode']:
+            print("Recalculated the '" + self.method + "' order of the sequences for the layout calculation")
+
+        return True
+
+    # Force a new permutation in the next refresh (e.g. after the connections or coordinates were reset)
+    def reset(self):
+        self.permutation = None
+        self.inverse = None
+        self.rounds_since_refresh = 0
+
+    # Reorder the rows of an array according to the permutation
+    def permute_array(self, array):
+        return array[self.permutation]
+
+    # Translate the edges to the permuted indices and sort them by their first sequence,
+    # so that the attraction kernel goes over the coordinates array sequentially
+    def permute_edges(self, edges, att_values):
+        permuted_edges = self.inverse[edges].astype(np.int32)
+        permuted_edges.sort(axis=1)
+        order = np.lexsort((permuted_edges[:, 1], permuted_edges[:, 0]))
+        return permuted_edges[order], att_values[order]
+
+    # Bring an array calculated in the permuted order back to the original order of the sequences
+    def restore_array(self, permuted_array):
+        return permuted_array[self.inverse]
@@ -0,0 +1,461 @@
+import os
+import sys
+import time
+import queue
+import socket
+import secrets
+import threading
+import subprocess
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, wait
+import numpy as np
+import numba
+import clans.config as cfg
+import clans.data.sequence_pairs as sp
+import clans.layouts.node_ordering as no
+import clans.layouts.fruchterman_reingold_numba as frn
+
+# A sharded FR layout: the sequences are partitioned between worker processes, each owning the coordinates of its
+# shard and the connections (edges) of its sequences. In every round, a coordinator process sends each worker the
+# current coordinates of the remote sequences connected to its own ones ('ghosts') and a coarse summary of all the
+# other shards (the centroids and sizes of the occupied grid cells). The workers calculate the exact repulsion within
+# their shard, the far-field repulsion from the other shards' cells and the attraction along their edges, move their
+# sequences and report back their boundary coordinates and a new summary.
+#
+# The messages are (command, data) tuples sent over multiprocessing connections (authenticated sockets), so the
+# workers can run locally or on other hosts (see clans_worker.py).
+# The coordinator never blocks on the workers without a timeout: it waits for their connections and their responses
+# in short intervals, checking in between that the local workers are still running. If a worker exits, disconnects or
+# doesn't respond in time, ShardError is raised and all the workers are stopped.
+
+worker_script_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  'clans_worker.py')
+connect_attempts_num = 60
+
+# The time (in seconds) to wait for all the workers to connect, for the responses of a round and for the local
+# workers to exit after they are stopped, and the interval of checking that the local workers are still running
+connect_timeout = 600
+response_timeout = 3600
+stop_timeout = 10
+poll_interval = 1.0
+
+
+class ShardError(Exception):
+    pass
+
+
+# Repulsion from the sequences of the other shards, represented by the centroids of their grid cells
+@numba.njit
+def calculate_far_field_forces(coor, centroids, counts, movement, n_dims, rep_val, rep_exp):
+    dist_array = np.zeros(n_dims)
+
+    for i in range(coor.shape[0]):
+        for c in range(centroids.shape[0]):
+            euclidean_dist = 0
+            for dim in range(n_dims):
+                dist_array[dim] = coor[i][dim] - centroids[c][dim]
+                euclidean_dist += frn.square_num(dist_array[dim])
+            if euclidean_dist == 0:
+                euclidean_dist = 0.000001
+            else:
+                euclidean_dist = frn.sqrt_num(euclidean_dist)
+
+            # All the sequences in the cell repel as if they were in the centroid
+            rep_force = counts[c] * frn.calc_rep_force(rep_val, euclidean_dist, rep_exp)
+            for dim in range(n_dims):
+                movement[i][dim] += frn.calc_pair_move(dist_array[dim], euclidean_dist, rep_force)
+
+
+# Same as frn.calculate_total_sequence_movement, but normalizing by the total number of sequences in all the shards
+@numba.njit
+def calculate_total_shard_movement(last_movement, n_dims, dampening, maxmove, current_temp, total_seq_num, movement):
+    for i in range(movement.shape[0]):
+        xyz_movement = 0
+
+        for dim in range(n_dims):
+            movement[i][dim] += last_movement[i][dim] * (1 - dampening)
+            movement[i][dim] *= current_temp
+            movement[i][dim] /= total_seq_num
+            xyz_movement += frn.square_num(movement[i][dim])
+
+        if xyz_movement == 0:
+            xyz_movement = 0.000001
+        else:
+            xyz_movement = frn.sqrt_num(xyz_movement)
+
+        if xyz_movement > maxmove:
+            limit_movement_factor = maxmove / xyz_movement
+            for dim in range(n_dims):
+                movement[i][dim] *= limit_movement_factor
+
+
+# Summarize coordinates as the centroids and sizes of the occupied cells of a grid over the given bounding box
+def summarize_cells(coordinates, bbox_min, bbox_max, cells_per_dim):
+    n_dims = coordinates.shape[1]
+    if coordinates.shape[0] == 0:
+        return np.empty((0, n_dims)), np.empty(0)
+
+    extent = bbox_max - bbox_min
+    extent[extent == 0] = 1.0
+    cells = np.clip(((coordinates - bbox_min) / extent * cells_per_dim).astype(np.int64), 0, cells_per_dim - 1)
+    cell_ids = np.zeros(coordinates.shape[0], dtype=np.int64)
+    for dim in range(n_dims):
+        cell_ids = cell_ids * cells_per_dim + cells[:, dim]
+
+    unique_ids, inverse, counts = np.unique(cell_ids, return_inverse=True, return_counts=True)
+    centroids = np.zeros((unique_ids.shape[0], n_dims))
+    for dim in range(n_dims):
+        centroids[:, dim] = np.bincount(inverse, weights=coordinates[:, dim]) / counts
+
+    return centroids, counts.astype(np.float64)
+
+
+# The state and calculation of one shard (runs in a worker process)
+class ShardWorker:
+
+    def __init__(self, data):
+        self.coordinates = data['coordinates']
+        self.edges = data['edges']  # local indices: own sequences first, then the ghosts
+        self.att_values = data['att_values']
+        self.export_indices = data['export_indices']  # local indices of the own sequences needed by other shards
+        self.params = data['params']
+        self.own_num = self.coordinates.shape[0]
+        self.ghosts_num = data['ghosts_num']
+        self.dim_num = self.coordinates.shape[1]
+        self.last_movement = np.zeros((self.own_num, self.dim_num))
+        self.no_edges = np.empty((0, 2), dtype=np.int32)
+        self.no_att_values = np.empty(0, dtype=np.uint16)
+
+    def report(self, bbox_min, bbox_max):
+        centroids, counts = summarize_cells(self.coordinates, bbox_min, bbox_max, self.params['cells_per_dim'])
+        return {'export_coordinates': self.coordinates[self.export_indices],
+                'centroids': centroids, 'counts': counts,
+                'bbox_min': self.coordinates.min(axis=0) if self.own_num > 0 else None,
+                'bbox_max': self.coordinates.max(axis=0) if self.own_num > 0 else None}
+
+    def calculate_new_positions(self, ghost_coordinates, centroids, counts, current_temp):
+        params = self.params
+        all_coordinates = np.concatenate((self.coordinates, ghost_coordinates))
+        movement = np.zeros((self.own_num + self.ghosts_num, self.dim_num))
+
+        # Exact repulsion within the shard and far-field repulsion from the other shards
+        frn.calculate_pair_forces(self.coordinates, self.no_edges, self.no_att_values, cfg.att_quantization_scale,
+                                  movement, self.dim_num, params['att_val'], params['att_exp'], params['rep_val'],
+                                  params['rep_exp'])
+        calculate_far_field_forces(self.coordinates, centroids, counts, movement, self.dim_num, params['rep_val'],
+                                   params['rep_exp'])
+
+        # Attraction along the edges of the own sequences (the movement of the ghosts is calculated by their owners)
+        frn.calculate_attractive_forces(all_coordinates, self.edges, self.att_values, cfg.att_quantization_scale,
+                                        movement, self.dim_num, params['att_val'], params['att_exp'])
+
+        movement = movement[:self.own_num]
+        movement -= self.coordinates * params['gravity']
+        calculate_total_shard_movement(self.last_movement, self.dim_num, params['dampening'], params['maxmove'],
+                                       current_temp, params['total_seq_num'], movement)
+
+        self.coordinates += movement
+        self.last_movement = movement.copy()
+
+
+# The main loop of a worker process: connect to the coordinator and follow its commands
+def run_worker(address, authkey):
+
+    # The worker may be started before the coordinator listens - keep trying for a while
+    for attempt in range(connect_attempts_num):
+        try:
+            connection = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if attempt == connect_attempts_num - 1:
+                raise
+            time.sleep(1)
+    worker = None
+
+    while True:
+        # The coordinator is gone (it failed or stopped the workers after an error)
+        try:
+            command, data = connection.recv()
+        except EOFError:
+            break
+
+        if command == 'init':
+            worker = ShardWorker(data)
+            connection.send(('ready', worker.report(data['bbox_min'], data['bbox_max'])))
+        elif command == 'iterate':
+            worker.calculate_new_positions(data['ghost_coordinates'], data['centroids'], data['counts'],
+                                           data['current_temp'])
+            connection.send(('done', worker.report(data['bbox_min'], data['bbox_max'])))
+        elif command == 'collect':
+            connection.send(('coordinates', worker.coordinates))
+        elif command == 'stop':
+            connection.close()
+            break
+
+
+# Partition the sequences and the edges between the shards.
+# The sequences are ordered first (for locality), so that contiguous ranges make coherent shards.
+def partition(coordinates, edges, att_values, shards_num):
+    seq_num = coordinates.shape[0]
+    method = cfg.run_params['node_ordering'] if cfg.run_params['node_ordering'] != 'none' else 'rcm'
+    ordering = no.NodeOrdering(method, 0)
+    ordering.refresh(coordinates, edges)
+
+    shard_of = np.empty(seq_num, dtype=np.int64)
+    local_index = np.empty(seq_num, dtype=np.int64)
+    shards = []
+    for shard_id, members in enumerate(np.array_split(ordering.permutation, shards_num)):
+        members = np.sort(members)
+        shard_of[members] = shard_id
+        local_index[members] = np.arange(members.shape[0])
+        shards.append({'members': members})
+
+    for shard_id, shard in enumerate(shards):
+        # The edges incident to the shard's sequences (edges between two shards are assigned to both)
+        is_own = (shard_of[edges[:, 0]] == shard_id) | (shard_of[edges[:, 1]] == shard_id)
+        shard_edges = edges[is_own]
+
+        # The remote endpoints become ghosts, numbered after the own sequences
+        remote = np.unique(shard_edges[shard_of[shard_edges] != shard_id])
+        ghost_index = np.full(seq_num, -1, dtype=np.int64)
+        ghost_index[remote] = shard['members'].shape[0] + np.arange(remote.shape[0])
+        local_edges = np.where(shard_of[shard_edges] == shard_id, local_index[shard_edges], ghost_index[shard_edges])
+
+        shard['ghosts'] = remote
+        shard['edges'] = local_edges.astype(np.int32)
+        shard['att_values'] = att_values[is_own]
+
+    # The sequences of each shard which are ghosts in other shards (their coordinates are exchanged every round)
+    for shard_id, shard in enumerate(shards):
+        needed = np.zeros(seq_num, dtype=bool)
+        for other_id, other in enumerate(shards):
+            if other_id != shard_id:
+                needed[other['ghosts']] = True
+        shard['exports'] = shard['members'][needed[shard['members']]]
+        shard['export_indices'] = local_index[shard['exports']]
+
+    return shards
+
+
+# Parse a 'host:port' address string
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+# Run the FR layout, sharded between worker processes: for the given number of rounds, or (if cooling < 1) as long
+# as the temperature > 1e-5.
+# If 'is_remote' is False, the workers are started locally; otherwise the coordinator waits for 'shards_num'
+# workers to connect (started with clans_worker.py on this or other hosts, using the same address and key).
+# Returns the new coordinates array (in the original order of the sequences) and the number of rounds done.
+def calculate_sharded_layout(coordinates, rounds_num, shards_num, address, authkey, is_remote):
+    seq_num = coordinates.shape[0]
+    n_dims = coordinates.shape[1]
+    coordinates = coordinates.astype(np.float64)
+    edges, att_values = sp.get_connected_edges()
+
+    before = time.time()
+    shards = partition(coordinates, edges, att_values, shards_num)
+    if cfg.run_params['is_debug_mode']:
+        boundary_num = sum(shard['exports'].shape[0] for shard in shards)
+        print("Partitioning into " + str(shards_num) + " shards took " + str(time.time() - before) + " seconds ("
+              + str(boundary_num) + " boundary sequences)")
+
+    params = {'total_seq_num': seq_num, 'cells_per_dim': cfg.run_params['shard_cells_per_dim'],
+              'att_val': cfg.run_params['att_val'], 'att_exp': cfg.run_params['att_exp'],
+              'rep_val': cfg.run_params['rep_val'], 'rep_exp': cfg.run_params['rep_exp'],
+              'gravity': cfg.run_params['gravity'], 'dampening': cfg.run_params['dampening'],
+              'maxmove': cfg.run_params['maxmove']}
+
+    listener = Listener(address, authkey=authkey)
+    processes = []
+    connections = []
+    is_finished = False
+    try:
+        if not is_remote:
+            # The local workers run the same script as the remote ones (forking a process with compiled numba code
+            # is not safe)
+            worker_env = dict(os.environ)
+            worker_env['CLANS_SHARD_KEY'] = authkey.decode()
+            worker_address = str(listener.address[0]) + ":" + str(listener.address[1])
+            for i in range(shards_num):
+                processes.append(subprocess.Popen([sys.executable, worker_script_path, worker_address],
+                                                  env=worker_env))
+        else:
+            print("Waiting for " + str(shards_num) + " workers to connect to " + str(listener.address[0]) + ":"
+                  + str(listener.address[1]))
+
+        accept_workers(listener, shards_num, processes, connections)
+
+        # Initialize the workers with their shards
+        bbox_min = coordinates.min(axis=0)
+        bbox_max = coordinates.max(axis=0)
+        for connection, shard in zip(connections, shards):
+            send_message(connection, ('init', {'coordinates': coordinates[shard['members']], 'edges': shard['edges'],
+                                               'att_values': shard['att_values'],
+                                               'ghosts_num': shard['ghosts'].shape[0],
+                                               'export_indices': shard['export_indices'], 'params': params,
+                                               'bbox_min': bbox_min, 'bbox_max': bbox_max}))
+        reports = receive_messages(connections, processes)
+
+        current_temp = 1.0
+        i = 0
+        while (cfg.run_params['cooling'] < 1.0 and current_temp > 1e-5) or \
+                (cfg.run_params['cooling'] >= 1.0 and i < rounds_num):
+
+            # Update the boundary coordinates and the global bounding box from the last reports
+            for shard, report in zip(shards, reports):
+                coordinates[shard['exports']] = report['export_coordinates']
+            bbox_min = np.min([report['bbox_min'] for report in reports if report['bbox_min'] is not None], axis=0)
+            bbox_max = np.max([report['bbox_max'] for report in reports if report['bbox_max'] is not None], axis=0)
+
+            for shard_id, connection in enumerate(connections):
+                other_reports = [report for other_id, report in enumerate(reports) if other_id != shard_id]
+                if len(other_reports) > 0:
+                    centroids = np.concatenate([report['centroids'] for report in other_reports])
+                    counts = np.concatenate([report['counts'] for report in other_reports])
+                else:
+                    centroids = np.empty((0, n_dims))
+                    counts = np.empty(0)
+                send_message(connection, ('iterate', {'ghost_coordinates': coordinates[shards[shard_id]['ghosts']],
+                                                      'centroids': centroids, 'counts': counts,
+                                                      'current_temp': current_temp, 'bbox_min': bbox_min,
+                                                      'bbox_max': bbox_max}))
+            reports = receive_messages(connections, processes)
+
+            current_temp *= cfg.run_params['cooling']
+            i += 1
+
+            if i % 100 == 0:
+                print("The calculation of " + str(i) + " sharded rounds took " + str(time.time() - before) + " seconds")
+
+        # Collect the final coordinates
+        for connection in connections:
+            send_message(connection, ('collect', None))
+        for shard, shard_coordinates in zip(shards, receive_messages(connections, processes)):
+            coordinates[shard['members']] = shard_coordinates
+        is_finished = True
+
+    finally:
+        stop_workers(listener, connections, processes, is_finished)
+
+    return coordinates, i
+
+
+# Accept the connections of workers_num workers (into connections), checking that the local workers are still running.
+# The connections are accepted by a thread, as accept() cannot time out.
+def accept_workers(listener, workers_num, processes, connections):
+    accepted = queue.Queue()
+    accept_thread = threading.Thread(target=accept_connections, args=(listener, workers_num, accepted), daemon=True)
+    accept_thread.start()
+
+    deadline = time.time() + connect_timeout
+    try:
+        while len(connections) < workers_num:
+            try:
+                connection = accepted.get(timeout=poll_interval)
+            except queue.Empty:
+                check_processes(processes)
+                if time.time() > deadline:
+                    raise ShardError("Only " + str(len(connections)) + " of the " + str(workers_num) +
+                                     " sharded layout workers connected within " + str(connect_timeout) + " seconds")
+                continue
+            if isinstance(connection, AuthenticationError):
+                raise ShardError("A sharded layout worker connected with a wrong key (CLANS_SHARD_KEY)")
+            if isinstance(connection, Exception):
+                raise ShardError("Cannot accept the sharded layout workers: " + str(connection))
+            connections.append(connection)
+
+    # Wake up the thread from accept() with a connection which fails the authentication
+    finally:
+        if accept_thread.is_alive():
+            try:
+                socket.create_connection(listener.address, timeout=poll_interval).close()
+            except OSError:
+                pass
+            accept_thread.join(poll_interval)
+        while not accepted.empty():
+            connection = accepted.get()
+            if not isinstance(connection, Exception):
+                connection.close()
+
+
+# Put the accepted connections in the queue, until there are connections_num of them or accept() fails (then the error
+# is put in the queue)
+def accept_connections(listener, connections_num, accepted):
+    for i in range(connections_num):
+        try:
+            accepted.put(listener.accept())
+        except (OSError, EOFError, AuthenticationError) as error:
+            accepted.put(error)
+            return
+
+
+def send_message(connection, message):
+    try:
+        connection.send(message)
+    except OSError as error:
+        raise ShardError("The connection to a sharded layout worker was lost: " + str(error))
+
+
+# Returns the data of the next message of each connection (in the order of the connections), checking that the local
+# workers are still running while waiting
+def receive_messages(connections, processes):
+    messages = [None] * len(connections)
+    waiting = list(range(len(connections)))
+    deadline = time.time() + response_timeout
+    while len(waiting) > 0:
+        ready = wait([connections[index] for index in waiting], timeout=poll_interval)
+        for index in [index for index in waiting if connections[index] in ready]:
+            try:
+                messages[index] = connections[index].recv()[1]
+            except (EOFError, OSError):
+                raise ShardError("The connection to sharded layout worker " + str(index) + " was lost")
+            waiting.remove(index)
+        if len(ready) == 0:
+            check_processes(processes)
+            if time.time() > deadline:
+                raise ShardError(str(len(waiting)) + " sharded layout workers didn't respond within " +
+                                 str(response_timeout) + " seconds")
+    return messages
+
+
+def check_processes(processes):
+    for index, process in enumerate(processes):
+        if process.poll() is not None:
+            raise ShardError("Sharded layout worker " + str(index) + " exited unexpectedly (exit code " +
+                             str(process.returncode) + ")")
+
+
+# Stop the workers and close the connections and the listener. After a failure (is_finished is False), the local
+# workers are terminated right away.
+def stop_workers(listener, connections, processes, is_finished):
+    for connection in connections:
+        if is_finished:
+            try:
+                connection.send(('stop', None))
+            except OSError:
+                pass
+        connection.close()
+    listener.close()
+
+    for process in processes:
+        if is_finished:
+            try:
+                process.wait(timeout=stop_timeout)
+                continue
+            except subprocess.TimeoutExpired:
+                pass
+        process.terminate()
+        process.wait()
+
+
+# The authentication key shared by the coordinator and the workers
+def get_authkey(is_remote):
+    if 'CLANS_SHARD_KEY' in os.environ:
+        return os.environ['CLANS_SHARD_KEY'].encode()
+    if is_remote:
+        key = secrets.token_hex(16)
+        print("Start the workers with the environment variable CLANS_SHARD_KEY=" + key)
+        return key.encode()
+    return secrets.token_hex(16).encode()
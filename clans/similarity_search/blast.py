@@ -1,11 +1,35 @@
 import os
 import re
+import shutil
+import warnings
+import functools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
-from Bio import SeqIO
-from Bio.Blast.Applications import NcbimakeblastdbCommandline
-from Bio.Blast.Applications import NcbiblastpCommandline
 import clans.config as cfg
+import clans.data.sequences as seq
 import clans.data.sequence_pairs as sp
+import clans.io.batched_writer as bw
+import clans.io.compression as compression
+import clans.similarity_search.pairs_cache as pairs_cache
+import clans.similarity_search.prefilter as prefilter
+import clans.similarity_search.engines.search_engine as se
+import clans.similarity_search.engines.blast_engine as blast_engine
+import clans.similarity_search.engines.mmseqs_engine as mmseqs_engine
+import clans.similarity_search.engines.diamond_engine as diamond_engine
+import clans.similarity_search.engines.sw_engine as sw_engine
+
+# Each search process gets several chunks (one after the other), so the processes end at about the same time
+chunks_per_job = 4
+# With the prefilter, the chunks have at most about this number of queries: the database of a chunk holds the candidates
+# of all its queries, so it's a small part of all the sequences only if the chunk is small
+prefilter_chunk_queries = 32
+# The number of times a failed chunk is run again
+retries_num = 2
+# In the reciprocal search (of the triangular mode), the pairs with an E-value above this part of the E-value cutoff
+# are searched again in the other direction
+borderline_evalue_ratio = 1e-3
+# The interval (in seconds) between the reads of the outputs of the running chunks
+poll_interval = 1.0
 
 
 def find_HSPs():
@@ -17,136 +41,464 @@ def find_HSPs():
 
     # Set the output files names and paths
     fasta_file_name = os.path.split(cfg.run_params['input_file'])[1]  # save the file name without the full path
+    # The created files are not compressed - remove the compression extension (if there is one)
+    if compression.get_output_compression(fasta_file_name) is not None:
+        fasta_file_name = os.path.splitext(fasta_file_name)[0]
     name_parts = os.path.splitext(fasta_file_name)
     fasta_2line = blast_out_path + name_parts[0] + '_orig' + name_parts[1]
     fasta_indexed = blast_out_path + name_parts[0] + '_indexed' + name_parts[1]
     out_blast = blast_out_path + name_parts[0] + '.blast'
+    chunks_path = blast_out_path + name_parts[0] + '_chunks/'
 
-    # Create two FASTA files under the 'blast_output' directory:
+    # Create two FASTA files under the 'blast_output' directory (from the sequences that were already read):
     #  one as the original (with one-line sequence) and the other with indices as titles
-    prepare_fasta(cfg.run_params['input_file'], fasta_2line, fasta_indexed)
+    prepare_fasta(fasta_2line, fasta_indexed)
 
     # Verify that the files were indeed created
     if not os.path.isfile(fasta_2line) or os.path.getsize(fasta_2line) == 0:
         cfg.run_params['is_problem'] = True
-        cfg.run_params['error'] = "Error: creating the two-lines FASTA file " + fasta_2line + " - cannot run BLAST."
+        cfg.run_params['error'] = "Error: creating the two-lines FASTA file " + fasta_2line + " - cannot run the search."
         return
     if not os.path.isfile(fasta_indexed) or os.path.getsize(fasta_indexed) == 0:
         cfg.run_params['is_problem'] = True
-        cfg.run_params['error'] = "Error creating the indexed file " + fasta_indexed + " - cannot make BLAST DB."
+        cfg.run_params['error'] = "Error creating the indexed file " + fasta_indexed + " - cannot make the search database."
         return
 
-    # Create a BLAST database from the input FASTA file
-    make_blast_DB(fasta_indexed)
+    # Create a database (of the selected search engine) from the input FASTA file
+    engine = get_engine(cfg.run_params['search_engine'])
+    try:
+        db = engine.make_db(fasta_indexed)
+    except se.SearchError as error:
+        cfg.run_params['is_problem'] = True
+        cfg.run_params['error'] = "Error creating the " + engine.name + " database:\n" + str(error)
+        return
 
-    # Run the all-vs-all BLAST search
-    run_blast(fasta_indexed, out_blast)
+    # Run the all-vs-all search (in query chunks) and read the HSPs of each chunk while it's running
+    index1, index2, evalues = run_blast(engine, db, chunks_path, out_blast)
+    if cfg.run_params['is_problem']:
+        return
 
-    # Verify that the BLAST output file was indeed created
-    if not os.path.isfile(out_blast) or os.path.getsize(out_blast) == 0:
+    if cfg.run_params['prefilter'] and cfg.run_params['prefilter_recall']:
+        report_prefilter_recall(engine, db, chunks_path, out_blast, index1, index2)
+
+    # Verify that the search output file was indeed created (it's empty if all the sequences were found in the cache)
+    if not os.path.isfile(out_blast) or (os.path.getsize(out_blast) == 0 and cfg.run_params['blast_cache'] is None):
         cfg.run_params['is_problem'] = True
-        cfg.run_params['error'] = "Error running BLAST - cannot read output."
+        cfg.run_params['error'] = "Error running " + engine.name + " - cannot read output."
         return
 
-    # Read the list of HSPs (BLAST output) and save the lower value for each pair of sequences in the global arrays
-    # similarity_values_list and similarity_values_mtx
-    read_blast_HSPs(out_blast)
-
-    fill_values()
+    fill_values(index1, index2, evalues)
 
 
-def prepare_fasta(orig_file_path, two_line_file, indexed_file):
+# Write the loaded sequences (without gaps) in the 2-line FASTA format - once with the original titles and once with
+# the sequence indices as titles. Each file is written in large batches of records.
+def prepare_fasta(two_line_file, indexed_file):
+    titles = seq.get_titles()
+    sequences = [sequence.replace('-', '') for sequence in seq.get_sequences()]
 
     with open(two_line_file, 'w') as two_line_out:
-        with open(indexed_file, 'w') as indexed_out:
-
-            n = 0
-            for record in SeqIO.parse(orig_file_path, "fasta"):
-                # Change format in the first pass
-                record.seq = record.seq.ungap("-")
-                SeqIO.write(record, two_line_out, "fasta-2line")
-
-                # Index them in the second
-                record.id = str(n)
-                record.description = ""
-                SeqIO.write(record, indexed_out, "fasta-2line")
-                n += 1
-
-
-## Creates a BLAST database from the input fasta file
-def make_blast_DB(infile):
-    command = NcbimakeblastdbCommandline(dbtype="prot", input_file=infile)
-    stdout, stderr = command()
-
-
-def run_blast(query, out_blast):
-    # Set the parameters for the BLAST run
-    db = query
-    evalue = cfg.run_params['evalue_cutoff'] # user-defined parameter
-    matrix = cfg.run_params['scoring_matrix'] # user-defined parameter
-    outfmt = "\"6 qacc sacc evalue\""
-    max_hsps = 1
-    max_target_seqs = cfg.run_params['total_sequences_num']
-    threads_num = os.cpu_count()
-
-    # Set the gap_open and gap_extend parameters according to the scoring matrix
-    gapopen = 11
-    gapext = 1
-    if matrix == "BLOSUM80" or matrix == "PAM70":
-        gapopen = 10
-    elif matrix == "PAM30":
-        gapopen = 9
-    elif matrix == "BLOSUM45":
-        gapopen = 15
-        gapext = 2
-
-    print('Running all-against-all blastp for {} sequences...'.format(max_target_seqs))
-    command = NcbiblastpCommandline(query=query, db=db, evalue=evalue, outfmt=outfmt, out=out_blast,
-                                    num_threads=threads_num, max_target_seqs=max_target_seqs, max_hsps=max_hsps,
-                                    seg="no", gapopen=gapopen, gapextend=gapext)
-    stdout, stderr = command()
-
-
-def read_blast_HSPs(blast_out):
-
-    # Create a 2D Numpy array for the similarity values and initialize it with 100
-    cfg.similarity_values_mtx = np.full([cfg.run_params['total_sequences_num'],
-                                         cfg.run_params['total_sequences_num']], 100, dtype=float)
-    cfg.attraction_values_mtx = np.zeros([cfg.run_params['total_sequences_num'],
-                                          cfg.run_params['total_sequences_num']])
-
-    with open(blast_out) as infile:
-        for line in infile:
+        bw.write_rows(two_line_out, '>%s\n%s\n', [titles, sequences])
+
+    with open(indexed_file, 'w') as indexed_out:
+        bw.write_rows(indexed_out, '>%d\n%s\n', [np.arange(len(sequences)), sequences])
+
+
+# Returns the search engine object of the given name
+def get_engine(engine_name):
+    if engine_name == 'mmseqs':
+        return mmseqs_engine.MMseqsEngine()
+    elif engine_name == 'diamond':
+        return diamond_engine.DiamondEngine()
+    elif engine_name == 'sw':
+        return sw_engine.SmithWatermanEngine()
+    return blast_engine.BlastEngine()
+
+
+# Split the sequences into contiguous chunks (of the indexed order) with about the same number of residues.
+# Returns the boundaries of the chunks (chunks_num + 1 indices, fewer chunks if there are not enough sequences).
+def split_chunks(lengths, chunks_num):
+    residues_num = np.cumsum(lengths)
+    targets = np.arange(1, chunks_num) * (residues_num[-1] / chunks_num)
+    bounds = np.searchsorted(residues_num, targets, side='right')
+    return np.unique(np.concatenate(([0], bounds, [lengths.shape[0]])))
+
+
+# Returns the number of concurrent search processes and the number of threads of each one
+def get_jobs_num():
+    cores_num = cfg.run_params['blast_cores'] if cfg.run_params['blast_cores'] > 0 else os.cpu_count()
+    threads_num = max(1, min(cfg.run_params['blast_job_threads'], cores_num))
+    return max(1, cores_num // threads_num), threads_num
+
+
+# Search one query chunk against the databases (a list of partitions, if the engine supports it). The output is written
+# to a temporary file which is renamed when the search is completed. A failed search is repeated (up to retries_num
+# times). If dbsize is given, the E-values are calculated for a database of this length (if the engine supports it).
+# on_attempt (if given) is called with the number of each attempt before it starts writing the output.
+# Returns True if the chunk was completed.
+def run_blast_chunk(engine, query, dbs, out_chunk, threads_num, dbsize=None, on_attempt=None):
+    if not engine.is_dbsize_supported:
+        dbsize = None
+
+    for attempt in range(retries_num + 1):
+        if os.path.isfile(out_chunk + '.tmp'):
+            os.remove(out_chunk + '.tmp')
+        if on_attempt is not None:
+            on_attempt(attempt)
+        try:
+            engine.search(query, dbs, out_chunk + '.tmp', threads_num, dbsize)
+        except se.SearchError as error:
+            print("The search failed for " + os.path.basename(query) + " (attempt " + str(attempt + 1) + "): " +
+                  str(error))
+            continue
+        os.replace(out_chunk + '.tmp', out_chunk)
+        return True
+
+    return False
+
+
+# Parse rows of search output ("query subject evalue", the IDs being the sequence indices), all at once.
+# Returns the query indices, the subject indices and the E-values.
+def parse_blast_rows(data):
+    rows_num = data.count(b'\n') + (1 if len(data) > 0 and not data.endswith(b'\n') else 0)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        values = np.fromstring(data, dtype=np.float64, sep=' ')
+
+    # Unexpected rows - read the file line by line
+    if values.shape[0] != rows_num * 3:
+        rows = []
+        for line in data.decode().splitlines():
             m = re.search("^(\d+)\s+(\d+)\s+(\S+)", line.strip())
             if m:
-                index1 = int(m.group(1))
-                index2 = int(m.group(2))
-                evalue = float(m.group(3))
-
-                if index1 < index2:
-                    # Assign the Evalue to the pair + reciprocal pair
-                    if float(evalue) == 0.0:
-                        cfg.similarity_values_mtx[index1][index2] = 10 ** -180
-                        cfg.similarity_values_mtx[index2][index1] = 10 ** -180
-                    else:
-                        cfg.similarity_values_mtx[index1][index2] = evalue
-                        cfg.similarity_values_mtx[index2][index1] = evalue
+                rows.append((float(m.group(1)), float(m.group(2)), float(m.group(3))))
+        values = np.array(rows, dtype=np.float64).reshape(-1)
+
+    values = values.reshape((-1, 3))
+    return values[:, 0].astype(np.int64), values[:, 1].astype(np.int64), values[:, 2]
+
+
+def read_blast_rows(blast_out):
+    with open(blast_out, 'rb') as infile:
+        return parse_blast_rows(infile.read())
+
+
+# Returns the pairs of the rows and their E-values. A pair of two queries is reported in both directions - only the
+# direction with index1 < index2 is kept. A pair of a query and a sequence which was not searched (is_query is False)
+# is reported once - it's kept with the lower index first.
+def get_HSPs(index1, index2, evalues, is_query=None):
+    if is_query is None:
+        is_pair = index1 < index2
+        return index1[is_pair], index2[is_pair], evalues[is_pair]
+
+    is_pair = (index1 < index2) | ~is_query[index2]
+    return np.minimum(index1, index2)[is_pair], np.maximum(index1, index2)[is_pair], evalues[is_pair]
+
+
+# Follows the outputs of the chunks while the search is still writing them: the new complete rows of each output are
+# parsed (in one batch) on every read, so the HSPs are ready as soon as the search ends. Each pair (index1 < index2) is
+# reported by one row only - by the chunk of its first sequence (with one HSP per query and subject), or by the chunk
+# of its query if only some of the sequences are searched (is_query).
+# The E-values of each chunk are multiplied by its scale in evalue_scales (see run_blast()).
+# A chunk which is run again (after a failure) starts over.
+class HSPStream:
+
+    def __init__(self, chunks_num, is_query=None):
+        self.is_query = is_query
+        self.attempts = [0] * chunks_num  # the current attempt of each chunk (set by run_blast_chunk())
+        self.read_attempts = [0] * chunks_num  # the attempt that the read batches belong to
+        self.offsets = [0] * chunks_num
+        self.batches = [[] for chunk in range(chunks_num)]
+        self.evalue_scales = [1.0] * chunks_num
+        self.hsps_num = 0
+
+    def set_attempt(self, chunk, attempt):
+        self.attempts[chunk] = attempt
+
+    # Read the new complete rows of the output of the chunk (all the rows, if the chunk is completed)
+    def read(self, chunk, out_path, is_completed):
+        attempt = self.attempts[chunk]
+        if attempt != self.read_attempts[chunk]:
+            self.hsps_num -= sum([batch[0].shape[0] for batch in self.batches[chunk]])
+            self.batches[chunk] = []
+            self.offsets[chunk] = 0
+            self.read_attempts[chunk] = attempt
+
+        try:
+            with open(out_path, 'rb') as infile:
+                infile.seek(self.offsets[chunk])
+                data = infile.read()
+        except FileNotFoundError:
+            return
+        if not is_completed:
+            data = data[:data.rfind(b'\n') + 1]
+
+        # Skip the data if another attempt has started while reading it
+        if len(data) == 0 or self.attempts[chunk] != attempt:
+            return
+        index1, index2, evalues = get_HSPs(*parse_blast_rows(data), self.is_query)
+        batch = (index1, index2, evalues * self.evalue_scales[chunk])
+        self.batches[chunk].append(batch)
+        self.offsets[chunk] += len(data)
+        self.hsps_num += batch[0].shape[0]
+
+    # Returns the pairs read so far (in the order of the chunks) and their E-values
+    def get_pairs(self):
+        batches = [batch for chunk_batches in self.batches for batch in chunk_batches]
+        if len(batches) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate([batch[0] for batch in batches]), np.concatenate([batch[1] for batch in batches]), \
+            np.concatenate([batch[2] for batch in batches])
+
+
+# Search the borderline pairs (index1 < index2, with an E-value close to the E-value cutoff) in the other direction:
+# the second sequences of the pairs are searched against the whole database, and the better E-value of each pair is
+# kept. Returns the updated E-values.
+def run_reciprocal_search(engine, db, chunks_path, sequences, index1, index2, evalues, threads_num, dbsize):
+    is_borderline = evalues > cfg.run_params['evalue_cutoff'] * borderline_evalue_ratio
+    if not np.any(is_borderline):
+        return evalues
+
+    query = chunks_path + 'reciprocal.fasta'
+    out_reciprocal = chunks_path + 'reciprocal.blast'
+    query_indices = np.unique(index2[is_borderline])
+    with open(query, 'w') as query_out:
+        bw.write_rows(query_out, '>%d\n%s\n', [query_indices, [sequences[i] for i in query_indices]])
+
+    print('Searching {} borderline pairs in the other direction ({} queries)...'.format(
+        np.count_nonzero(is_borderline), query_indices.shape[0]))
+    if not run_blast_chunk(engine, query, [db], out_reciprocal, threads_num, dbsize):
+        print("The reciprocal search failed - keeping the E-values of the first direction")
+        return evalues
+
+    # Match the reverse HSPs (query = index2, subject = index1) to the borderline pairs
+    seq_num = len(sequences)
+    borderline = np.flatnonzero(is_borderline)
+    keys = index1[borderline] * seq_num + index2[borderline]
+    order = np.argsort(keys)
+    keys = keys[order]
+    queries, subjects, reverse_evalues = read_blast_rows(out_reciprocal)
+    reverse_keys = subjects * seq_num + queries
+    positions = np.minimum(np.searchsorted(keys, reverse_keys), max(keys.shape[0] - 1, 0))
+    is_match = (subjects < queries) & (keys[positions] == reverse_keys)
+
+    evalues = evalues.copy()
+    pairs = borderline[order[positions[is_match]]]
+    np.minimum.at(evalues, pairs, reverse_evalues[is_match])
+    return evalues
+
+
+# Run the all-vs-all search: the queries are split into chunks, balanced by their number of residues, which run as
+# concurrent search processes (of the engine) against the shared database (at most get_jobs_num() processes at a
+# time). The HSPs of each chunk are read while it's running (see HSPStream), and the outputs are merged (in the order
+# of the chunks) into out_blast.
+# In the triangular mode (if the engine supports it), each chunk is also a database partition, and chunk k is searched
+# only against the partitions k and above - only the pairs with index1 < index2 are kept anyway, so this finds the
+# same pairs with about half the work. The E-values are calculated for the length of the whole database.
+# With a search cache, only the sequences which are not in the cache are searched (against the whole database) and the
+# cached pairs of the other sequences are added (see pairs_cache.py).
+# With the prefilter, the queries of each chunk are searched only against a database of their candidates (see
+# prefilter.py). The queries are grouped by the key of their first band, so the candidates of the queries of a chunk
+# overlap, and the chunks are small (see prefilter_chunk_queries). The E-values are calculated (or scaled) for the
+# length of the whole database.
+# Since the database of a chunk holds the candidates of all its queries (and the queries themselves), each query is
+# also searched against the candidates of the other queries of its chunk: the pairs which are found this way are
+# reported as well (they are not candidates, but they are real hits), with their E-values calculated (or scaled) in
+# the same way.
+# Returns the pairs and their E-values.
+def run_blast(engine, db, chunks_path, out_blast):
+    if not os.path.isdir(chunks_path):
+        os.mkdir(chunks_path)
+
+    jobs_num, threads_num = get_jobs_num()
+    sequences = [sequence.replace('-', '') for sequence in seq.get_sequences()]
+    lengths = np.fromiter((len(sequence) for sequence in sequences), dtype=np.int64, count=len(sequences))
+    residues_num = int(lengths.sum())
+
+    # Find the sequences which were already searched
+    query_indices = np.arange(len(sequences))
+    is_query = None
+    cache = None
+    if cfg.run_params['blast_cache'] is not None:
+        gapopen, gapext = se.get_gap_penalties(cfg.run_params['scoring_matrix'])
+        cache_params = {'program': engine.name, 'matrix': cfg.run_params['scoring_matrix'], 'gapopen': gapopen,
+                        'gapextend': gapext, 'evalue': cfg.run_params['evalue_cutoff'], 'seg': 'no', 'max_hsps': 1,
+                        'reciprocal': cfg.run_params['blast_triangular'] and cfg.run_params['blast_reciprocal'],
+                        'prefilter': [cfg.run_params['prefilter_pattern'], cfg.run_params['prefilter_bands'],
+                                      cfg.run_params['prefilter_rows']] if cfg.run_params['prefilter'] else None}
+        cache_dir = pairs_cache.get_cache_dir(cfg.run_params['blast_cache'], cache_params)
+        hashes = pairs_cache.get_sequences_hashes(sequences)
+        cache = pairs_cache.load(cache_dir)
+        cache_indices = pairs_cache.find_cached(hashes, cache)
+        query_indices = np.flatnonzero(cache_indices < 0)
+        is_query = cache_indices < 0
+        print('{} of the {} sequences are found in the search cache'.format(len(sequences) - query_indices.shape[0],
+                                                                           len(sequences)))
+
+    is_prefilter = cfg.run_params['prefilter'] and query_indices.shape[0] > 0
+    if is_prefilter:
+        candidates1, candidates2, band_keys = prefilter.find_candidates(sequences, cfg.run_params['prefilter_pattern'],
+                                                                        cfg.run_params['prefilter_bands'],
+                                                                        cfg.run_params['prefilter_rows'])
+        print('The prefilter found {} candidate pairs (of {} pairs)'.format(candidates1.shape[0],
+                                                                            len(sequences) * (len(sequences) - 1) // 2))
+        if not cfg.run_params['prefilter_recall']:
+            print("Note: the prefilter may miss pairs of remote homologs - measure its recall on a sample of the "
+                  "sequences with --prefilter_recall")
+        query_indices = query_indices[np.argsort(band_keys[query_indices, 0], kind='stable')]
+
+    if query_indices.shape[0] > 0:
+        chunks_num = jobs_num * chunks_per_job
+        if is_prefilter:
+            chunks_num = max(chunks_num, -(-query_indices.shape[0] // prefilter_chunk_queries))
+        bounds = split_chunks(lengths[query_indices], min(query_indices.shape[0], chunks_num))
+    else:
+        bounds = np.zeros(1, dtype=np.int64)
+    chunks_num = bounds.shape[0] - 1
+
+    queries = []
+    outputs = []
+    for chunk in range(chunks_num):
+        queries.append(chunks_path + 'chunk_' + str(chunk) + '.fasta')
+        outputs.append(chunks_path + 'chunk_' + str(chunk) + '.blast')
+        chunk_indices = query_indices[bounds[chunk]:bounds[chunk + 1]]
+        with open(queries[chunk], 'w') as query_out:
+            bw.write_rows(query_out, '>%d\n%s\n', [chunk_indices, [sequences[i] for i in chunk_indices]])
+
+    # The databases of the chunks. The triangular mode is used only when all the sequences are searched.
+    # With a search cache, the E-values are calculated explicitly for the length of the whole database (as the cached
+    # E-values are scaled to it).
+    is_triangular = cfg.run_params['blast_triangular'] and query_indices.shape[0] == len(sequences) and \
+        not is_prefilter
+    if is_triangular and not engine.is_partitions_supported:
+        print("The triangular search is not supported by " + engine.name + " - searching the whole database")
+        is_triangular = False
+    dbsize = residues_num if cfg.run_params['blast_cache'] is not None else None
+    dbs = [[db]] * chunks_num
+    if is_triangular:
+        try:
+            partitions = [engine.make_db(query) for query in queries]
+        except se.SearchError as error:
+            cfg.run_params['is_problem'] = True
+            cfg.run_params['error'] = "Error creating the database partitions:\n" + str(error)
+            return None, None, None
+        dbs = [partitions[chunk:] for chunk in range(chunks_num)]
+        dbsize = residues_num
+
+    # The database of each chunk with the prefilter: its queries and their candidates. If the engine cannot calculate
+    # the E-values for the length of the whole database, they are scaled to it.
+    stream = HSPStream(chunks_num, is_query)
+    if is_prefilter:
+        # The candidates of each sequence (both directions of the pairs), grouped by the sequence
+        neighbors1 = np.concatenate((candidates1, candidates2))
+        neighbors2 = np.concatenate((candidates2, candidates1))[np.argsort(neighbors1, kind='stable')]
+        neighbor_starts = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(neighbors1, minlength=len(sequences)), out=neighbor_starts[1:])
+        subsets = []
+        for chunk in range(chunks_num):
+            chunk_indices = query_indices[bounds[chunk]:bounds[chunk + 1]]
+            subset = np.union1d(chunk_indices, np.concatenate(
+                [neighbors2[neighbor_starts[i]:neighbor_starts[i + 1]] for i in chunk_indices]))
+            subsets.append(chunks_path + 'chunk_' + str(chunk) + '_db.fasta')
+            with open(subsets[chunk], 'w') as subset_out:
+                bw.write_rows(subset_out, '>%d\n%s\n', [subset, [sequences[i] for i in subset]])
+            if not engine.is_dbsize_supported:
+                stream.evalue_scales[chunk] = residues_num / max(int(lengths[subset].sum()), 1)
+
+        try:
+            with ThreadPoolExecutor(max_workers=jobs_num) as executor:
+                dbs = [[subset_db] for subset_db in executor.map(engine.make_db, subsets)]
+        except se.SearchError as error:
+            cfg.run_params['is_problem'] = True
+            cfg.run_params['error'] = "Error creating the databases of the candidates:\n" + str(error)
+            return None, None, None
+        dbsize = residues_num
+
+    print('Running ' + engine.name + ' for {} of {} sequences ({} chunks, {} processes of {} threads{})...'.format(
+        query_indices.shape[0], len(sequences), chunks_num, jobs_num, threads_num,
+        ', triangular' if is_triangular else ''))
+
+    # Follow the outputs of the running chunks, and append the completed chunks to out_blast (in their order)
+    is_completed = [False] * chunks_num
+    merged_chunks_num = 0
+    failed_chunks = []
+    with ThreadPoolExecutor(max_workers=jobs_num) as executor, open(out_blast, 'wb') as merged_output:
+        futures = {executor.submit(run_blast_chunk, engine, queries[chunk], dbs[chunk], outputs[chunk], threads_num,
+                                   dbsize, functools.partial(stream.set_attempt, chunk)): chunk
+                   for chunk in range(chunks_num)}
+        pending = set(futures)
+        while len(pending) > 0:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in pending:
+                if future.running():
+                    stream.read(futures[future], outputs[futures[future]] + '.tmp', False)
+
+            for future in done:
+                chunk = futures[future]
+                if not future.result():
+                    failed_chunks.append(chunk)
+                    continue
+                stream.read(chunk, outputs[chunk], True)
+                is_completed[chunk] = True
+                if cfg.run_params['is_debug_mode']:
+                    print("Search chunk " + str(chunk) + " completed (" + str(sum(is_completed)) + " of " +
+                          str(chunks_num) + " chunks, " + str(stream.hsps_num) + " HSPs so far)")
+
+            while merged_chunks_num < chunks_num and is_completed[merged_chunks_num]:
+                with open(outputs[merged_chunks_num], 'rb') as infile:
+                    shutil.copyfileobj(infile, merged_output)
+                merged_chunks_num += 1
+
+    if len(failed_chunks) > 0:
+        cfg.run_params['is_problem'] = True
+        cfg.run_params['error'] = "Error running " + engine.name + " - the search failed for the chunks " + \
+                                  ", ".join([queries[chunk] for chunk in sorted(failed_chunks)])
+        return None, None, None
+
+    index1, index2, evalues = stream.get_pairs()
+
+    if is_triangular and cfg.run_params['blast_reciprocal']:
+        evalues = run_reciprocal_search(engine, db, chunks_path, sequences, index1, index2, evalues,
+                                        jobs_num * threads_num, dbsize)
+
+    # Add the cached pairs and save the pairs of all the sequences to the cache
+    if cfg.run_params['blast_cache'] is not None:
+        if cache is not None:
+            cached_index1, cached_index2, cached_evalues = pairs_cache.get_cached_pairs(
+                cache_indices, cache, residues_num, cfg.run_params['evalue_cutoff'])
+            index1 = np.concatenate((cached_index1, index1))
+            index2 = np.concatenate((cached_index2, index2))
+            evalues = np.concatenate((cached_evalues, evalues))
+        pairs_cache.save(cache_dir, cache_params, hashes, index1, index2, evalues, residues_num)
+
+    return index1, index2, evalues
+
+
+# Measure the recall of the prefilter: run the full search (without the prefilter and the cache) and report the part of
+# its pairs (all of them and the connected ones) which were found by the prefiltered search
+def report_prefilter_recall(engine, db, chunks_path, out_blast, index1, index2):
+    print("Running the full search for measuring the recall of the prefilter...")
+    saved_params = {name: cfg.run_params[name] for name in ['prefilter', 'blast_cache']}
+    cfg.run_params['prefilter'] = False
+    cfg.run_params['blast_cache'] = None
+    full_index1, full_index2, full_evalues = run_blast(engine, db, chunks_path + 'full/', out_blast + '.full')
+    cfg.run_params.update(saved_params)
+    if cfg.run_params['is_problem']:
+        return
 
-                    pair_tuple = (index1, index2, evalue)
-                    cfg.similarity_values_list.append(pair_tuple)
+    seq_num = cfg.run_params['total_sequences_num']
+    is_connected = full_evalues <= cfg.run_params['similarity_cutoff']
+    print("Prefilter recall: {:.4f} of the {} pairs found by the full search, {:.4f} of the {} connected pairs "
+          "(E-value <= {})".format(prefilter.get_recall(full_index1, full_index2, index1, index2, seq_num),
+                                   full_index1.shape[0],
+                                   prefilter.get_recall(full_index1[is_connected], full_index2[is_connected], index1,
+                                                        index2, seq_num),
+                                   np.count_nonzero(is_connected), cfg.run_params['similarity_cutoff']))
 
 
-# Calculate and save the attraction values and apply the similarity cutoff
-def fill_values():
+# Create the compact edges arrays, calculate the attraction values and apply the similarity cutoff
+def fill_values(index1, index2, evalues):
     cfg.run_params['type_of_values'] = "hsp"
+    sp.set_edges(index1, index2, evalues, 'hsp')
     sp.calculate_attraction_values()
     sp.define_connected_sequences('hsp')
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,28 @@
+import clans.config as cfg
+import clans.similarity_search.engines.search_engine as se
+
+# NCBI BLAST+ (makeblastdb and blastp)
+
+
+class BlastEngine:
+
+    def __init__(self):
+        self.name = 'blastp'
+        self.is_partitions_supported = True
+        self.is_dbsize_supported = True
+
+    def make_db(self, fasta_path):
+        se.run_command(['makeblastdb', '-dbtype', 'prot', '-in', fasta_path])
+        return fasta_path
+
+    def search(self, query, dbs, out_path, threads_num, dbsize=None):
+        matrix = cfg.run_params['scoring_matrix']
+        gapopen, gapext = se.get_gap_penalties(matrix)
+        arguments = ['blastp', '-query', query, '-db', ' '.join(dbs), '-out', out_path,
+                     '-outfmt', '6 qacc sacc evalue', '-evalue', str(cfg.run_params['evalue_cutoff']),
+                     '-max_target_seqs', str(cfg.run_params['total_sequences_num']), '-max_hsps', '1',
+                     '-matrix', matrix, '-gapopen', str(gapopen), '-gapextend', str(gapext), '-seg', 'no',
+                     '-num_threads', str(threads_num)]
+        if dbsize is not None:
+            arguments += ['-dbsize', str(dbsize)]
+        se.run_command(arguments)
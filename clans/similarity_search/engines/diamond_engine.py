@@ -0,0 +1,28 @@
+import clans.config as cfg
+import clans.similarity_search.engines.search_engine as se
+
+# DIAMOND (makedb and blastp)
+
+
+class DiamondEngine:
+
+    def __init__(self):
+        self.name = 'diamond'
+        self.is_partitions_supported = False
+        self.is_dbsize_supported = True
+
+    def make_db(self, fasta_path):
+        se.run_command(['diamond', 'makedb', '--in', fasta_path, '--db', fasta_path])
+        return fasta_path + '.dmnd'
+
+    def search(self, query, dbs, out_path, threads_num, dbsize=None):
+        matrix = cfg.run_params['scoring_matrix']
+        gapopen, gapext = se.get_gap_penalties(matrix)
+        arguments = ['diamond', 'blastp', '--query', query, '--db', dbs[0], '--out', out_path,
+                     '--outfmt', '6', 'qseqid', 'sseqid', 'evalue', '--evalue', str(cfg.run_params['evalue_cutoff']),
+                     '--max-target-seqs', str(cfg.run_params['total_sequences_num']), '--max-hsps', '1',
+                     '--matrix', matrix, '--gapopen', str(gapopen), '--gapextend', str(gapext), '--masking', '0',
+                     '--threads', str(threads_num)]
+        if dbsize is not None:
+            arguments += ['--dbsize', str(dbsize)]
+        se.run_command(arguments)
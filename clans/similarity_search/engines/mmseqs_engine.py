@@ -0,0 +1,28 @@
+import clans.config as cfg
+import clans.similarity_search.engines.search_engine as se
+
+# MMseqs2 (createdb and easy-search). The E-values are calculated for the searched database.
+# The scoring matrices are MMseqs2's own matrix files of the same names (e.g. blosum62.out) - MMseqs2 comes with the
+# BLOSUM matrices only.
+
+
+class MMseqsEngine:
+
+    def __init__(self):
+        self.name = 'mmseqs'
+        self.is_partitions_supported = False
+        self.is_dbsize_supported = False
+
+    def make_db(self, fasta_path):
+        db_path = fasta_path + '.mmseqs'
+        se.run_command(['mmseqs', 'createdb', fasta_path, db_path])
+        return db_path
+
+    def search(self, query, dbs, out_path, threads_num, dbsize=None):
+        matrix = cfg.run_params['scoring_matrix']
+        gapopen, gapext = se.get_gap_penalties(matrix)
+        se.run_command(['mmseqs', 'easy-search', query, dbs[0], out_path, out_path + '_tmp',
+                        '--format-output', 'query,target,evalue', '-e', str(cfg.run_params['evalue_cutoff']),
+                        '--max-seqs', str(cfg.run_params['total_sequences_num']),
+                        '--sub-mat', matrix.lower() + '.out', '--gap-open', str(gapopen),
+                        '--gap-extend', str(gapext), '--mask', '0', '--threads', str(threads_num)])
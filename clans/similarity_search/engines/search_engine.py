@@ -0,0 +1,41 @@
+import subprocess
+
+# The common parts of the similarity-search engines (see blast_engine.py, mmseqs_engine.py, diamond_engine.py and
+# sw_engine.py).
+# Each engine class provides:
+# - name, and whether it can search a list of database partitions at once (is_partitions_supported, for the
+#   triangular search) and calculate the E-values for a given database length (is_dbsize_supported)
+# - make_db(fasta_path): creates a database from a FASTA file and returns its path
+# - search(query, dbs, out_path, threads_num, dbsize): searches the query FASTA file against the databases and writes
+#   the HSPs to out_path as tab-separated rows of "query subject evalue" (the best HSP of each query and subject).
+#   Raises SearchError if the search fails.
+
+
+class SearchError(Exception):
+    pass
+
+
+# Run the command (a list of arguments). Raises SearchError if it cannot be run or it fails.
+def run_command(arguments):
+    try:
+        result = subprocess.run(arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as error:
+        raise SearchError("Cannot run " + arguments[0] + ": " + str(error))
+    if result.returncode != 0:
+        raise SearchError(" ".join(arguments[:2]) + " failed (exit code " + str(result.returncode) + "):\n" +
+                          result.stderr.decode(errors='replace').strip())
+    return result.stdout
+
+
+# Returns the gap_open and gap_extend parameters according to the scoring matrix
+def get_gap_penalties(matrix):
+    gapopen = 11
+    gapext = 1
+    if matrix == "BLOSUM80" or matrix == "PAM70":
+        gapopen = 10
+    elif matrix == "PAM30":
+        gapopen = 9
+    elif matrix == "BLOSUM45":
+        gapopen = 15
+        gapext = 2
+    return gapopen, gapext
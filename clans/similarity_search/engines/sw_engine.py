@@ -0,0 +1,190 @@
+import threading
+import numpy as np
+import numba
+from Bio.Align import substitution_matrices
+import clans.config as cfg
+import clans.io.file_formats.fasta_format as fasta
+import clans.similarity_search.engines.search_engine as se
+
+# A built-in Smith-Waterman engine, for running without BLAST+. Every query is aligned (local alignment with affine
+# gaps, Gotoh) against every sequence of the databases, and each pair gets the score of its best local alignment and
+# its Karlin-Altschul E-value: E = K * m * n * exp(-lambda * S), for a query of length m and a database of length n (the
+# given dbsize or the length of the searched databases).
+# The subjects are sorted by their length and aligned in batches of lanes_num subjects at once (as in SWIPE): the
+# innermost loop runs over the subjects of the batch, so it's vectorized by the compiler. The pairs of a query and a
+# batch are aligned in parallel (numba prange).
+# The scoring matrices are Biopython's, with the gap costs of the matrix (see get_gap_penalties()). lambda and K are
+# the gapped values of BLAST for these matrices and gap costs (without BLAST's length adjustment).
+# The search runs inside the CLANS process, so the chunks are aligned one at a time, each with all the cores.
+
+# The gapped Karlin-Altschul parameters (lambda, K) of each matrix (with the gap costs of get_gap_penalties())
+karlin_altschul_params = {'BLOSUM45': (0.199, 0.040),
+                          'BLOSUM62': (0.267, 0.041),
+                          'BLOSUM80': (0.299, 0.071),
+                          'PAM30': (0.294, 0.11),
+                          'PAM70': (0.291, 0.091)}
+
+lanes_num = 32
+padding_score = -(1 << 20)  # The score of the padding after the end of the shorter subjects of a batch
+
+# The number of pairs which are aligned at once (the scores of a block of queries against all the subjects)
+block_pairs_num = 1 << 22
+
+search_lock = threading.Lock()
+
+
+# Fill the score of the best local alignment of the query and each subject of the batch (best_scores), with affine
+# gap costs (a gap of length k costs gap_open + k * gap_extend).
+# The query is given by its profile (the score of each query position against each residue type, with the padding as
+# the last type), and the batch by its columns (the residue types of the subjects at each position).
+# h_rows and e_rows (query length * lanes) and h_diagonal, h_up and f (lanes) are work arrays.
+@numba.njit(nogil=True)
+def align_batch(profile, batch, gap_open, gap_extend, h_rows, e_rows, h_diagonal, h_up, f, best_scores):
+    gap_first = gap_open + gap_extend
+    h_rows[:] = 0
+    e_rows[:] = 0
+    best_scores[:] = 0
+    for j in range(batch.shape[0]):
+        column = batch[j]
+        h_diagonal[:] = 0
+        h_up[:] = 0
+        f[:] = 0
+        for i in range(profile.shape[0]):
+            scores = profile[i]
+            h_row = h_rows[i]
+            e_row = e_rows[i]
+            for lane in range(batch.shape[1]):
+                h_left = h_row[lane]
+                e = max(e_row[lane] - gap_extend, h_left - gap_first)
+                f[lane] = max(f[lane] - gap_extend, h_up[lane] - gap_first)
+                h = max(max(h_diagonal[lane] + scores[column[lane]], 0), max(e, f[lane]))
+                h_diagonal[lane] = h_left
+                h_row[lane] = h
+                e_row[lane] = e
+                h_up[lane] = h
+                best_scores[lane] = max(best_scores[lane], h)
+
+
+# Fill the scores of each pair of a query (from first_query, by its rows in profiles) and a batch of subjects (by its
+# rows in batches), in parallel over the pairs
+@numba.njit(parallel=True)
+def compute_scores(profiles, query_starts, query_ends, first_query, batches, batch_starts, gap_open, gap_extend,
+                   scores):
+    batches_num = batch_starts.shape[0] - 1
+    lanes = batches.shape[1]
+    for pair in numba.prange(scores.shape[0] * batches_num):
+        query = first_query + pair // batches_num
+        batch = pair % batches_num
+        query_len = query_ends[query] - query_starts[query]
+        h_rows = np.empty((query_len, lanes), dtype=np.int32)
+        e_rows = np.empty((query_len, lanes), dtype=np.int32)
+        lane_values = np.empty((3, lanes), dtype=np.int32)
+        align_batch(profiles[query_starts[query]:query_ends[query]],
+                    batches[batch_starts[batch]:batch_starts[batch + 1]], gap_open, gap_extend, h_rows, e_rows,
+                    lane_values[0], lane_values[1], lane_values[2],
+                    scores[pair // batches_num, batch * lanes:(batch + 1) * lanes])
+
+
+# Returns the names of the sequences of the FASTA files (the first word of the title), their residues (as indices in
+# the alphabet, concatenated) and the start and end of each sequence in the residues. The files are read by the
+# memory-mapped FASTA scanner (see fasta_format.py).
+def read_sequences(fasta_paths, alphabet):
+    codes = np.full(256, alphabet.index('X'), dtype=np.uint8)
+    for code, letter in enumerate(alphabet):
+        codes[ord(letter)] = code
+        codes[ord(letter.lower())] = code
+
+    names = []
+    residues = []
+    starts = []
+    ends = []
+    residues_num = 0
+    for fasta_path in fasta_paths:
+        titles, sequences = fasta.read_fasta(fasta_path)
+        names += [(title.split(None, 1) or [''])[0] for title in titles.get_list()]
+        residues.append(codes[np.frombuffer(sequences.buffer, dtype=np.uint8)])
+        starts.append(sequences.starts + residues_num)
+        ends.append(sequences.ends + residues_num)
+        residues_num += len(sequences.buffer)
+
+    if len(residues) == 0:
+        return names, np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return names, np.concatenate(residues), np.concatenate(starts), np.concatenate(ends)
+
+
+# Returns the batches of the subjects (sorted by their length): the columns of all the batches, one batch after the
+# other (the residues of the lanes_num subjects of the batch at each position, padded with the padding type), the
+# first column of each batch (and the end of the last one) and the order of the subjects in the batches
+def make_batches(residues, starts, ends, padding_type):
+    order = np.argsort(ends - starts, kind='stable')
+    batches_num = (order.shape[0] + lanes_num - 1) // lanes_num
+    batch_lengths = np.zeros(batches_num, dtype=np.int64)
+    for batch in range(batches_num):
+        batch_subjects = order[batch * lanes_num:(batch + 1) * lanes_num]
+        batch_lengths[batch] = np.max(ends[batch_subjects] - starts[batch_subjects])
+    batch_starts = np.zeros(batches_num + 1, dtype=np.int64)
+    np.cumsum(batch_lengths, out=batch_starts[1:])
+
+    batches = np.full((batch_starts[-1], lanes_num), padding_type, dtype=np.uint8)
+    for position, subject in enumerate(order):
+        batch = position // lanes_num
+        batches[batch_starts[batch]:batch_starts[batch] + ends[subject] - starts[subject], position % lanes_num] = \
+            residues[starts[subject]:ends[subject]]
+    return batches, batch_starts, order
+
+
+class SmithWatermanEngine:
+
+    def __init__(self):
+        self.name = 'Smith-Waterman'
+        self.is_partitions_supported = True
+        self.is_dbsize_supported = True
+
+    # The FASTA file is the database
+    def make_db(self, fasta_path):
+        return fasta_path
+
+    def search(self, query, dbs, out_path, threads_num, dbsize=None):
+        matrix_name = cfg.run_params['scoring_matrix']
+        if matrix_name not in karlin_altschul_params:
+            raise se.SearchError("The scoring matrix " + matrix_name + " is not supported by the built-in search")
+        matrix = substitution_matrices.load(matrix_name)
+        alphabet = matrix.alphabet
+        gap_open, gap_extend = se.get_gap_penalties(matrix_name)
+        lambda_value, k_value = karlin_altschul_params[matrix_name]
+
+        try:
+            query_names, query_residues, query_starts, query_ends = read_sequences([query], alphabet)
+            subject_names, residues, subject_starts, subject_ends = read_sequences(dbs, alphabet)
+        except (OSError, ValueError) as error:
+            raise se.SearchError("Cannot read the sequences: " + str(error))
+        if dbsize is None:
+            dbsize = residues.shape[0]
+
+        # The profiles of the queries: the score of each query position against each residue type (and the padding)
+        matrix_scores = np.full((len(alphabet) + 1, len(alphabet) + 1), padding_score, dtype=np.int32)
+        matrix_scores[:-1, :-1] = np.asarray(matrix, dtype=np.int32)
+        profiles = matrix_scores[query_residues]
+        batches, batch_starts, order = make_batches(residues, subject_starts, subject_ends, len(alphabet))
+
+        # The lowest score with an E-value within the cutoff, for each query
+        query_lengths = query_ends - query_starts
+        min_scores = np.log(k_value * np.maximum(query_lengths, 1) * dbsize / cfg.run_params['evalue_cutoff']) / \
+            lambda_value
+
+        subjects_num = len(subject_names)
+        block_queries_num = max(1, block_pairs_num // max(subjects_num, 1))
+        with search_lock, open(out_path, 'w') as output:
+            for first_query in range(0, len(query_names), block_queries_num):
+                queries_num = min(block_queries_num, len(query_names) - first_query)
+                batches_scores = np.empty((queries_num, (batch_starts.shape[0] - 1) * lanes_num), dtype=np.int32)
+                compute_scores(profiles, query_starts, query_ends, first_query, batches, batch_starts,
+                               np.int32(gap_open), np.int32(gap_extend), batches_scores)
+
+                scores = np.empty((queries_num, subjects_num), dtype=np.int32)
+                scores[:, order] = batches_scores[:, :subjects_num]
+                queries, subjects = np.nonzero(scores >= min_scores[first_query:first_query + queries_num, None])
+                evalues = k_value * query_lengths[first_query + queries] * dbsize * \
+                    np.exp(-lambda_value * scores[queries, subjects])
+                output.write(''.join(['{}\t{}\t{:.3g}\n'.format(query_names[first_query + q], subject_names[s], e)
+                                      for q, s, e in zip(queries, subjects, evalues)]))
@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# A persistent cache of the all-against-all search results, for incremental searches on growing datasets.
+# The cache of each set of search parameters (matrix, gap costs, E-value cutoff...) is kept in its own sub-directory,
+# named by the hash of the parameters. It holds the results of the last search with these parameters:
+# - sequences_hashes.npy: the hash of each searched sequence (16 bytes of BLAKE2b of the residues), in the order of
+#   the search. All the pairs of these sequences were searched.
+# - pairs_indices.npy, pairs_evalues.npy: the HSPs found by the search (indices in the cached sequences, E-values).
+# - cache.json: the format version, the parameters and the fingerprint of the searched database (the number of
+#   sequences and of residues). It's written last, so a directory without it is not a (complete) cache.
+# The sequences of a new search which are found in the cache (by their hash) are not searched again - only the new
+# sequences are searched against all the sequences, and the cached pairs of the other sequences are added.
+# An E-value is proportional to the length of the database, so the cached E-values are scaled from the length of the
+# cached database to the length of the new one (the new HSPs are calculated for the length of the whole new database).
+
+format_version = 1
+metadata_file = 'cache.json'
+
+
+def get_cache_dir(cache_path, params):
+    params_json = json.dumps(dict(params, format_version=format_version), sort_keys=True)
+    return os.path.join(cache_path, hashlib.sha1(params_json.encode()).hexdigest())
+
+
+# Returns a 1D array of the hashes (16 bytes) of the sequences
+def get_sequences_hashes(sequences):
+    return np.array([hashlib.blake2b(sequence.encode(), digest_size=16).digest() for sequence in sequences],
+                    dtype='S16')
+
+
+# Returns the cache of the directory (a dict with the hashes, the pairs, their E-values and the database fingerprint),
+# or None if there is no (complete) cache in it
+def load(cache_dir):
+    metadata_path = os.path.join(cache_dir, metadata_file)
+    if not os.path.isfile(metadata_path):
+        return None
+    try:
+        with open(metadata_path) as infile:
+            cache = json.load(infile)
+        if cache.get('format_version', 0) != format_version:
+            return None
+        cache['hashes'] = np.load(os.path.join(cache_dir, 'sequences_hashes.npy'))
+        cache['pairs_indices'] = np.load(os.path.join(cache_dir, 'pairs_indices.npy'))
+        cache['pairs_evalues'] = np.load(os.path.join(cache_dir, 'pairs_evalues.npy'))
+    except (OSError, ValueError) as error:
+        print("Ignoring the corrupted search cache in " + cache_dir + ": " + str(error))
+        return None
+    return cache
+
+
+# Save the results of a search (of all the pairs of the given sequences) to the cache directory
+def save(cache_dir, params, hashes, index1, index2, evalues, residues_num):
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    # Remove the metadata first, so an interrupted save doesn't leave a cache with mismatching arrays
+    metadata_path = os.path.join(cache_dir, metadata_file)
+    if os.path.isfile(metadata_path):
+        os.remove(metadata_path)
+
+    np.save(os.path.join(cache_dir, 'sequences_hashes.npy'), hashes)
+    np.save(os.path.join(cache_dir, 'pairs_indices.npy'), np.column_stack((index1, index2)).astype('<i4'))
+    np.save(os.path.join(cache_dir, 'pairs_evalues.npy'), np.asarray(evalues, dtype='<f8'))
+
+    metadata = {'format_version': format_version,
+                'params': params,
+                'sequences_num': int(hashes.shape[0]),
+                'residues_num': int(residues_num)}
+    with open(metadata_path + '.tmp', 'w') as output:
+        json.dump(metadata, output)
+    os.replace(metadata_path + '.tmp', metadata_path)
+
+
+# Returns the index in the cache of each sequence (by its hash), or -1 if it's not in the cache.
+# Only the first sequence with each hash is matched (the others are searched as new sequences).
+def find_cached(hashes, cache):
+    cache_indices = np.full(hashes.shape[0], -1, dtype=np.int64)
+    if cache is None or cache['hashes'].shape[0] == 0:
+        return cache_indices
+
+    cache_hashes, first_indices = np.unique(cache['hashes'], return_index=True)
+    positions = np.minimum(np.searchsorted(cache_hashes, hashes), cache_hashes.shape[0] - 1)
+    is_found = cache_hashes[positions] == hashes
+
+    unique_hashes, first_in_input = np.unique(hashes, return_index=True)
+    is_first = np.zeros(hashes.shape[0], dtype=bool)
+    is_first[first_in_input] = True
+
+    is_cached = is_found & is_first
+    cache_indices[is_cached] = first_indices[positions[is_cached]]
+    return cache_indices
+
+
+# Returns the cached pairs of the cached sequences (in their current indices) and their E-values, scaled to the length
+# of the current database (residues_num). The pairs with an E-value above the cutoff are dropped.
+def get_cached_pairs(cache_indices, cache, residues_num, evalue_cutoff):
+    current_indices = np.full(cache['hashes'].shape[0], -1, dtype=np.int64)
+    is_cached = cache_indices >= 0
+    current_indices[cache_indices[is_cached]] = np.flatnonzero(is_cached)
+
+    index1 = current_indices[cache['pairs_indices'][:, 0]]
+    index2 = current_indices[cache['pairs_indices'][:, 1]]
+    evalues = cache['pairs_evalues'] * (residues_num / cache['residues_num'])
+    is_kept = (index1 >= 0) & (index2 >= 0) & (evalues <= evalue_cutoff)
+    return index1[is_kept], index2[is_kept], evalues[is_kept]
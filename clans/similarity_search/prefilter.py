@@ -0,0 +1,145 @@
+import numpy as np
+import numba
+import clans.data.string_pool as string_pool
+
+# A k-mer prefilter for the all-against-all search, which proposes candidate pairs instead of searching all the pairs.
+# Each sequence gets a MinHash sketch of its k-mers: for each of bands_num * rows_num hash functions, the minimal hash
+# of its k-mers (the probability that two sequences have the same minimal hash is the Jaccard similarity of their k-mer
+# sets). The sketch is split into bands of rows_num hashes (LSH banding) and two sequences are a candidate pair if all
+# the hashes of at least one band are the same - the probability of this is 1 - (1 - J^rows_num)^bands_num for a
+# Jaccard similarity J. The search then runs only on the candidate pairs (see run_blast() in blast.py).
+
+# The candidates are collected band by band in bounded memory: a group of sequences with the same key in a band (a
+# bucket) which is larger than max_group_size is split into groups of at most max_group_size (ordered by their key in
+# the next band, so the large buckets are split differently in each band and similar sequences stay together), and
+# the pairs of the bands are merged into the unique candidates whenever max_buffered_pairs of them are collected.
+max_group_size = 256
+max_buffered_pairs = 1 << 24
+
+empty_hash = np.uint64(0xFFFFFFFFFFFFFFFF)
+fnv_offset_basis = np.uint64(14695981039346656037)
+fnv_prime = np.uint64(1099511628211)
+
+
+# The splitmix64 finalizer - a mixing function of 64-bit values
+@numba.njit(nogil=True)
+def mix(x):
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+# Fill the MinHash sketch of each sequence (the minimal hash of its k-mers for each of the seeds). A k-mer is made of
+# the residues at the given offsets from its start (a spaced seed, e.g. offsets 0,1,3,4 for the pattern 11011, which
+# tolerates a substitution in the middle) and spans offsets[-1] + 1 residues. The residues are hashed
+# case-insensitively. A sequence shorter than the span is hashed as one k-mer of its first residues, and an empty
+# sequence gets an empty sketch (all the hashes are empty_hash).
+@numba.njit(parallel=True)
+def compute_sketches(buffer, starts, ends, offsets, seeds, sketches):
+    span = offsets[-1] + 1
+    for seq_index in numba.prange(starts.shape[0]):
+        for h in range(seeds.shape[0]):
+            sketches[seq_index, h] = empty_hash
+        if ends[seq_index] == starts[seq_index]:
+            continue
+
+        for pos in range(starts[seq_index], max(ends[seq_index] - span + 1, starts[seq_index] + 1)):
+            kmer_hash = fnv_offset_basis
+            for offset in offsets:
+                if pos + offset >= ends[seq_index]:
+                    break
+                residue = buffer[pos + offset]
+                if 97 <= residue <= 122:
+                    residue -= 32
+                kmer_hash = (kmer_hash ^ np.uint64(residue)) * fnv_prime
+            for h in range(seeds.shape[0]):
+                value = mix(kmer_hash ^ seeds[h])
+                if value < sketches[seq_index, h]:
+                    sketches[seq_index, h] = value
+
+
+# Fill the key of each band of each sketch (a hash of its rows_num hashes)
+@numba.njit(parallel=True)
+def compute_band_keys(sketches, rows_num, band_keys):
+    for seq_index in numba.prange(sketches.shape[0]):
+        for band in range(band_keys.shape[1]):
+            key = mix(fnv_offset_basis ^ np.uint64(band))
+            for row in range(rows_num):
+                key = mix(key ^ sketches[seq_index, band * rows_num + row])
+            band_keys[seq_index, band] = key
+
+
+# Fill all the pairs of the members of each group (members[group_starts[g]:group_ends[g]]), the lower index first
+@numba.njit(nogil=True)
+def fill_group_pairs(members, group_starts, group_ends, index1, index2):
+    pairs_num = 0
+    for group in range(group_starts.shape[0]):
+        for a in range(group_starts[group], group_ends[group]):
+            for b in range(a + 1, group_ends[group]):
+                index1[pairs_num] = min(members[a], members[b])
+                index2[pairs_num] = max(members[a], members[b])
+                pairs_num += 1
+
+
+# Returns the offsets of the residues of a k-mer of the spaced-seed pattern (e.g. '11011' - '1' for a used position)
+def get_pattern_offsets(pattern):
+    return np.array([offset for offset, char in enumerate(pattern) if char == '1'], dtype=np.int64)
+
+
+# Find the candidate pairs of the sequences (a list of strings), with k-mers of the given spaced-seed pattern.
+# Returns the candidate pairs (index1 < index2, sorted, as two arrays) and the band keys of the sequences
+# (N, bands_num).
+def find_candidates(sequences, pattern, bands_num, rows_num, seed=0):
+    pool = string_pool.from_strings(sequences)
+    seq_num = len(pool)
+    seeds = np.array([mix(np.uint64(seed * bands_num * rows_num + h + 1)) for h in range(bands_num * rows_num)],
+                     dtype=np.uint64)
+    sketches = np.empty((seq_num, bands_num * rows_num), dtype=np.uint64)
+    compute_sketches(np.frombuffer(pool.buffer, dtype=np.uint8), pool.starts, pool.ends, get_pattern_offsets(pattern),
+                     seeds, sketches)
+    band_keys = np.empty((seq_num, bands_num), dtype=np.uint64)
+    compute_band_keys(sketches, rows_num, band_keys)
+
+    # The empty sequences are not candidates of any other sequence
+    valid_indices = np.flatnonzero(sketches[:, 0] != empty_hash) if bands_num * rows_num > 0 else \
+        np.empty(0, dtype=np.int64)
+
+    # Group the sequences with the same key in each band (splitting the large groups), and take the pairs of each group
+    pairs_keys = np.empty(0, dtype=np.int64)
+    buffered_pairs_keys = []
+    buffered_pairs_num = 0
+    positions = np.arange(valid_indices.shape[0])
+    for band in range(bands_num):
+        order = np.lexsort((band_keys[valid_indices, (band + 1) % bands_num], band_keys[valid_indices, band]))
+        keys = band_keys[valid_indices[order], band]
+        is_group_start = np.ones(keys.shape[0], dtype=bool)
+        is_group_start[1:] = keys[1:] != keys[:-1]
+        ranks = positions - np.maximum.accumulate(np.where(is_group_start, positions, 0))
+        is_group_start |= ranks % max_group_size == 0
+        group_starts = np.flatnonzero(is_group_start)
+        group_ends = np.append(group_starts[1:], keys.shape[0])
+        is_pair_group = group_ends - group_starts > 1
+        group_starts = group_starts[is_pair_group]
+        group_ends = group_ends[is_pair_group]
+
+        sizes = group_ends - group_starts
+        index1 = np.empty(int(np.sum(sizes * (sizes - 1) // 2)), dtype=np.int64)
+        index2 = np.empty(index1.shape[0], dtype=np.int64)
+        fill_group_pairs(valid_indices[order], group_starts, group_ends, index1, index2)
+        buffered_pairs_keys.append(index1 * seq_num + index2)
+        buffered_pairs_num += index1.shape[0]
+        if buffered_pairs_num > max_buffered_pairs or band == bands_num - 1:
+            pairs_keys = np.unique(np.concatenate([pairs_keys] + buffered_pairs_keys))
+            buffered_pairs_keys = []
+            buffered_pairs_num = 0
+
+    return pairs_keys // max(seq_num, 1), pairs_keys % max(seq_num, 1), band_keys
+
+
+# Returns the fraction of the given pairs (from a full search) which are in the other pairs (from a prefiltered search)
+def get_recall(index1, index2, found_index1, found_index2, seq_num):
+    if index1.shape[0] == 0:
+        return 1.0
+    keys = np.minimum(index1, index2) * seq_num + np.maximum(index1, index2)
+    found_keys = np.minimum(found_index1, found_index2) * seq_num + np.maximum(found_index1, found_index2)
+    return np.count_nonzero(np.isin(keys, found_keys)) / keys.shape[0]
@@ -5,6 +5,7 @@ import os
 import clans.config as cfg
 import clans.io.parser as parser
 import clans.io.file_handler as fh
+import clans.data.redundancy as redundancy
 import clans.similarity_search.blast as blast
 import clans.layouts.layout_handler as lh
 
@@ -23,6 +24,17 @@ if cfg.run_params['is_problem']:
 else:
     print("Reading the input file took "+str(duration)+" seconds")
 
+# Collapse the redundant sequences of the FASTA input into representatives (only they are searched and laid out)
+if cfg.run_params['collapse_redundant']:
+    if cfg.run_params['run_blast']:
+        before = time.time()
+        redundancy.collapse(cfg.run_params['collapse_identity'])
+        after = time.time()
+        duration = (after - before)
+        print("Collapsing the redundant sequences took " + str(duration) + " seconds")
+    else:
+        print("The redundant sequences are collapsed only for a FASTA input (-infile) - ignoring --collapse_redundant")
+
 # Perform BLAST search and fill the HSP's E-values in the similarity matrix
 if cfg.run_params['run_blast']:
     before = time.time()
@@ -41,8 +53,15 @@ if cfg.run_params['num_of_rounds'] > 0:
     lh.calculate_layout("FR")
     after = time.time()
     duration = (after - before)
+    if cfg.run_params['is_problem']:
+        print(cfg.run_params['error'])
+        exit()
     print("The calculation of " + str(cfg.run_params['rounds_done']) + " rounds took "+str(duration)+" seconds")
 
+# Expand the representatives back to all the input sequences
+if redundancy.is_collapsed():
+    redundancy.expand()
+
 ## Write the output file
 if cfg.run_params['output_file'] is not None:
     before = time.time()
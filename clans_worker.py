@@ -0,0 +1,12 @@
+# A worker process for the sharded layout calculation (clans_cmd.py --shards N --shard_remote) #
+# Usage: CLANS_SHARD_KEY=<key> python clans_worker.py <coordinator_host:port>                  #
+################################################################################################
+import sys
+import os
+import clans.layouts.sharded_layout as sl
+
+if len(sys.argv) != 2 or 'CLANS_SHARD_KEY' not in os.environ:
+    print("Usage: CLANS_SHARD_KEY=<key> python clans_worker.py <coordinator_host:port>")
+    exit()
+
+sl.run_worker(sl.parse_address(sys.argv[1]), os.environ['CLANS_SHARD_KEY'].encode())
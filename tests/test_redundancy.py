@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+import clans.config as cfg
+import clans.io.file_handler as fh
+import clans.io.file_formats.clans_format as clans
+import clans.data.sequence_pairs as sp
+import clans.data.redundancy as redundancy
+
+# The redundancy reduction of a small FASTA input: two families of exact and nearly identical sequences and an
+# unrelated sequence. The search is replaced by a single HSP of the representatives of the families.
+
+letters = 'ARNDCQEGHILKMFPSTWYV'
+
+
+def write_fasta(fasta_path):
+    rng = np.random.default_rng(0)
+    sequence_a = ''.join(rng.choice(list(letters), size=80))
+    sequence_b = ''.join(rng.choice(list(letters), size=60))
+    sequence_c = ''.join(rng.choice(list(letters), size=40))
+    near_a = sequence_a[:40] + ('W' if sequence_a[40] != 'W' else 'Y') + sequence_a[41:]
+    records = [('a1 first', sequence_a), ('b1', sequence_b), ('a2 exact duplicate', sequence_a),
+               ('a3 near duplicate', near_a), ('b2', sequence_b.lower()), ('c1', sequence_c)]
+    with open(fasta_path, 'w') as output:
+        for title, sequence in records:
+            output.write('>' + title + '\n' + sequence + '\n')
+    return records
+
+
+@pytest.fixture
+def collapsed_input(tmp_path, monkeypatch):
+    fasta_path = str(tmp_path / 'input.fasta')
+    records = write_fasta(fasta_path)
+    monkeypatch.setattr(cfg, 'run_params', dict(cfg.run_params))
+    monkeypatch.setattr(cfg, 'groups_dict', {})
+    cfg.run_params.update({'working_dir': str(tmp_path), 'input_file': fasta_path, 'type_of_values': 'hsp',
+                           'dimensions_num_for_clustering': 3, 'similarity_cutoff': 1e-4})
+    fh.read_input_file(fasta_path, 'fasta')
+    assert not cfg.run_params['is_problem']
+    redundancy.collapse(0.95)
+    yield records
+    redundancy.representatives = None
+    redundancy.full_titles = None
+    redundancy.full_sequences = None
+
+
+# The exact duplicates (regardless of the case) and the near duplicates are represented by the first longest sequence
+def test_find_representatives():
+    representatives, duplicates_num = redundancy.find_representatives(
+        ['MKVLA' * 20, 'GGHHW' * 10, 'MKVLA' * 20, 'MKVLA' * 19 + 'MKVLW', 'gghhw' * 10, 'PEPTIDE'], 0.95)
+    assert representatives.tolist() == [0, 1, 0, 0, 1, 5]
+    assert duplicates_num == 2
+
+    # With identity 1, only the exact duplicates are collapsed
+    representatives, duplicates_num = redundancy.find_representatives(
+        ['MKVLA' * 20, 'MKVLA' * 19 + 'MKVLW', 'MKVLA' * 20], 1.0)
+    assert representatives.tolist() == [0, 1, 0]
+    assert duplicates_num == 1
+
+
+# Only the representatives are kept (in their input order) for the search and the layout
+def test_collapse(collapsed_input):
+    assert redundancy.is_collapsed()
+    assert redundancy.representatives.tolist() == [0, 1, 0, 0, 1, 5]
+    assert cfg.run_params['total_sequences_num'] == 3
+    assert cfg.sequences_array.shape[0] == 3
+    assert cfg.titles_pool.get_list() == ['a1 first', 'b1', 'c1']
+
+
+# The members are expanded back with an HSP of E-value 0 with their representative (and not the HSPs of their
+# representative), and a "Redundant ..." group of each representative with its members, numbered after the existing
+# groups
+def test_expand(collapsed_input):
+    records = collapsed_input
+    cfg.groups_dict[1] = clans.get_group_dict('existing', '4', '255;0;0;255', 0, [5])
+    sp.set_edges(np.array([0]), np.array([1]), np.array([1e-10]), 'hsp')
+    redundancy.expand()
+
+    assert not redundancy.is_collapsed()
+    assert cfg.run_params['total_sequences_num'] == len(records)
+    assert cfg.titles_pool.get_list() == [title for title, sequence in records]
+    evalues = dict(zip(map(tuple, cfg.edges_indices.tolist()),
+                       sp.get_edges_values(0, cfg.edges_indices.shape[0], 'hsp').tolist()))
+    assert evalues == {(0, 1): 1e-10, (0, 2): 0.0, (0, 3): 0.0, (1, 4): 0.0}
+
+    # The largest group first
+    assert sorted(cfg.groups_dict.keys()) == [1, 2, 3]
+    assert [cfg.groups_dict[group_ID]['order'] for group_ID in [1, 2, 3]] == [0, 1, 2]
+    assert cfg.groups_dict[2]['name'] == 'Redundant a1'
+    assert sorted(cfg.groups_dict[2]['seqIDs']) == [0, 2, 3]
+    assert cfg.groups_dict[3]['name'] == 'Redundant b1'
+    assert sorted(cfg.groups_dict[3]['seqIDs']) == [1, 4]
+    assert cfg.sequences_array['in_group'].tolist() == [2, 3, 2, 2, 3, -1]
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import random
+import numpy as np
+import pytest
+import clans.config as cfg
+import clans.io.file_handler as fh
+import clans.similarity_search.blast as blast
+
+# The search engines are run through a stub executable (installed as makeblastdb, blastp, diamond and mmseqs), which
+# logs its command line and writes canned tabular (m8) output: every query gets a hit with every subject of the
+# searched databases, with the E-value base(query, subject) * n, where n is the given database size (-dbsize /
+# --dbsize) or the number of residues of the searched databases. So whichever way the search is run (chunks,
+# partitions, prefilter databases), the E-value of each pair must end up as base(pair) * the residues of all the
+# sequences.
+
+stub_script = '''
+import os
+import sys
+import json
+
+program = os.path.basename(sys.argv[0])
+arguments = sys.argv[1:]
+with open(os.environ['STUB_LOG'], 'a') as log:
+    log.write(json.dumps([program] + arguments) + '\\n')
+
+
+def get_option(name):
+    return arguments[arguments.index(name) + 1] if name in arguments else None
+
+
+def read_fasta(fasta_path):
+    records = []
+    for line in open(fasta_path):
+        if line.startswith('>'):
+            records.append([line[1:].split()[0], 0])
+        else:
+            records[-1][1] += len(line.strip())
+    return records
+
+
+def write_hits(query, db_paths, out_path, dbsize):
+    subjects = [record for db_path in db_paths for record in read_fasta(db_path)]
+    db_len = int(dbsize) if dbsize is not None else sum(length for name, length in subjects)
+    with open(out_path, 'w') as output:
+        for query_name, query_len in read_fasta(query):
+            for subject_name, subject_len in subjects:
+                base = 1e-12 * (1 + (int(query_name) + int(subject_name)) % 7)
+                output.write('%s\\t%s\\t%g\\n' % (query_name, subject_name, base * db_len))
+
+
+# The databases are named after their FASTA files (or contain the path of the FASTA file)
+if program == 'makeblastdb':
+    pass
+elif program == 'diamond' and arguments[0] == 'makedb':
+    with open(get_option('--db') + '.dmnd', 'w') as db:
+        db.write(get_option('--in'))
+elif program == 'mmseqs' and arguments[0] == 'createdb':
+    with open(arguments[2], 'w') as db:
+        db.write(arguments[1])
+elif program == 'blastp':
+    write_hits(get_option('-query'), get_option('-db').split(' '), get_option('-out'), get_option('-dbsize'))
+elif program == 'diamond':
+    write_hits(get_option('--query'), [open(get_option('--db')).read()], get_option('--out'), get_option('--dbsize'))
+elif program == 'mmseqs':
+    write_hits(arguments[1], [open(arguments[2]).read()], arguments[3], None)
+'''
+
+sequences_num = 24
+
+
+def get_base_evalue(index1, index2):
+    return 1e-12 * (1 + (index1 + index2) % 7)
+
+
+# Families of similar sequences (so the prefilter finds candidates)
+def write_fasta(fasta_path):
+    rng = random.Random(1)
+    amino_acids = 'ACDEFGHIKLMNPQRSTVWY'
+    sequences = []
+    for family in range(sequences_num // 4):
+        ancestor = [rng.choice(amino_acids) for i in range(rng.randint(60, 120))]
+        for member in range(4):
+            sequences.append(''.join(rng.choice(amino_acids) if rng.random() < 0.05 else residue
+                                     for residue in ancestor))
+    with open(fasta_path, 'w') as output:
+        for index, sequence in enumerate(sequences):
+            output.write('>seq' + str(index) + '\n' + sequence + '\n')
+    return sequences
+
+
+@pytest.fixture
+def search_run(tmp_path, monkeypatch):
+    bin_path = tmp_path / 'bin'
+    bin_path.mkdir()
+    stub_path = bin_path / 'stub.py'
+    stub_path.write_text('#!' + sys.executable + '\n' + stub_script)
+    stub_path.chmod(0o755)
+    for program in ['makeblastdb', 'blastp', 'diamond', 'mmseqs']:
+        os.symlink(stub_path, bin_path / program)
+    monkeypatch.setenv('PATH', str(bin_path) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('STUB_LOG', str(tmp_path / 'stub.log'))
+
+    fasta_path = str(tmp_path / 'input.fasta')
+    sequences = write_fasta(fasta_path)
+    monkeypatch.setattr(cfg, 'run_params', dict(cfg.run_params))
+    cfg.run_params.update({'working_dir': str(tmp_path), 'input_file': fasta_path, 'evalue_cutoff': 1.0,
+                           'scoring_matrix': 'BLOSUM62', 'similarity_cutoff': 1e-4, 'blast_cores': 1,
+                           'blast_job_threads': 1})
+    fh.read_input_file(fasta_path, 'fasta')
+    assert not cfg.run_params['is_problem']
+
+    # Run the search with the given parameters. Returns the logged command lines and the pairs with their E-values.
+    def run(**params):
+        cfg.run_params.update(params)
+        blast.find_HSPs()
+        assert not cfg.run_params['is_problem'], cfg.run_params['error']
+        with open(tmp_path / 'stub.log') as log:
+            commands = [json.loads(line) for line in log]
+        evalues = 10 ** -cfg.edges_minus_log_evalues.astype(np.float64)
+        return commands, cfg.edges_indices[:, 0].astype(np.int64), cfg.edges_indices[:, 1].astype(np.int64), evalues
+
+    run.residues_num = sum(len(sequence) for sequence in sequences)
+    run.tmp_path = tmp_path
+    return run
+
+
+def get_searches(commands):
+    return [command for command in commands if command[0] in ['blastp', 'diamond', 'mmseqs'] and
+            command[1] not in ['makedb', 'createdb']]
+
+
+# Every pair (index1 < index2) is found once, with the E-value of a search of the whole database
+def check_all_pairs(run, index1, index2, evalues):
+    assert index1.shape[0] == sequences_num * (sequences_num - 1) // 2
+    assert np.unique(index1 * sequences_num + index2).shape[0] == index1.shape[0]
+    check_evalues(run, index1, index2, evalues)
+
+
+def check_evalues(run, index1, index2, evalues):
+    assert np.allclose(evalues, get_base_evalue(index1, index2) * run.residues_num, rtol=1e-4, atol=0)
+
+
+@pytest.mark.parametrize('engine', ['blast', 'diamond', 'mmseqs'])
+def test_command_lines(search_run, engine):
+    commands, index1, index2, evalues = search_run(search_engine=engine)
+    indexed_path = str(search_run.tmp_path / 'blast_output' / 'input_indexed.fasta')
+    searches = get_searches(commands)
+    assert len(searches) == blast.chunks_per_job
+    search = searches[0]
+
+    if engine == 'blast':
+        assert commands[0] == ['makeblastdb', '-dbtype', 'prot', '-in', indexed_path]
+        assert search[search.index('-outfmt') + 1] == '6 qacc sacc evalue'
+        assert search[search.index('-db') + 1] == indexed_path
+        assert search[search.index('-matrix') + 1] == 'BLOSUM62'
+        assert search[search.index('-gapopen') + 1:search.index('-gapopen') + 4] == ['11', '-gapextend', '1']
+        assert search[search.index('-max_target_seqs') + 1] == str(sequences_num)
+        assert '-dbsize' not in search
+    elif engine == 'diamond':
+        assert commands[0] == ['diamond', 'makedb', '--in', indexed_path, '--db', indexed_path]
+        assert search[search.index('--outfmt') + 1:search.index('--outfmt') + 5] == ['6', 'qseqid', 'sseqid',
+                                                                                     'evalue']
+        assert search[search.index('--db') + 1] == indexed_path + '.dmnd'
+        assert search[search.index('--matrix') + 1] == 'BLOSUM62'
+        assert '--dbsize' not in search
+    else:
+        assert commands[0] == ['mmseqs', 'createdb', indexed_path, indexed_path + '.mmseqs']
+        assert search[1:3] == ['easy-search', str(search_run.tmp_path / 'blast_output' / 'input_chunks' /
+                                                  'chunk_0.fasta')]
+        assert search[3] == indexed_path + '.mmseqs'
+        assert search[search.index('--format-output') + 1] == 'query,target,evalue'
+        assert search[search.index('--sub-mat') + 1] == 'blosum62.out'
+
+    check_all_pairs(search_run, index1, index2, evalues)
+
+
+# With several processes, the queries are split into chunks which are searched against the whole database
+@pytest.mark.parametrize('engine', ['blast', 'diamond', 'mmseqs'])
+def test_chunks(search_run, engine):
+    commands, index1, index2, evalues = search_run(search_engine=engine, blast_cores=2)
+    searches = get_searches(commands)
+    assert len(searches) == 2 * blast.chunks_per_job
+    chunks_path = search_run.tmp_path / 'blast_output' / 'input_chunks'
+    queries = sorted(int(line[1:]) for chunk in range(len(searches))
+                     for line in open(chunks_path / ('chunk_' + str(chunk) + '.fasta')) if line.startswith('>'))
+    assert queries == list(range(sequences_num))
+    check_all_pairs(search_run, index1, index2, evalues)
+
+
+# Each chunk is searched against the partitions from its own one, with the E-values for the whole database
+def test_triangular(search_run):
+    commands, index1, index2, evalues = search_run(search_engine='blast', blast_cores=2, blast_triangular=True)
+    chunks_path = str(search_run.tmp_path / 'blast_output' / 'input_chunks') + '/'
+    partitions = [chunks_path + 'chunk_' + str(chunk) + '.fasta' for chunk in range(2 * blast.chunks_per_job)]
+    assert [command[-1] for command in commands if command[0] == 'makeblastdb'][1:] == partitions
+
+    for search in get_searches(commands):
+        chunk = partitions.index(search[search.index('-query') + 1])
+        assert search[search.index('-db') + 1] == ' '.join(partitions[chunk:])
+        assert search[search.index('-dbsize') + 1] == str(search_run.residues_num)
+    check_all_pairs(search_run, index1, index2, evalues)
+
+
+# The engines which cannot search partitions search the whole database
+@pytest.mark.parametrize('engine', ['diamond', 'mmseqs'])
+def test_triangular_fallback(search_run, engine):
+    commands, index1, index2, evalues = search_run(search_engine=engine, blast_cores=2, blast_triangular=True)
+    assert len([command for command in commands if command[1] in ['makedb', 'createdb']]) == 1
+    assert len(get_searches(commands)) == 2 * blast.chunks_per_job
+    check_all_pairs(search_run, index1, index2, evalues)
+
+
+# With the prefilter, the chunks are searched against databases of their candidates: the E-values are calculated for
+# the whole database (-dbsize / --dbsize) or scaled to it (mmseqs)
+@pytest.mark.parametrize('engine', ['blast', 'diamond', 'mmseqs'])
+def test_prefilter_dbsize(search_run, engine):
+    commands, index1, index2, evalues = search_run(search_engine=engine, blast_cores=2, prefilter=True)
+    searches = get_searches(commands)
+    assert len(searches) > 1
+    for search in searches:
+        if engine == 'blast':
+            assert search[search.index('-db') + 1].endswith('_db.fasta')
+            assert search[search.index('-dbsize') + 1] == str(search_run.residues_num)
+        elif engine == 'diamond':
+            assert search[search.index('--dbsize') + 1] == str(search_run.residues_num)
+        else:
+            assert '--dbsize' not in search
+
+    # The members of a family are candidates of each other
+    found = set(zip(index1.tolist(), index2.tolist()))
+    assert all((first + i, first + j) in found for first in range(0, sequences_num, 4)
+               for i in range(4) for j in range(i + 1, 4))
+    check_evalues(search_run, index1, index2, evalues)
@@ -0,0 +1,92 @@
+import math
+import numpy as np
+import pytest
+from Bio import Align
+from Bio.Align import substitution_matrices
+import clans.config as cfg
+import clans.similarity_search.engines.sw_engine as sw
+import clans.similarity_search.engines.search_engine as se
+
+# The built-in Smith-Waterman engine is checked against Biopython's local aligner (the same affine gap costs: a gap of
+# length k costs gap_open + k * gap_extend), and its E-values against the Karlin-Altschul formula.
+
+matrix_name = 'BLOSUM62'
+letters = 'ARNDCQEGHILKMFPSTWYV'
+
+
+# Random sequences, half of them copies of the others with substitutions and indels (so the alignments have gaps), of
+# more than lanes_num subjects of different lengths (so there are several batches, padded)
+def make_sequences(rng, sequences_num):
+    sequences = []
+    for index in range(sequences_num):
+        if index % 2 == 0:
+            sequences.append(''.join(rng.choice(list(letters), size=rng.integers(20, 120))))
+            continue
+        sequence = list(sequences[-1])
+        for position in sorted(rng.choice(len(sequence), size=len(sequence) // 4, replace=False), reverse=True):
+            change = rng.integers(3)
+            if change == 0:
+                sequence[position] = rng.choice(list(letters))
+            elif change == 1:
+                del sequence[position]
+            else:
+                sequence[position:position] = list(rng.choice(list(letters), size=rng.integers(1, 4)))
+        sequences.append(''.join(sequence))
+    return sequences
+
+
+def write_fasta(fasta_path, names, sequences):
+    with open(fasta_path, 'w') as output:
+        for name, sequence in zip(names, sequences):
+            output.write('>' + name + '\n' + sequence + '\n')
+
+
+# The scores of the batched kernel (align_batch, through compute_scores) are Biopython's, for all the pairs
+def test_scores_match_biopython(tmp_path):
+    matrix = substitution_matrices.load(matrix_name)
+    gap_open, gap_extend = se.get_gap_penalties(matrix_name)
+    sequences = make_sequences(np.random.default_rng(0), 80)
+    fasta_path = str(tmp_path / 'random.fasta')
+    write_fasta(fasta_path, [str(index) for index in range(len(sequences))], sequences)
+    names, residues, starts, ends = sw.read_sequences([fasta_path], matrix.alphabet)
+
+    matrix_scores = np.full((len(matrix.alphabet) + 1, len(matrix.alphabet) + 1), sw.padding_score, dtype=np.int32)
+    matrix_scores[:-1, :-1] = np.asarray(matrix, dtype=np.int32)
+    profiles = matrix_scores[residues]
+    batches, batch_starts, order = sw.make_batches(residues, starts, ends, len(matrix.alphabet))
+    assert batch_starts.shape[0] - 1 > 1
+
+    queries_num = 6
+    batches_scores = np.empty((queries_num, (batch_starts.shape[0] - 1) * sw.lanes_num), dtype=np.int32)
+    sw.compute_scores(profiles, starts, ends, 0, batches, batch_starts, np.int32(gap_open), np.int32(gap_extend),
+                      batches_scores)
+    scores = np.empty((queries_num, len(sequences)), dtype=np.int32)
+    scores[:, order] = batches_scores[:, :len(sequences)]
+
+    aligner = Align.PairwiseAligner(mode='local', substitution_matrix=matrix, open_gap_score=-(gap_open + gap_extend),
+                                    extend_gap_score=-gap_extend)
+    for query in range(queries_num):
+        for subject in range(len(sequences)):
+            assert scores[query, subject] == aligner.score(sequences[query], sequences[subject]), (query, subject)
+
+
+# The E-value of a known pair: WWWWWW against itself scores 6 * 11 (W/W in BLOSUM62), so E = K * m * n *
+# exp(-lambda * S) with m = 6 and n the given database size or the length of the database
+@pytest.mark.parametrize('dbsize', [None, 1000000])
+def test_karlin_altschul_evalue(tmp_path, monkeypatch, dbsize):
+    monkeypatch.setattr(cfg, 'run_params', dict(cfg.run_params))
+    cfg.run_params.update({'scoring_matrix': matrix_name, 'evalue_cutoff': 0.1})
+    query_path = str(tmp_path / 'query.fasta')
+    db_path = str(tmp_path / 'db.fasta')
+    out_path = str(tmp_path / 'hits.m8')
+    write_fasta(query_path, ['query'], ['WWWWWW'])
+    write_fasta(db_path, ['subject', 'other'], ['AWWWWWWA', 'PPPPPPPP'])
+
+    sw.SmithWatermanEngine().search(query_path, [db_path], out_path, 1, dbsize)
+    with open(out_path) as hits:
+        lines = [line.split('\t') for line in hits.read().splitlines()]
+    assert [line[:2] for line in lines] == [['query', 'subject']]
+
+    lambda_value, k_value = sw.karlin_altschul_params[matrix_name]
+    expected_evalue = k_value * 6 * (16 if dbsize is None else dbsize) * math.exp(-lambda_value * 66)
+    assert float(lines[0][2]) == pytest.approx(expected_evalue, rel=1e-2)